@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+"""
+Benchmark of the kernels computing run-length statistics and chi2 from normalized residuals
+============================================================================================
+
+Times rld.get_residual_statistics() with the numba and the NumPy kernel for batches of standard normal residuals, as
+in the Monte Carlo estimates of the statistical power, and prints the best time of several repeats per kernel.
+"""
+
+import time
+import argparse as argp
+import numpy as np
+from hplusminus import rld
+
+parser = argp.ArgumentParser(description=__doc__, formatter_class=argp.RawDescriptionHelpFormatter)
+parser.add_argument("-N", type=int, nargs="+", default=[100, 1000, 10000, 100000], help="Numbers of data points.")
+parser.add_argument("--total", type=int, default=2**22, help="Total number of residuals per batch.")
+parser.add_argument("--repeat", type=int, default=5, help="Number of repeats.")
+args = parser.parse_args()
+
+kernels = rld.KERNELS if rld.HAVE_NUMBA else ("numpy",)
+rng = np.random.default_rng(0)
+# Compile the numba kernel before timing
+rld.get_residual_statistics(rng.standard_normal((2, 10)), kernel=kernels[0])
+
+print("%10s %10s" % ("N", "models") + "".join(" %14s" % ("%s [ms]" % kernel) for kernel in kernels))
+for number_data_points in args.N:
+    normalized_residuals = rng.standard_normal((max(1, args.total // number_data_points), number_data_points))
+    timings = []
+    for kernel in kernels:
+        best = np.inf
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            rld.get_residual_statistics(normalized_residuals, kernel=kernel)
+            best = min(best, time.perf_counter() - t0)
+        timings.append(best)
+    print("%10d %10d" % (number_data_points, normalized_residuals.shape[0]) +
+          "".join(" %14.2f" % (1e3 * t) for t in timings))
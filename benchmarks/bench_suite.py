@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+"""
+Benchmark suite of the hot paths across data sizes
+==================================================
+
+Times the computation of run-length distributions, the Shannon information of the h and hpm test statistics and of the
+number of positive signs (mpmath evaluation), the initialization of the spline functions, p-values, and the evaluation
+of all tests for standard normal residuals of increasing size. For every benchmark and size, the best wall time of
+several repeats and the peak memory allocated during a separate call (measured with tracemalloc, which also traces
+NumPy arrays) are reported.
+
+Results can be saved to a JSON file (--save) together with the versions of Python, NumPy, SciPy, and numba, and
+compared to the results saved for an earlier version (--compare). Benchmarks slower by more than the threshold are
+reported as regressions, and the exit status is then 1.
+
+Examples
+--------
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json --save new.json
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from collections import OrderedDict
+import argparse as argp
+import numpy as np
+import scipy
+from hplusminus import evaluate, rld, sid
+
+
+def _setup_run_length_distributions(normalized_residuals):
+    signs = np.sign(normalized_residuals)
+    return lambda: rld.get_run_length_distributions(signs, sparse=True)
+
+
+def _setup_SI_h(normalized_residuals):
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.sign(normalized_residuals), sparse=True)
+    return lambda: rld.SI_h(normalized_residuals.shape[0], histo['all'])
+
+
+def _setup_SI_hpm(normalized_residuals):
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.sign(normalized_residuals), sparse=True)
+    return lambda: rld.SI_hpm(normalized_residuals.shape[0], num[1], histo['plus'], histo['minus'])
+
+
+def _setup_SI_number_of_positive_signs(normalized_residuals):
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.sign(normalized_residuals), sparse=True)
+
+    def run():
+        # The mpmath evaluation is memoized
+        rld._log_norm_positive_signs_mpmath.cache_clear()
+        return rld.SI_number_of_positive_signs(normalized_residuals.shape[0], num[1], num[0], num[2], method="mpmath")
+    return run
+
+
+def _setup_init(normalized_residuals):
+    return lambda: sid.init()
+
+
+def _setup_get_p_value(normalized_residuals):
+    spline_func = sid.init()
+    SI = evaluate.all_statistical_tests(normalized_residuals, spline_func)['hpm']['I']
+    return lambda: sid.get_p_value(SI, normalized_residuals.shape[0], "hpm", spline_func)
+
+
+def _setup_all_statistical_tests(normalized_residuals):
+    spline_func = sid.get_spline_cache()
+    return lambda: evaluate.all_statistical_tests(normalized_residuals, spline_func)
+
+
+# Benchmarks by name: function preparing the inputs for given residuals and returning the timed function, and whether
+# the timed function depends on the number of data points
+BENCHMARKS = OrderedDict([
+    ("rld.get_run_length_distributions", (_setup_run_length_distributions, True)),
+    ("rld.SI_h", (_setup_SI_h, True)),
+    ("rld.SI_hpm", (_setup_SI_hpm, True)),
+    ("rld.SI_number_of_positive_signs[mpmath]", (_setup_SI_number_of_positive_signs, True)),
+    ("sid.init", (_setup_init, False)),
+    ("sid.get_p_value", (_setup_get_p_value, True)),
+    ("evaluate.all_statistical_tests", (_setup_all_statistical_tests, True)),
+])
+
+
+def time_function(func, repeat, min_time):
+    """
+    Best wall time of a call of func over repeat rounds. Fast functions are called several times per round, such that
+    each round lasts at least min_time. A first call that already lasts min_time counts as a round.
+    """
+    timer = timeit.Timer(func)
+    elapsed = timer.timeit(1)
+    if elapsed >= min_time:
+        return min([elapsed] + timer.repeat(repeat - 1, 1))
+    number = int(np.ceil(min_time / max(elapsed, 1e-6)))
+    return min(timer.repeat(repeat, number)) / number
+
+
+def peak_memory(func):
+    """
+    Peak memory in bytes allocated during a call of func, as traced by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def metadata(label):
+    """
+    Versions and platform identifying a set of results.
+    """
+    if label is None:
+        try:
+            label = subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+                                            universal_newlines=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            label = "unknown"
+    return OrderedDict([
+        ("label", label),
+        ("date", time.strftime("%Y-%m-%dT%H:%M:%S")),
+        ("python", platform.python_version()),
+        ("numpy", np.__version__),
+        ("scipy", scipy.__version__),
+        ("numba", rld.HAVE_NUMBA),
+        ("kernel", rld.get_kernel()),
+        ("machine", platform.machine()),
+        ("processor", platform.processor()),
+    ])
+
+
+def run_benchmarks(Ns, names, repeat, min_time, seed=0):
+    """
+    Runs the benchmarks and prints one line per benchmark and size. Returns the results as a list of dicts.
+    """
+    rng = np.random.default_rng(seed)
+    # Warm up, e.g., compile the numba kernels and fill the spline cache, before timing
+    for name in names:
+        BENCHMARKS[name][0](rng.standard_normal(100))()
+    results = []
+    print("%-42s %12s %14s %14s" % ("benchmark", "N", "time [ms]", "peak [MiB]"))
+    for number_data_points in Ns:
+        normalized_residuals = rng.standard_normal(number_data_points)
+        for name in names:
+            setup, size_dependent = BENCHMARKS[name]
+            if not size_dependent and number_data_points != Ns[0]:
+                continue
+            func = setup(normalized_residuals)
+            best = time_function(func, repeat, min_time)
+            peak = peak_memory(func)
+            results.append(OrderedDict([("name", name), ("N", int(number_data_points) if size_dependent else None),
+                                        ("time", best), ("peak_memory", peak)]))
+            print("%-42s %12s %14.3f %14.3f" % (name, number_data_points if size_dependent else "-", 1e3 * best,
+                                                peak / 2.**20))
+            sys.stdout.flush()
+        del normalized_residuals
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the ratios of the times and peak memory to those of the baseline results. Returns the number of benchmarks
+    slower than the baseline by more than threshold.
+    """
+    reference = {(r["name"], r["N"]): r for r in baseline["results"]}
+    print()
+    print("Comparison to \"%s\" (%s)" % (baseline["metadata"]["label"], baseline["metadata"]["date"]))
+    print("%-42s %12s %14s %14s" % ("benchmark", "N", "time ratio", "peak ratio"))
+    n_regressions = 0
+    for r in results:
+        ref = reference.get((r["name"], r["N"]))
+        if ref is None:
+            continue
+        time_ratio = r["time"] / ref["time"]
+        peak_ratio = r["peak_memory"] / ref["peak_memory"] if ref["peak_memory"] > 0 else np.nan
+        regression = time_ratio > threshold
+        n_regressions += regression
+        print("%-42s %12s %14.2f %14.2f%s" % (r["name"], r["N"] if r["N"] is not None else "-", time_ratio,
+                                              peak_ratio, "  REGRESSION" if regression else ""))
+    return n_regressions
+
+
+def main():
+    parser = argp.ArgumentParser(description=__doc__, formatter_class=argp.RawDescriptionHelpFormatter)
+    parser.add_argument("-N", type=float, nargs="+", default=[1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8],
+                        help="Numbers of data points.")
+    parser.add_argument("-b", "--benchmarks", type=str, nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS),
+                        metavar="NAME", help="Names of benchmarks, default all: %s." % ", ".join(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repeats, the best time is reported.")
+    parser.add_argument("--min-time", type=float, default=0.1,
+                        help="Minimum time in seconds per repeat, short benchmarks are called several times.")
+    parser.add_argument("--kernel", type=str, default=None, choices=rld.KERNELS, help="Kernel of rld, see rld.set_kernel().")
+    parser.add_argument("--label", type=str, default=None, help="Label of the results, default from git describe.")
+    parser.add_argument("--save", type=str, default=None, help="Save results to JSON file.")
+    parser.add_argument("--compare", type=str, default=None, help="Compare to results saved in JSON file.")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Time ratio to the compared results above which a benchmark counts as regression.")
+    args = parser.parse_args()
+
+    if args.kernel is not None:
+        rld.set_kernel(args.kernel)
+    Ns = sorted(int(N) for N in args.N)
+    info = metadata(args.label)
+    print(" ".join("%s=%s" % (k, v) for k, v in info.items()))
+    results = run_benchmarks(Ns, args.benchmarks, args.repeat, args.min_time)
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(OrderedDict([("metadata", info), ("results", results)]), fp, indent=1)
+        print()
+        print("Saved results to \"%s\"." % args.save)
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if compare(results, baseline, args.threshold) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
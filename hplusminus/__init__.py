@@ -1,4 +1,23 @@
 __all__ = ['rld', 'sid']
 
-from .rld import *
-from .sid import *
+import importlib
+
+# Submodules are imported on first attribute access (PEP 562), so that importing the package stays fast
+_submodules = ('cache', 'calibrate', 'evaluate', 'exact', 'io', 'lookup', 'power', 'profiling', 'rld', 'sid')
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+    # Public names of rld and sid remain available from the package namespace, resolved from sid first as with the
+    # former star imports
+    if not name.startswith("_"):
+        for module_name in ('sid', 'rld'):
+            module = importlib.import_module("." + module_name, __name__)
+            if hasattr(module, name):
+                return getattr(module, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules))
@@ -0,0 +1,208 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from contextlib import closing
+import numpy as np
+from . import sid
+
+
+# Version of the cached result format. Changing it invalidates all cached results.
+CACHE_FORMAT_VERSION = 1
+# Name of the SQLite database within the cache directory
+CACHE_FILE_NAME = "results.sqlite"
+# Default maximum total size in bytes of the cached results
+MAX_CACHE_SIZE = 2**26
+# Number of bytes read at once when hashing files
+HASH_CHUNK_SIZE = 2**20
+
+
+def spline_version(spline_func=None):
+    """
+    Returns a hash of the spline functions representing the gamma distribution parameters, which identifies the
+    version of the spline parameters used to calculate p-values.
+
+    Parameters
+    ----------
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 hash of the knots and coefficients of all splines.
+    """
+    if spline_func is None:
+        spline_func = sid.get_spline_cache()
+    h = hashlib.sha256()
+    for k in sorted(spline_func):
+        for na in sorted(spline_func[k]):
+            h.update(("%s/%s" % (k, na)).encode("utf-8"))
+            h.update(np.ascontiguousarray(spline_func[k][na].t, dtype=np.float64).tobytes())
+            h.update(np.ascontiguousarray(spline_func[k][na].c, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _new_key_hash(spline_func, options):
+    """
+    Returns a SHA-256 hash object initialized with the cache format version, the spline parameter version, and the
+    evaluation options.
+    """
+    h = hashlib.sha256()
+    h.update(("hplusminus-result-%d" % CACHE_FORMAT_VERSION).encode("utf-8"))
+    h.update(spline_version(spline_func).encode("utf-8"))
+    h.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return h
+
+
+def array_key(normalized_residuals, spline_func=None, **options):
+    """
+    Cache key of the results for an array of normalized residuals.
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        1d array containing the normalized residuals.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    options: dict
+        Further options of the evaluation that change the results, e.g., zeros and seed.
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 hash of the residuals, the spline parameter version, and the options.
+    """
+    normalized_residuals = np.ascontiguousarray(normalized_residuals, dtype=np.float64)
+    h = _new_key_hash(spline_func, dict(options, source="array", shape=list(normalized_residuals.shape)))
+    h.update(normalized_residuals.tobytes())
+    return h.hexdigest()
+
+
+def file_key(file_name, column=1, spline_func=None, **options):
+    """
+    Cache key of the results for a file of normalized residuals, computed from the bytes of the file without parsing
+    it.
+
+    Parameters
+    ----------
+    file_name: str
+        Name of file containing normalized residuals.
+    column: int
+        Number of the column from which normalized residuals are read.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    options: dict
+        Further options of the evaluation that change the results, e.g., zeros and seed.
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 hash of the file content, the column, the spline parameter version, and the options.
+    """
+    h = _new_key_hash(spline_func, dict(options, source="file", column=column,
+                                        ending=os.path.splitext(file_name)[1].lower()))
+    with open(file_name, "rb") as fp:
+        for block in iter(lambda: fp.read(HASH_CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent cache of test results in an SQLite database, keyed by hashes of the normalized residuals (see
+    array_key() and file_key()). When the total size of the cached results exceeds max_size, the least recently used
+    results are evicted. The cache can be shared by several processes.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache. Created if it does not exist.
+    max_size: int, optional
+        Maximum total size in bytes of the cached results.
+    """
+
+    def __init__(self, cache_dir, max_size=MAX_CACHE_SIZE):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.file_name = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.max_size = max_size
+        with closing(self._connect()) as con, con:
+            con.execute("CREATE TABLE IF NOT EXISTS results "
+                        "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access INTEGER NOT NULL)")
+            con.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+
+    def _connect(self):
+        return sqlite3.connect(self.file_name, timeout=60.)
+
+    def get(self, key):
+        """
+        Returns the cached results for key, or None if not cached, and marks them as recently used.
+
+        Parameters
+        ----------
+        key: str
+            Cache key.
+        Returns
+        -------
+        res: dict
+            The Shannon information values and p-values for all test statistics, see evaluate.all_statistical_tests().
+        """
+        with closing(self._connect()) as con, con:
+            row = con.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            con.execute("UPDATE results SET last_access = (SELECT MAX(last_access) + 1 FROM results) WHERE key = ?",
+                        (key,))
+        return json.loads(row[0], object_pairs_hook=OrderedDict)
+
+    def put(self, key, res):
+        """
+        Stores results for key and evicts the least recently used results if the cache exceeds its maximum size.
+
+        Parameters
+        ----------
+        key: str
+            Cache key.
+        res: dict
+            The Shannon information values and p-values for all test statistics, see evaluate.all_statistical_tests().
+        """
+        value = json.dumps({test: {k: (float(v) if k != "label" else v) for k, v in res[test].items()} for test in res})
+        with closing(self._connect()) as con, con:
+            con.execute("INSERT OR REPLACE INTO results (key, value, size, last_access) "
+                        "VALUES (?, ?, ?, (SELECT COALESCE(MAX(last_access), 0) + 1 FROM results))",
+                        (key, value, len(value)))
+            total = con.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_size:
+                evicted = []
+                for row_key, size in con.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+                    if total <= self.max_size:
+                        break
+                    evicted.append((row_key,))
+                    total -= size
+                con.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def clear(self):
+        """
+        Removes all cached results.
+        """
+        with closing(self._connect()) as con, con:
+            con.execute("DELETE FROM results")
+
+    def size(self):
+        """
+        Returns
+        -------
+        int
+            Total size in bytes of the cached results.
+        """
+        with closing(self._connect()) as con:
+            return con.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def __len__(self):
+        with closing(self._connect()) as con:
+            return con.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __contains__(self, key):
+        with closing(self._connect()) as con:
+            return con.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
@@ -0,0 +1,288 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.interpolate
+from scipy.stats import gamma as gamma_dist
+from . import rld
+from . import sid
+
+
+# Names of the spline parameter sets and the tests whose Shannon information they describe (inverse of
+# sid.spline_test_names)
+calibration_tests = {sid.spline_test_names[test]: test for test in sid.spline_test_names}
+# Default number of simulated residuals per chunk, i.e., 32 MiB of residuals per worker
+CHUNK_RESIDUALS = 2**22
+
+
+def default_chunk_size(number_data_points):
+    """
+    Returns the default number of samples per chunk for a given data size, such that a chunk contains about
+    CHUNK_RESIDUALS residuals.
+    """
+    return max(1, CHUNK_RESIDUALS // max(int(number_data_points), 1))
+
+
+def simulate_null_SI(number_data_points, n_sample, seed_sequence):
+    """
+    Simulates normalized residuals of the true model (standard normal noise) and calculates the Shannon information
+    of all tests.
+
+    Parameters
+    ----------
+    number_data_points: int
+        Number of data points.
+    n_sample: int
+        Number of samples.
+    seed_sequence: numpy.random.SeedSequence
+        Seed of the random number stream.
+    Returns
+    -------
+    SI: dict
+        Shannon information of all n_sample samples for each spline parameter set ('h', 'both', 'h_simple',
+        'both_simple').
+    """
+    rng = np.random.default_rng(seed_sequence)
+    normalized_residuals = rng.standard_normal((n_sample, number_data_points))
+    stats = rld.get_residual_statistics(normalized_residuals)
+    SI_chi2 = rld.SI_chi2(stats['chi_square'], number_data_points)
+    SI = {}
+    SI['h_simple'] = rld.SI_h_from_statistics(stats['N'], stats['nc'], stats['lfh_all'])
+    SI['h'] = rld.SI_hpm_from_statistics(stats['N'], stats['nc'], stats['ncPlus'], stats['nPlus'],
+                                         stats['lfh_plus'], stats['lfh_minus'])
+    SI['both_simple'] = SI['h_simple'] + SI_chi2
+    SI['both'] = SI['h'] + SI_chi2
+    return SI
+
+
+def _chunk_file_name(work_dir, number_data_points, chunk_size, chunk):
+    return os.path.join(work_dir, "SI_N%d_size%d_chunk%06d.npz" % (number_data_points, chunk_size, chunk))
+
+
+def _simulate_chunk(work_dir, number_data_points, chunk, chunk_size, seed):
+    """
+    Simulates one chunk of samples and saves it to the work directory, unless the chunk exists already. The random
+    number stream of a chunk only depends on seed, number_data_points, chunk_size, and chunk, so that interrupted runs
+    can be resumed with identical results.
+    """
+    file_name = _chunk_file_name(work_dir, number_data_points, chunk_size, chunk)
+    if os.path.exists(file_name):
+        return file_name
+    seed_sequence = np.random.SeedSequence(seed, spawn_key=(int(number_data_points), int(chunk_size), int(chunk)))
+    SI = simulate_null_SI(number_data_points, chunk_size, seed_sequence)
+    tmp_file_name = file_name[:-4] + ".tmp.npz"
+    np.savez(tmp_file_name, **SI)
+    os.replace(tmp_file_name, file_name)
+    return file_name
+
+
+def simulate(work_dir, Ns, n_sample, chunk_size=None, seed=0, n_jobs=1):
+    """
+    Simulates the Shannon information of all tests under the null hypothesis for several data sizes in chunks and
+    saves the chunks to the work directory. Chunks already present are skipped, so that an interrupted simulation can
+    be resumed or extended to more samples. Chunks are named by the data size and the chunk size, so that runs with
+    different chunk sizes are kept apart.
+
+    Parameters
+    ----------
+    work_dir: str
+        Directory for the simulated chunks. Created if it does not exist.
+    Ns: list of int
+        Numbers of data points.
+    n_sample: int
+        Number of samples per data size, rounded up to full chunks.
+    chunk_size: int (optional)
+        Number of samples per chunk. Default keeps chunks at about CHUNK_RESIDUALS residuals, see default_chunk_size().
+    seed: int, optional
+        Seed of the random number streams.
+    n_jobs: int, optional
+        Number of worker processes.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    tasks = []
+    for N in Ns:
+        size = default_chunk_size(N) if chunk_size is None else chunk_size
+        tasks += [(N, size, chunk) for chunk in range(-(-n_sample // size))
+                  if not os.path.exists(_chunk_file_name(work_dir, N, size, chunk))]
+    args = ([work_dir] * len(tasks), [task[0] for task in tasks], [task[2] for task in tasks],
+            [task[1] for task in tasks], [seed] * len(tasks))
+    if n_jobs == 1:
+        list(map(_simulate_chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(_simulate_chunk, *args))
+
+
+def load_SI(work_dir, number_data_points, chunk_size=None):
+    """
+    Loads all simulated chunks for a given data size and chunk size from the work directory.
+
+    Parameters
+    ----------
+    work_dir: str
+        Directory containing the simulated chunks.
+    number_data_points: int
+        Number of data points.
+    chunk_size: int (optional)
+        Number of samples per chunk, as passed to simulate(). Default is default_chunk_size().
+    Returns
+    -------
+    SI: dict
+        Shannon information of all samples for each spline parameter set.
+    """
+    if chunk_size is None:
+        chunk_size = default_chunk_size(number_data_points)
+    SI = {k: [] for k in calibration_tests}
+    chunk = 0
+    while os.path.exists(_chunk_file_name(work_dir, number_data_points, chunk_size, chunk)):
+        with np.load(_chunk_file_name(work_dir, number_data_points, chunk_size, chunk)) as data:
+            for k in SI:
+                SI[k].append(data[k])
+        chunk += 1
+    if chunk == 0:
+        raise RuntimeError("No simulated chunks for N=%d and chunk size %d found in \"%s\""
+                           % (number_data_points, chunk_size, work_dir))
+    return {k: np.concatenate(SI[k]) for k in SI}
+
+
+def fit_gamma_parameters(SI):
+    """
+    Maximum likelihood fit of a shifted gamma distribution to Shannon information values.
+
+    Parameters
+    ----------
+    SI: array
+        Shannon information values.
+    Returns
+    -------
+    alpha: float
+        Shape parameter of the gamma disribution.
+    beta: float
+        Inverser scale parameter of the gamma disribution.
+    I0: float
+        Shift (location) parameter of the gamma distribution.
+    """
+    alpha, I0, scale = gamma_dist.fit(SI)
+    return alpha, 1. / scale, I0
+
+
+def fit_spline(log_Ns, values, interior_knots=(), k=3):
+    """
+    Least-squares fit of a B-spline to a gamma distribution parameter as a function of :math:`\\log_{10} N`.
+
+    Parameters
+    ----------
+    log_Ns: array
+        Sorted values of :math:`\\log_{10} N`.
+    values: array
+        Values of the parameter.
+    interior_knots: list of float, optional
+        Interior knots in :math:`\\log_{10} N`. Default is none, i.e., a single cubic polynomial.
+    k: int, optional
+        Degree of the B-spline.
+    Returns
+    -------
+    knots: array
+        Knots of the B-spline.
+    coeffs: array
+        Coefficients of the B-spline.
+    """
+    knots = np.concatenate([[log_Ns[0]] * (k + 1), interior_knots, [log_Ns[-1]] * (k + 1)])
+    spline = scipy.interpolate.make_lsq_spline(log_Ns, values, knots, k=k)
+    return spline.t, spline.c
+
+
+def tail_accuracy(SI, alpha, beta, I0, p_levels=(1e-1, 1e-2, 1e-3)):
+    """
+    Compares the gamma distribution approximation to the empirical distribution of Shannon information values in the
+    tail.
+
+    Parameters
+    ----------
+    SI: array
+        Shannon information values.
+    alpha: float
+        Shape parameter of the gamma disribution.
+    beta: float
+        Inverser scale parameter of the gamma disribution.
+    I0: float
+        Shift (location) parameter of the gamma distribution.
+    p_levels: list of float, optional
+        Empirical p-values at which the approximation is checked. Should be well above 1/len(SI).
+    Returns
+    -------
+    ratio: array
+        Ratio of approximate to empirical p-value for each level.
+    """
+    p_levels = np.asarray(p_levels)
+    SI_levels = np.quantile(SI, 1. - p_levels)
+    p_empirical = np.array([(SI >= x).mean() for x in SI_levels])
+    return sid.cumulative_SID_gamma(SI_levels, alpha, beta, I0) / p_empirical
+
+
+def calibrate(work_dir, Ns, n_sample, opath=None, chunk_size=None, seed=0, n_jobs=1, interior_knots=None):
+    """
+    Regenerates the spline parameters of the gamma distribution approximation of the Shannon information
+    distributions. Simulates the null distribution for all data sizes (resumable, see simulate()), fits shifted gamma
+    distributions per data size, and fits B-splines in :math:`\\log_{10} N` to their parameters.
+
+    Parameters
+    ----------
+    work_dir: str
+        Directory for the simulated chunks.
+    Ns: list of int
+        Numbers of data points. At least four distinct values are required for cubic splines.
+    n_sample: int
+        Number of samples per data size.
+    opath: str (optional)
+        Output directory. If given, the spline parameters are written in the format read by
+        sid.load_spline_parameters(), including a packed file (see sid.pack_spline_parameters()).
+    chunk_size: int (optional)
+        Number of samples per chunk. Default keeps chunks at about CHUNK_RESIDUALS residuals, see default_chunk_size().
+    seed: int, optional
+        Seed of the random number streams.
+    n_jobs: int, optional
+        Number of worker processes.
+    interior_knots: dict (optional)
+        Interior knots of the B-splines, keyed by parameter set and parameter name, e.g.,
+        interior_knots['h']['alpha'] = [2.6, 3.4]. Default is none.
+    Returns
+    -------
+    spline_par: dict
+        Dictionary containing knots and coefficients of B-splines for all tests and parameters. Same format as the
+        output of sid.load_spline_parameters().
+    gamma_par: dict
+        Fitted parameters 'alpha', 'beta', 'I0' per data size for each parameter set, and 'N'.
+    """
+    Ns = np.sort(np.unique(Ns))
+    simulate(work_dir, Ns, n_sample, chunk_size, seed, n_jobs)
+
+    gamma_par = {k: {na: np.zeros(Ns.shape[0]) for na in ["alpha", "beta", "I0"]} for k in calibration_tests}
+    gamma_par['N'] = Ns
+    for i, N in enumerate(Ns):
+        SI = load_SI(work_dir, N, chunk_size)
+        for k in calibration_tests:
+            alpha, beta, I0 = fit_gamma_parameters(SI[k])
+            gamma_par[k]["alpha"][i] = alpha
+            gamma_par[k]["beta"][i] = beta
+            gamma_par[k]["I0"][i] = I0
+
+    log_Ns = np.log10(Ns)
+    spline_par = {}
+    for k in calibration_tests:
+        spline_par[k] = {}
+        for na in ["alpha", "beta", "I0"]:
+            knots = () if interior_knots is None else interior_knots.get(k, {}).get(na, ())
+            t, c = fit_spline(log_Ns, gamma_par[k][na], knots)
+            spline_par[k][na] = {"knots": t, "coeffs": c}
+
+    if opath is not None:
+        os.makedirs(opath, exist_ok=True)
+        for k in spline_par:
+            for na in spline_par[k]:
+                for tmp in ["knots", "coeffs"]:
+                    np.save(os.path.join(opath, "%s_%s_%s.npy" % (tmp, k, na)), spline_par[k][na][tmp])
+        sid.pack_spline_parameters(opath)
+    return spline_par, gamma_par
@@ -2,59 +2,692 @@
 # Released under the MIT Licence, see the file LICENSE.txt.
 
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-import scipy
+from . import cache as result_cache
+from . import io
+from . import profiling
 from . import rld
 from . import sid
 
 
-def all_statistical_tests(normalized_residuals):
+# Names of all tests and their labels used for output
+test_labels = OrderedDict([
+    ("chi2", "chi2"),
+    ("h", "h"),
+    ("hpm", "hpm"),
+    ("chi2_h", "(chi2,h)"),
+    ("chi2_hpm", "(chi^2,hpm)"),
+])
+# Shannon information components of each test, whose sums are the Shannon information of the combined tests
+test_components = OrderedDict([
+    ("chi2", ("chi2",)),
+    ("h", ("h",)),
+    ("hpm", ("hpm",)),
+    ("chi2_h", ("chi2", "h")),
+    ("chi2_hpm", ("chi2", "hpm")),
+])
+
+
+def plan_tests(tests=None):
+    """
+    Validates a selection of tests and determines the Shannon information components required to evaluate them.
+
+    Parameters
+    ----------
+    tests: str or list of str (optional)
+        Names of tests, see test_labels. Default selects all tests.
+    Returns
+    -------
+    tests: list of str
+        Names of the selected tests in the order of test_labels.
+    components: set of str
+        Required components, any of 'chi2', 'h', and 'hpm'.
+    """
+    if tests is None:
+        tests = list(test_labels)
+    elif isinstance(tests, str):
+        tests = [tests]
+    for test in tests:
+        if test not in test_labels:
+            raise ValueError("Test \"%s\" not available, use one of %s" % (test, ", ".join(test_labels)))
+    tests = [test for test in test_labels if test in tests]
+    if len(tests) == 0:
+        raise ValueError("No tests selected")
+    components = set(component for test in tests for component in test_components[test])
+    return tests, components
+
+
+@profiling.profiled
+def all_statistical_tests(normalized_residuals, spline_func=None, zeros=None, seed=0, cache=None, tests=None):
     """
-    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests.
+    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them. Only the
+    statistics required by the selected tests are calculated, e.g., neither chi2 for the h and hpm tests nor the
+    run-length histograms of positive and negative runs without the hpm and (chi2, hpm) tests.
 
     Parameters
     ----------
     normalized_residuals: array
         1d array containing the residuals divided by the standard error of the mean.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    zeros: str (optional)
+        Policy for exact zeros, see rld.get_segment_statistics(). If given, NaN values mark gaps and the statistics of
+        the segments are combined, see all_statistical_tests_segmented(). By default, the residuals are used as given.
+    seed: int, optional
+        Seed of the random signs of zeros for the "random" policy.
+    cache: cache.ResultCache (optional)
+        Persistent cache of results, keyed by the content of the residuals, the spline parameters, zeros, seed, and
+        tests.
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
 
     Returns
     -------
     res: dict
-        The Shannon information values and p-values for all test statistics.
+        The Shannon information values and p-values for the selected test statistics.
     """
-    # Parameters for gamma distribution used to calculate p-values
-    gamma_param = sid.init()
+    tests, components = plan_tests(tests)
+    if cache is not None:
+        key = result_cache.array_key(normalized_residuals, spline_func, zeros=zeros, seed=seed, tests=tests)
+        res = cache.get(key)
+        if res is not None:
+            return res
+    if zeros is not None:
+        res = all_statistical_tests_segmented(normalized_residuals, zeros, seed, spline_func, tests)[0]
+    else:
+        signs = np.sign(normalized_residuals) if "h" in components or "hpm" in components else None
+        chi_square = (normalized_residuals**2).sum() if "chi2" in components else None
+        res = all_statistical_tests_from_signs(signs, chi_square, spline_func, tests, len(normalized_residuals))
+    if cache is not None:
+        cache.put(key, res)
+    return res
+
 
-    number_data_points = len(normalized_residuals)
+def all_statistical_tests_from_signs(signs, chi_square, spline_func=None, tests=None, number_data_points=None):
+    """
+    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, from the signs
+    of the residuals and chi2.
 
-    signs = np.sign(normalized_residuals)
-    chi_square = (normalized_residuals**2).sum()
+    Parameters
+    ----------
+    signs: array
+        1d array containing the signs (:math:`\\pm 1`) of the normalized residuals. Any integer or float dtype. Not
+        used, and may be None, if only the chi2 test is selected.
+    chi_square: float
+        Sum of the squared normalized residuals. Not used, and may be None, if only the h and hpm tests are selected.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+    number_data_points: int (optional)
+        Number of data points. Default is the length of signs.
+
+    Returns
+    -------
+    res: dict
+        The Shannon information values and p-values for the selected test statistics.
+    """
+    tests, components = plan_tests(tests)
+    if number_data_points is None:
+        number_data_points = len(signs)
 
-    # Calculate run-length histograms
-    num, blockLen, histo, edges = rld.get_run_length_distributions(signs)
+    # Calculate the run-length histograms required by the selected tests
+    SI_h = SI_hpm = None
+    if "h" in components or "hpm" in components:
+        histograms = (["all"] if "h" in components else []) + (["plus", "minus"] if "hpm" in components else [])
+        num, blockLen, histo, edges = rld.get_run_length_distributions(signs, sparse=True, histograms=histograms)
+        if "h" in components:
+            SI_h = rld.SI_h(number_data_points, histo['all'])
+        if "hpm" in components:
+            SI_hpm = rld.SI_hpm(number_data_points, num[1], histo['plus'], histo['minus'])
+    SI_chi2 = rld.SI_chi2(chi_square, number_data_points) if "chi2" in components else None
+
+    return _results_from_SI(SI_chi2, SI_h, SI_hpm, number_data_points, spline_func, tests)
+
+
+def all_statistical_tests_from_accumulator(accumulator, spline_func=None, tests=None):
+    """
+    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, for the
+    residuals added to a run-length accumulator so far.
+
+    Parameters
+    ----------
+    accumulator: rld.RunLengthAccumulator
+        Accumulator fed with the normalized residuals.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res: dict
+        The Shannon information values and p-values for the selected test statistics.
+    """
+    tests, components = plan_tests(tests)
+    SI = accumulator.finalize(components)
+    return _results_from_SI(SI['chi2'], SI['h'], SI['hpm'], accumulator.N, spline_func, tests)
+
+
+def _results_from_SI(SI_chi2, SI_h, SI_hpm, number_data_points, spline_func=None, tests=None):
+    """
+    Combines the Shannon information of chi2, h, and hpm and calculates p-values for the selected tests (default all).
+    Components not required by the selected tests may be None.
+
+    Returns
+    -------
+    res: dict
+        The Shannon information values and p-values for all test statistics.
+    """
+    # Parameters for gamma distribution used to calculate p-values
+    if spline_func is None:
+        spline_func = sid.get_spline_cache()
 
     # Single dictionary containing all results
     res = OrderedDict()
 
-    res['chi2'] = {"label": "chi2", }
-    res['h'] = {"label": "h", }
-    res['hpm'] = {"label": "hpm", }
-    res['chi2_h'] = {"label": "(chi2,h)", }
-    res['chi2_hpm'] = {"label": "(chi^2,hpm)", }
-
-    # Shannon information of $\chi^2$
-    res['chi2']['I'] = rld.SI_chi2(chi_square, number_data_points)
-    # Shannon information of $h$
-    res['h']['I'] = rld.SI_h(number_data_points, histo['all'])
-    # Shannon information of $h^\pm$
-    res['hpm']['I'] = rld.SI_hpm(number_data_points, num[1], histo['plus'], histo['minus'])
-    # Shannon information of $(\chi^2, h)$
-    res['chi2_h']['I'] = res['h']['I'] + res['chi2']['I']
-    # Shannon information of $(\chi^2, h^\pm)$
-    res['chi2_hpm']['I'] = res['hpm']['I'] + res['chi2']['I']
-
-    # Calculate p-values for all tests
+    # Shannon information of $\chi^2$, $h$, and $h^\pm$, and the sums for $(\chi^2, h)$ and $(\chi^2, h^\pm)$
+    SI = {"chi2": SI_chi2, "h": SI_h, "hpm": SI_hpm}
+    for test in plan_tests(tests)[0]:
+        res[test] = {"label": test_labels[test], }
+        res[test]['I'] = sum(SI[component] for component in test_components[test])
+
+    # Calculate p-values for all tests, and their logarithms, which remain finite for p-values below the smallest
+    # floating point number
     for test in list(res):
-        res[test]['p'] = sid.get_p_value(res[test]['I'], number_data_points, test, gamma_param)
+        p, log10_p = _p_values(res[test]['I'], number_data_points, test, spline_func)
+        res[test]['p'] = float(p)
+        res[test]['log10_p'] = float(log10_p)
+
+    return res
+
+
+def _p_values(SI, number_data_points, test, spline_func):
+    """
+    Vectorized p-values of a test and their decadic logarithms, see sid.p_values() and sid.log10_p_values(), with a
+    single evaluation of the gamma distribution parameters.
+    """
+    SI, number_data_points = np.broadcast_arrays(np.asarray(SI, dtype=np.float64), np.asarray(number_data_points))
+    alpha, beta, I0 = sid.gamma_parameters_for_tests(number_data_points, test, spline_func)
+    return (sid.cumulative_SID_gamma(SI, alpha, beta, I0),
+            sid.log_cumulative_SID_gamma(SI, alpha, beta, I0) / np.log(10.))
+
+
+@profiling.profiled
+def all_statistical_tests_from_file(file_name, column=1, fmt=None, chunk_size=io.CHUNK_SIZE, spline_func=None,
+                                    cache=None, tests=None):
+    """
+    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests for normalized residuals read in chunks
+    from a file. The chunks are fed to a run-length accumulator, so that memory is bounded by the chunk size and the
+    number of distinct run lengths, irrespective of the file size.
+
+    Parameters
+    ----------
+    file_name: str
+        Name of file containing normalized residuals. See io.read_residuals_from_file() for supported formats.
+    column: int
+        Number of the column from which normalized residuals are read.
+    fmt: str (optional)
+        Format of the file, see io.detect_format(). Detected automatically by default.
+    chunk_size: int, optional
+        Number of residuals per chunk.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    cache: cache.ResultCache (optional)
+        Persistent cache of results, keyed by the bytes of the file, the column, and the spline parameters. On a cache
+        hit, the file is hashed but not parsed.
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res: dict
+        The Shannon information values and p-values for the selected test statistics.
+    """
+    tests, components = plan_tests(tests)
+    if cache is not None:
+        key = result_cache.file_key(file_name, column, spline_func, fmt=fmt, tests=tests)
+        res = cache.get(key)
+        if res is not None:
+            return res
+    accumulator = rld.RunLengthAccumulator(sorted(components))
+    for chunk in io.iter_residual_chunks(file_name, column, chunk_size, fmt):
+        accumulator.update(chunk)
+    res = all_statistical_tests_from_accumulator(accumulator, spline_func, tests)
+    if cache is not None:
+        cache.put(key, res)
+    return res
+
+
+def _batch_dtype(extra_fields=(), tests=None):
+    """
+    Returns the structured dtype of the output of all_statistical_tests_batch(). Each selected test (default all) is a
+    field with subfields 'I' (Shannon information), 'p' (p-value), and 'log10_p' (decadic logarithm of the p-value), so
+    that res[test]['p'] works as for the output of all_statistical_tests(). Additional integer fields are prepended.
+    """
+    return np.dtype([(field, np.int64) for field in extra_fields] + [("N", np.int64)] +
+                    [(test, [("I", np.float64), ("p", np.float64), ("log10_p", np.float64)])
+                     for test in plan_tests(tests)[0]])
+
+
+def _batch_results_from_statistics(stats, chi_square, spline_func=None, res=None, tests=None):
+    """
+    Calculates Shannon information and p-values for the selected tests (default all) from vectorized run-length
+    statistics. Only the Shannon information components required by the selected tests are calculated.
+
+    Parameters
+    ----------
+    stats: dict
+        Run-length statistics, output of rld.get_run_length_statistics().
+    chi_square: array
+        Sums of the squared normalized residuals.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    res: structured array (optional)
+        Output array with dtype from _batch_dtype() for the selected tests. Allocated by default.
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+    Returns
+    -------
+    res: structured array
+        The Shannon information values and p-values for the selected test statistics, NaN for empty residual vectors.
+    """
+    if spline_func is None:
+        spline_func = sid.get_spline_cache()
+    tests, components = plan_tests(tests)
+
+    number_data_points = stats['N']
+    if res is None:
+        res = np.zeros(number_data_points.shape[0], dtype=_batch_dtype(tests=tests))
+    res['N'] = number_data_points
+    SI = {}
+    if "chi2" in components:
+        SI['chi2'] = rld.SI_chi2(chi_square, number_data_points)
+    if "h" in components:
+        SI['h'] = rld.SI_h_from_statistics(number_data_points, stats['nc'], stats['lfh_all'])
+    if "hpm" in components:
+        SI['hpm'] = rld.SI_hpm_from_statistics(number_data_points, stats['nc'], stats['ncPlus'], stats['nPlus'],
+                                               stats['lfh_plus'], stats['lfh_minus'])
 
+    for test in tests:
+        # Empty residual vectors have no Shannon information and p-values
+        res[test]['I'] = np.where(number_data_points > 0, sum(SI[component] for component in test_components[test]),
+                                  np.nan)
+        res[test]['p'], res[test]['log10_p'] = _p_values(res[test]['I'], number_data_points, test, spline_func)
     return res
+
+
+def _all_statistical_tests_flat(normalized_residuals, offsets, spline_func=None, tests=None):
+    """
+    Calculates p-values for the selected tests (default all) for several residual vectors stored back to back in a 1d
+    array.
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        1d array containing the concatenated normalized residuals.
+    offsets: array
+        Start index of each residual vector followed by the total length.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+    Returns
+    -------
+    res: structured array
+        The Shannon information values and p-values for the selected test statistics, one entry per residual vector.
+    """
+    stats = rld.get_residual_statistics(normalized_residuals, offsets)
+    return _batch_results_from_statistics(stats, stats['chi_square'], spline_func, tests=tests)
+
+
+@profiling.profiled
+def all_statistical_tests_batch(normalized_residuals, spline_func=None, tests=None):
+    """
+    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, for many
+    residual vectors of equal length at once.
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        2d array of shape (number of models, number of data points). Each row contains residuals divided by the
+        standard error of the mean.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res: structured array
+        The Shannon information values and p-values for the selected test statistics, one entry per row. The Shannon
+        information and p-value of a test are accessed as res[test]['I'] and res[test]['p'], the number of data points
+        as res['N'].
+    """
+    normalized_residuals = np.asarray(normalized_residuals, dtype=np.float64)
+    if normalized_residuals.ndim != 2:
+        raise ValueError("normalized_residuals must be a 2d array, got %d dimension(s)" % normalized_residuals.ndim)
+    n_models, number_data_points = normalized_residuals.shape
+    offsets = np.arange(n_models + 1, dtype=np.int64) * number_data_points
+    return _all_statistical_tests_flat(normalized_residuals.ravel(), offsets, spline_func, tests)
+
+
+@profiling.profiled
+def all_statistical_tests_ragged(normalized_residuals_list, spline_func=None, tests=None):
+    """
+    Calculates p-values for the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, for many
+    residual vectors of possibly different lengths at once.
+
+    Parameters
+    ----------
+    normalized_residuals_list: list of arrays
+        List of 1d arrays containing residuals divided by the standard error of the mean.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res: structured array
+        The Shannon information values and p-values for the selected test statistics, one entry per residual vector.
+        See all_statistical_tests_batch().
+    """
+    lengths = [len(r) for r in normalized_residuals_list]
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if len(lengths) > 0:
+        normalized_residuals = np.concatenate([np.asarray(r, dtype=np.float64) for r in normalized_residuals_list])
+    else:
+        normalized_residuals = np.zeros(0)
+    return _all_statistical_tests_flat(normalized_residuals, offsets, spline_func, tests)
+
+
+@profiling.profiled
+def scan_statistical_tests(normalized_residuals, width=None, stride=1, boundaries=None, spline_func=None, tests=None):
+    """
+    Evaluates the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, in sliding windows or segments of the residuals to
+    localize systematic deviations of the model from the data. Sliding windows are evaluated with run-length counts
+    that are updated incrementally as the window moves, so the cost of a scan is about O(N) irrespective of the window
+    width.
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        1d array containing the residuals divided by the standard error of the mean.
+    width: int (optional)
+        Number of data points per sliding window.
+    stride: int, optional
+        Shift between consecutive sliding windows. Default is 1.
+    boundaries: array (optional)
+        Segment boundaries, such that segment i is normalized_residuals[boundaries[i]:boundaries[i + 1]]. Used instead
+        of sliding windows.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res: structured array
+        The Shannon information values and p-values for the selected test statistics, one entry per window or segment, in the
+        format of all_statistical_tests_batch(), with additional fields 'start' and 'stop' for the first and one past
+        the last index of each window.
+    """
+    tests, components = plan_tests(tests)
+    normalized_residuals = np.asarray(normalized_residuals, dtype=np.float64)
+    if (width is None) == (boundaries is None):
+        raise ValueError("Either width or boundaries must be given")
+    if boundaries is not None:
+        boundaries = np.asarray(boundaries, dtype=np.int64)
+        if boundaries.ndim != 1 or boundaries.shape[0] < 2:
+            raise ValueError("boundaries must be a 1d array of at least two indices")
+        if np.any(np.diff(boundaries) < 0) or boundaries[0] < 0 or boundaries[-1] > normalized_residuals.shape[0]:
+            raise ValueError("boundaries must be nondecreasing indices within the residuals")
+        offsets = boundaries - boundaries[0]
+        selected = normalized_residuals[boundaries[0]:boundaries[-1]]
+        stats = rld.get_residual_statistics(selected, offsets)
+        chi_square = stats['chi_square']
+        starts = boundaries[:-1]
+        stops = boundaries[1:]
+    else:
+        stats = rld.sliding_window_run_length_statistics(np.sign(normalized_residuals), width, stride)
+        starts = stats['start']
+        stops = starts + width
+        chi_square = None
+        if "chi2" in components:
+            cum_squares = np.zeros(normalized_residuals.shape[0] + 1)
+            np.cumsum(normalized_residuals**2, out=cum_squares[1:])
+            chi_square = cum_squares[stops] - cum_squares[starts]
+    res = np.zeros(starts.shape[0], dtype=_batch_dtype(("start", "stop"), tests))
+    res['start'] = starts
+    res['stop'] = stops
+    return _batch_results_from_statistics(stats, chi_square, spline_func, res, tests)
+
+
+@profiling.profiled
+def global_statistical_tests(normalized_residuals_list, n_jobs=1, spline_func=None, tests=None):
+    """
+    Evaluates the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, for several independent data
+    sets described by the same model, and combines the evidence. The Shannon information of independent data sets is additive, and the
+    global p-value is calculated from the distribution of the summed Shannon information (see sid.combined_p_value()).
+
+    Parameters
+    ----------
+    normalized_residuals_list: list of arrays
+        List of 1d arrays containing the residuals of each data set divided by the standard error of the mean.
+    n_jobs: int, optional
+        Number of worker processes among which the data sets are distributed. Default is 1, i.e., evaluation in the
+        calling process.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res_global: dict
+        The summed Shannon information values and global p-values for the selected test statistics, in the format of
+        all_statistical_tests().
+    res: structured array
+        The Shannon information values and p-values for each data set, in the format of all_statistical_tests_batch().
+    """
+    tests = plan_tests(tests)[0]
+    if n_jobs == 1 or len(normalized_residuals_list) <= 1:
+        res = all_statistical_tests_ragged(normalized_residuals_list, spline_func, tests)
+    else:
+        groups = [list(g) for g in np.array_split(np.arange(len(normalized_residuals_list)), n_jobs) if len(g) > 0]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = pool.map(all_statistical_tests_ragged,
+                             [[normalized_residuals_list[i] for i in g] for g in groups], [spline_func] * len(groups),
+                             [tests] * len(groups))
+            res = np.concatenate(list(parts))
+
+    return _combine_results(res, spline_func, tests), res
+
+
+def _combination_gamma_parameters(number_data_points, test, spline_func=None):
+    """
+    Parameters of the shifted gamma distributions of the Shannon information of data sets of a test, for the global
+    p-value. Below the calibrated range (see sid.calibrated_range()), the components of each test are approximated with
+    the moments of their exact distributions (see sid.exact_gamma_parameters()), i.e., combined tests are split into
+    their independent components. Data sets must have at least two data points.
+
+    Returns
+    -------
+    alpha: array
+        Shape parameters of the gamma disributions.
+    beta: array
+        Inverse scale parameters of the gamma disributions.
+    I0: array
+        Shift (location) parameters of the gamma distributions.
+    """
+    number_data_points = np.asarray(number_data_points)
+    small = number_data_points < sid.calibrated_range(test, spline_func)[0]
+    params = [sid.gamma_parameters_for_tests(number_data_points[~small], test, spline_func)]
+    for component in test_components[test]:
+        params.append(sid.exact_gamma_parameters(number_data_points[small], component))
+    return tuple(np.concatenate([p[i] for p in params]) for i in range(3))
+
+
+def _combine_results(res, spline_func=None, tests=None):
+    """
+    Sums the Shannon information of independent data sets and calculates the global p-values for the selected tests
+    (default all). Data sets with fewer than two data points are not included, see _combination_gamma_parameters().
+
+    Parameters
+    ----------
+    res: structured array
+        The Shannon information values for each data set, in the format of all_statistical_tests_batch(), including
+        the selected tests.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res_global: dict
+        The summed Shannon information values and global p-values for the selected test statistics, in the format of
+        all_statistical_tests().
+    """
+    # For a single data point, the sign is uninformative and chi2 has no mode, i.e., no shift I0
+    included = res['N'] >= 2
+    res_global = OrderedDict()
+    for test in plan_tests(tests)[0]:
+        res_global[test] = {"label": test_labels[test], }
+        res_global[test]['I'] = float(res[test]['I'][included].sum())
+        alpha, beta, I0 = _combination_gamma_parameters(res['N'][included], test, spline_func)
+        res_global[test]['p'] = sid.combined_p_value(res_global[test]['I'], alpha, beta, I0)
+        res_global[test]['log10_p'] = sid.combined_p_value(res_global[test]['I'], alpha, beta, I0, log10=True)
+    return res_global
+
+
+@profiling.profiled
+def all_statistical_tests_segmented(normalized_residuals, zeros="break", seed=0, spline_func=None, tests=None):
+    """
+    Evaluates the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests for a series of normalized residuals with gaps (NaN)
+    and exact zeros, in a single pass without cleaned copies of the residuals. The gap-free segments are treated as
+    independent data sets, whose evidence is combined as in global_statistical_tests().
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        1d array containing the residuals divided by the standard error of the mean, possibly containing zeros and NaN.
+    zeros: str, optional
+        Policy for exact zeros: "drop", "break" (default), "random", or "previous", see rld.get_segment_statistics().
+    seed: int, optional
+        Seed of the random signs of zeros for the "random" policy.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    res_global: dict
+        The summed Shannon information values and global p-values for the selected test statistics, in the format of
+        all_statistical_tests().
+    res: structured array
+        The Shannon information values and p-values of the selected tests for each segment, in the format of
+        all_statistical_tests_batch(), with additional fields 'start' and 'stop' for the first and one past the last
+        index of each segment.
+    """
+    tests = plan_tests(tests)[0]
+    stats = rld.get_segment_statistics(normalized_residuals, zeros, seed)
+    res = np.zeros(stats['N'].shape[0], dtype=_batch_dtype(("start", "stop"), tests))
+    res['start'] = stats['start']
+    res['stop'] = stats['stop']
+    res = _batch_results_from_statistics(stats, stats['chi_square'], spline_func, res, tests)
+    return _combine_results(res, spline_func, tests), res
+
+
+def _error_message(err):
+    """
+    Returns the error message of an exception in the batch results, e.g., "ValueError: ...".
+    """
+    return "%s: %s" % (type(err).__name__, err)
+
+
+def _evaluate_file(file_name, columns=None, fmt=None, zeros=None, seed=0, cache=None, spline_func=None, tests=None):
+    """
+    Evaluates the tests for several columns of a file, reading the file at most once. Returns a list of tuples of file
+    name, column, results, and error message, see evaluate_files(). Invalid columns do not prevent the evaluation of
+    the other columns.
+    """
+    try:
+        results = OrderedDict((column, None) for column in (columns or []))
+        errors = OrderedDict()
+        missing = columns
+        if cache is not None and columns is not None:
+            for column in columns:
+                results[column] = cache.get(result_cache.file_key(file_name, column, spline_func, fmt=fmt, zeros=zeros,
+                                                                  seed=seed, tests=tests))
+            missing = [column for column in columns if results[column] is None]
+        if missing is None or len(missing) > 0:
+            missing, normalized_residuals_list = io.read_columns_from_file(file_name, missing, fmt, errors=errors)
+            for column, normalized_residuals in zip(missing, normalized_residuals_list):
+                try:
+                    results[column] = all_statistical_tests(normalized_residuals, spline_func, zeros, seed, tests=tests)
+                except (ValueError, RuntimeError) as err:
+                    errors[column] = err
+                    continue
+                if cache is not None:
+                    cache.put(result_cache.file_key(file_name, column, spline_func, fmt=fmt, zeros=zeros, seed=seed,
+                                                    tests=tests), results[column])
+        return [(file_name, column, results[column], _error_message(errors[column]) if column in errors else None)
+                for column in results]
+    except (OSError, ValueError, RuntimeError) as err:
+        return [(file_name, column, None, _error_message(err)) for column in (columns or [None])]
+
+
+def evaluate_files(file_names, columns=None, fmt=None, zeros=None, seed=0, n_jobs=1, cache=None, spline_func=None,
+                   tests=None):
+    """
+    Evaluates the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests, or a selection of them, for many files and columns in a process pool, and
+    yields the results of each file as soon as it is completed. Each file is read once for all of its columns.
+
+    Parameters
+    ----------
+    file_names: list of str
+        Names of files containing normalized residuals. See io.read_residuals_from_file() for supported formats.
+    columns: list of int (optional)
+        Numbers of the columns from which normalized residuals are read. Default reads all columns of each file.
+    fmt: str (optional)
+        Format of the files, see io.detect_format(). Detected automatically by default.
+    zeros: str (optional)
+        Policy for exact zeros and gaps, see all_statistical_tests().
+    seed: int, optional
+        Seed of the random signs of zeros for the "random" policy.
+    n_jobs: int, optional
+        Number of worker processes among which the files are distributed. Default is 1, i.e., evaluation in the
+        calling process.
+    cache: cache.ResultCache (optional)
+        Persistent cache of results, shared by the worker processes. Files whose requested columns are all cached are
+        hashed but not read.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+    tests: list of str (optional)
+        Names of the tests to evaluate, see plan_tests(). Default evaluates all tests.
+
+    Returns
+    -------
+    generator
+        Tuples of file name, column, results (in the format of all_statistical_tests()), and error message. For files
+        that cannot be read, results are None, the error message is a string, and the column is None if columns is
+        None. Columns that are not present in a file have an error message, without affecting the other columns of
+        the file. Files are completed in arbitrary order if n_jobs > 1.
+    """
+    tests = plan_tests(tests)[0]
+    if n_jobs == 1:
+        for file_name in file_names:
+            for result in _evaluate_file(file_name, columns, fmt, zeros, seed, cache, spline_func, tests):
+                yield result
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_evaluate_file, file_name, columns, fmt, zeros, seed, cache, spline_func, tests)
+                       for file_name in file_names]
+            for future in as_completed(futures):
+                for result in future.result():
+                    yield result
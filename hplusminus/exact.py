@@ -0,0 +1,236 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import os
+import threading
+from functools import lru_cache
+import numpy as np
+import scipy.special
+from . import io
+
+
+# Largest number of data points for which exact distributions are calculated by default. The number of distinct
+# run-length histograms grows as the number of integer partitions of N, and the calculation of the distributions of
+# both tests takes about 1 s for N=40, 10 s for N=80, and 40 s for N=100.
+MAX_EXACT_N = 100
+# Shannon information values closer than this are merged into one value of the discrete distributions
+SI_RESOLUTION = 1e-9
+
+
+# Partition table of the largest number of data points so far, which contains the tables of all smaller ones
+_table = {"N": -1, "table": None}
+_table_lock = threading.Lock()
+
+
+def _default_cache_dir():
+    """
+    Returns the directory where exact Shannon information distributions are cached, given by the environment variable
+    HPLUSMINUS_CACHE_DIR, or None if it is not set.
+    """
+    cache_dir = os.environ.get("HPLUSMINUS_CACHE_DIR")
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, "exact")
+
+
+def _merge(F, W):
+    """
+    Merges equal values F (up to SI_RESOLUTION) of a discrete distribution by summing their weights W.
+    """
+    keys, inverse = np.unique(np.round(F / SI_RESOLUTION), return_inverse=True)
+    return keys * SI_RESOLUTION, np.bincount(inverse, weights=W)
+
+
+def _partition_table(N):
+    """
+    Returns the table of _build_partition_table() for at least N. The table of the largest N so far is kept and reused
+    for all smaller N, i.e., for the distributions of both tests and all numbers of data points up to N.
+    """
+    with _table_lock:
+        if _table["N"] < N:
+            _table["table"] = _build_partition_table(N)
+            _table["N"] = N
+        return _table["table"]
+
+
+def _build_partition_table(N):
+    """
+    Dynamic programming over the parts j = 1, ..., N of integer partitions. For all n <= N and numbers of parts k,
+    returns the distribution of :math:`F = \\sum_j \\ln m_j!` over the partitions of n into k parts, where :math:`m_j` is
+    the number of parts of size j, i.e., the run-length histogram. Each partition carries the weight
+    :math:`\\prod_j 1/m_j!`, such that :math:`k! \\prod_j 1/m_j!` is the number of compositions (ordered sequences of
+    runs) with this histogram.
+
+    Returns
+    -------
+    table: dict
+        Keys (n, k), values (F, W) with distinct values F and summed weights W.
+    """
+    log_factorial = scipy.special.gammaln(np.arange(N + 2))
+    table = {(0, 0): (np.zeros(1), np.ones(1))}
+    for j in range(1, N + 1):
+        new = {}
+        for (n, k), (F, W) in table.items():
+            for m in range((N - n) // j + 1):
+                new.setdefault((n + m * j, k + m), []).append((F + log_factorial[m + 1], W * np.exp(-log_factorial[m + 1])))
+        table = {}
+        for key, parts in new.items():
+            if len(parts) == 1:
+                table[key] = parts[0]
+            else:
+                table[key] = _merge(np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+    return table
+
+
+def SI_h_distribution(N):
+    """
+    Exact distribution of the Shannon information of the run-length histogram h for N uncorrelated signs.
+
+    Parameters
+    ----------
+    N: int
+        Number of signs.
+    Returns
+    -------
+    SI: array
+        Sorted distinct values of the Shannon information.
+    prob: array
+        Probabilities of the values.
+    """
+    table = _partition_table(N)
+    SI = []
+    prob = []
+    log_2 = np.log(2)
+    for k in range(1, N + 1):
+        F, W = table[(N, k)]
+        log_k_factorial = scipy.special.gammaln(k + 1)
+        SI.append((N - 1) * log_2 - log_k_factorial + F)
+        prob.append(W * np.exp(log_k_factorial - (N - 1) * log_2))
+    return _merge(np.concatenate(SI), np.concatenate(prob))
+
+
+def SI_hpm_distribution(N):
+    """
+    Exact distribution of the Shannon information of the run-length histograms :math:`h^\\pm` for N uncorrelated
+    signs.
+
+    Parameters
+    ----------
+    N: int
+        Number of signs.
+    Returns
+    -------
+    SI: array
+        Sorted distinct values of the Shannon information.
+    prob: array
+        Probabilities of the values.
+    """
+    table = _partition_table(N)
+    log_factorial = scipy.special.gammaln(np.arange(N + 2))
+    log_2 = np.log(2)
+    empty = (np.zeros(1), np.ones(1))
+    SI = []
+    prob = []
+    for nPlus in range(N + 1):
+        nMinus = N - nPlus
+        for ncPlus in range(nPlus + 1):
+            for ncMinus in (ncPlus - 1, ncPlus, ncPlus + 1):
+                if ncMinus < 0 or ncMinus > nMinus or ncPlus + ncMinus == 0:
+                    continue
+                if (ncPlus == 0) != (nPlus == 0) or (ncMinus == 0) != (nMinus == 0):
+                    continue
+                F_plus, W_plus = table[(nPlus, ncPlus)] if ncPlus > 0 else empty
+                F_minus, W_minus = table[(nMinus, ncMinus)] if ncMinus > 0 else empty
+                # Probability of a sign sequence with given histograms: (k+! / prod m+!) (k-! / prod m-!) c / 2^N,
+                # where c = 2 arrangements (starting sign) for equal numbers of positive and negative runs
+                log_c = log_2 if ncPlus == ncMinus else 0.
+                log_k = log_factorial[ncPlus + 1] + log_factorial[ncMinus + 1]
+                SI.append(((N - 1) * log_2 + log_2 - log_c - log_k + F_plus[:, None] + F_minus[None, :]).ravel())
+                prob.append((np.exp(log_k + log_c - N * log_2) * W_plus[:, None] * W_minus[None, :]).ravel())
+    return _merge(np.concatenate(SI), np.concatenate(prob))
+
+
+_distributions = {"h": SI_h_distribution, "hpm": SI_hpm_distribution}
+
+
+@lru_cache(maxsize=256)
+def survival_function(N, test, cache_dir=None):
+    """
+    Exact survival function :math:`P(\\mathcal{I} \\ge SI)` of the Shannon information for N uncorrelated signs,
+    cached in memory and optionally on disk. The distributions are enumerated over the integer partitions of N, whose
+    number of distinct Shannon information values grows faster than any power of N, which limits the calculation to
+    about N=100 (see MAX_EXACT_N), taking tens of seconds. Use the gamma distribution approximation of sid.p_values()
+    for larger N.
+
+    Parameters
+    ----------
+    N: int
+        Number of signs.
+    test: str
+        Name of statistical test, 'h' or 'hpm'.
+    cache_dir: str (optional)
+        Directory of the disk cache. Default is given by the environment variable HPLUSMINUS_CACHE_DIR. Without either,
+        the distributions are only cached in memory.
+    Returns
+    -------
+    SI: array
+        Sorted distinct values of the Shannon information.
+    survival: array
+        Probability of a Shannon information greater than or equal to each value.
+    """
+    if test not in _distributions:
+        raise ValueError("Exact distribution not available for test \"%s\"" % test)
+    if cache_dir is None:
+        cache_dir = _default_cache_dir()
+    if cache_dir is not None:
+        file_name = os.path.join(cache_dir, "SI_%s_N%d.pack" % (test, N))
+        if os.path.exists(file_name):
+            arrays = io.load_packed_arrays(file_name)
+            return arrays["SI"], arrays["survival"]
+    SI, prob = _distributions[test](N)
+    survival = np.cumsum(prob[::-1])[::-1]
+    if cache_dir is None:
+        return SI, survival
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file_name = file_name + ".%d.tmp" % os.getpid()
+        io.save_packed_arrays({"SI": SI, "survival": survival}, tmp_file_name)
+        os.replace(tmp_file_name, file_name)
+    except OSError:
+        # The disk cache is optional, e.g., for read-only file systems
+        pass
+    return SI, survival
+
+
+def p_values(SI, number_data_points, test, max_N=MAX_EXACT_N, cache_dir=None):
+    """
+    Exact p-values :math:`P(\\mathcal{I} \\ge SI)` of the h or hpm test for small numbers of data points, see
+    survival_function() for the cost of the calculation.
+
+    Parameters
+    ----------
+    SI: float or array
+        Shannon information values.
+    number_data_points: int or array
+        Number of data points, broadcast against SI.
+    test: str
+        Name of statistical test, 'h' or 'hpm'.
+    max_N: int, optional
+        Largest number of data points for which exact p-values are calculated.
+    cache_dir: str (optional)
+        Directory of the disk cache, see survival_function().
+    Returns
+    -------
+    p_value: array
+        P-values for given test.
+    """
+    SI, number_data_points = np.broadcast_arrays(np.asarray(SI, dtype=np.float64), np.asarray(number_data_points))
+    p_value = np.zeros(SI.shape)
+    for N in np.unique(number_data_points):
+        if N < 1 or N > max_N:
+            raise ValueError("Exact p-values are only available for 1 <= N <= %d, got N=%d" % (max_N, N))
+        SI_N, survival = survival_function(int(N), test, cache_dir)
+        selected = number_data_points == N
+        index = np.searchsorted(SI_N, SI[selected] - SI_RESOLUTION * 1e3, side="left")
+        p_value[selected] = np.concatenate([survival, [0.]])[index]
+    return np.minimum(p_value, 1.)
@@ -1,41 +1,270 @@
 # Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
 # Released under the MIT Licence, see the file LICENSE.txt.
 
-
+import csv
+import itertools
+import json
+import os
+import struct
 import numpy as np
+from . import profiling
+
+
+# Magic bytes at the beginning of packed array files written by save_packed_arrays()
+PACKED_MAGIC = b"HPMPACK1"
+# Alignment in bytes of the arrays within packed array files
+PACKED_ALIGNMENT = 64
+# File name endings of raw binary float64 residual files
+RAW_ENDINGS = (".bin", ".raw", ".f64")
+# Default number of residuals per chunk when reading files
+CHUNK_SIZE = 2**20
+
+
+def detect_format(file_name):
+    """
+    Detect the format of a residual file from its ending and, for unknown endings, its first bytes.
+
+    Parameters
+    ----------
+    file_name: str
+        Name of residual file.
+    Returns
+    -------
+    fmt: str
+        "npy" for numpy binary files, "raw" for raw binary float64 files, "csv" for comma-separated values, and "txt"
+        for whitespace-separated text.
+    """
+    ending = os.path.splitext(file_name)[1].lower()
+    if ending == ".npy":
+        return "npy"
+    elif ending in RAW_ENDINGS:
+        return "raw"
+    elif ending == ".csv":
+        return "csv"
+    with open(file_name, "rb") as fp:
+        if fp.read(6) == b"\x93NUMPY":
+            return "npy"
+    return "txt"
+
+
+def _select_column(data, column, file_name):
+    """
+    Returns column (counting from 1) of 2d data, or 1d data unchanged, which has only column 1.
+    """
+    n_columns = 1 if data.ndim == 1 else data.shape[1]
+    if column < 1 or column > n_columns:
+        raise ValueError("Column %d not present in file \"%s\" with %d column%s" %
+                         (column, file_name, n_columns, "" if n_columns == 1 else "s"))
+    return data if data.ndim == 1 else data[:, column - 1]
+
+
+def _iter_text_chunks(file_name, column, chunk_size, delimiter):
+    """
+    Parse the given column of a text file in chunks of lines.
+    """
+    usecols = None
+    with open(file_name, "r") as fp:
+        while True:
+            lines = list(itertools.islice(fp, chunk_size))
+            if len(lines) == 0:
+                return
+            if usecols is None:
+                data = np.loadtxt(lines, delimiter=delimiter, ndmin=2)
+                usecols = column - 1
+                if data.shape[0] > 0:
+                    yield _select_column(data, column, file_name)
+                continue
+            yield np.loadtxt(lines, delimiter=delimiter, usecols=usecols, ndmin=1)
+
+
+def iter_residual_chunks(file_name, column=1, chunk_size=CHUNK_SIZE, fmt=None, n_columns=1):
+    """
+    Iterate over chunks of normalized residuals in a file, reading only the requested column.
+    Numpy binary and raw binary files are memory-mapped, and the chunks are views into the mapping.
+
+    Parameters
+    ----------
+    file_name: str
+        Name of file containing normalized residuals.
+    column: int
+        Number of the column from which normalized residuals are read.
+    chunk_size: int, optional
+        Maximum number of residuals (lines for text files) per chunk.
+    fmt: str (optional)
+        Format of the file, see detect_format(). Detected automatically by default.
+    n_columns: int, optional
+        Number of columns of raw binary files, stored row by row.
+    Returns
+    -------
+    generator
+        1d arrays containing consecutive chunks of normalized residuals.
+    """
+    chunks = _iter_chunks(file_name, column, chunk_size, fmt, n_columns)
+    while True:
+        # Only the reading of the chunks is timed, not their processing by the caller
+        with profiling.stage("io.iter_residual_chunks"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
 
 
-def read_residuals_from_file(file_name, column=1):
+def _iter_chunks(file_name, column, chunk_size, fmt, n_columns):
     """
-    Read normalized residuals from text file.
+    Generator of the chunks of iter_residual_chunks().
+    """
+    if fmt is None:
+        fmt = detect_format(file_name)
+    if fmt in ("npy", "raw"):
+        if fmt == "npy":
+            data = np.load(file_name, mmap_mode="r")
+        else:
+            data = np.memmap(file_name, dtype=np.float64, mode="r").reshape(-1, n_columns)
+            if n_columns == 1:
+                data = data[:, 0]
+        data = _select_column(data, column, file_name)
+        for start in range(0, data.shape[0], chunk_size):
+            yield data[start:start + chunk_size]
+    elif fmt in ("csv", "txt"):
+        delimiter = "," if fmt == "csv" else None
+        for chunk in _iter_text_chunks(file_name, column, chunk_size, delimiter):
+            yield chunk
+    else:
+        raise ValueError("Format \"%s\" not recognized" % fmt)
+
+
+@profiling.profiled
+def read_residuals_from_file(file_name, column=1, fmt=None):
+    """
+    Read normalized residuals from file.
 
     Parameters
     ----------
     file_name: str
-        Name of text file containing normalized residuals
+        Name of file containing normalized residuals, either text (whitespace- or comma-separated), numpy binary (".npy"), or raw binary float64 (".bin", ".raw", ".f64")
     column: int
         Number of the column from which normalized residuals are read
+    fmt: str (optional)
+        Format of the file, see detect_format(). Detected automatically by default.
     Returns
     -------
     normalized_residuals: array
-        1d array containing normalized residuals
+        1d array containing normalized residuals. Memory-mapped for binary files.
     """
+    if fmt is None:
+        fmt = detect_format(file_name)
     try:
-        normalized_residuals = np.loadtxt(file_name)
-        if normalized_residuals.ndim == 2:
-            normalized_residuals = normalized_residuals[:, column - 1]
-        print()
-        print("Reading normalized residuals from column %d of file \"%s\"." % (column, file_name))
-        print()
-        return normalized_residuals
-    except:
-        msg = "Error reading column %d of file \"%s\"" % (column, file_name)
-        raise RuntimeError(msg)
+        if fmt in ("npy", "raw"):
+            normalized_residuals = next(iter_residual_chunks(file_name, column, chunk_size=np.iinfo(np.int64).max, fmt=fmt),
+                                        np.zeros(0))
+        else:
+            normalized_residuals = np.concatenate([np.zeros(0)] + list(iter_residual_chunks(file_name, column, fmt=fmt)))
+    except ValueError as err:
+        msg = "Error reading column %d of file \"%s\": %s" % (column, file_name, err)
+        raise RuntimeError(msg) from err
+    print()
+    print("Reading normalized residuals from column %d of file \"%s\"." % (column, file_name))
+    print()
+    return normalized_residuals
+
+
+@profiling.profiled
+def read_columns_from_file(file_name, columns=None, fmt=None, n_columns=1, errors=None):
+    """
+    Read several columns of normalized residuals from a file at once, parsing text files only once. Unlike
+    read_residuals_from_file(), nothing is printed, which suits the evaluation of many files.
+
+    Parameters
+    ----------
+    file_name: str
+        Name of file containing normalized residuals, see read_residuals_from_file() for supported formats.
+    columns: list of int (optional)
+        Numbers of the columns from which normalized residuals are read. Default reads all columns.
+    fmt: str (optional)
+        Format of the file, see detect_format(). Detected automatically by default.
+    n_columns: int, optional
+        Number of columns of raw binary files, stored row by row.
+    errors: dict (optional)
+        If given, columns not present in the file are skipped, and the errors are stored in errors, keyed by column.
+        By default, a ValueError is raised.
+    Returns
+    -------
+    columns: list of int
+        Numbers of the columns read.
+    normalized_residuals: list of arrays
+        1d arrays containing the normalized residuals of each column. Memory-mapped for binary files.
+    """
+    if fmt is None:
+        fmt = detect_format(file_name)
+    if fmt == "npy":
+        data = np.load(file_name, mmap_mode="r")
+    elif fmt == "raw":
+        data = np.memmap(file_name, dtype=np.float64, mode="r").reshape(-1, n_columns)
+    elif fmt in ("csv", "txt"):
+        data = np.loadtxt(file_name, delimiter="," if fmt == "csv" else None, ndmin=2)
+    else:
+        raise ValueError("Format \"%s\" not recognized" % fmt)
+    if data.ndim == 2 and data.shape[1] == 1:
+        data = data[:, 0]
+    if columns is None:
+        columns = list(range(1, 2 if data.ndim == 1 else data.shape[1] + 1))
+    selected = []
+    for column in columns:
+        try:
+            selected.append(_select_column(data, column, file_name))
+        except ValueError as err:
+            if errors is None:
+                raise
+            errors[column] = err
+    return [column for column in columns if column not in (errors or {})], selected
+
+
+def _log10_p(res, test):
+    """
+    Returns the decadic logarithm of the p-value of a test, computed from the p-value if res does not contain it.
+    """
+    if 'log10_p' in res[test]:
+        return res[test]['log10_p']
+    with np.errstate(divide='ignore'):
+        return float(np.log10(res[test]['p']))
+
+
+def format_log10(log10_value, precision=2):
+    """
+    Format a number given by its decadic logarithm in exponential notation, also beyond the range of floating point
+    numbers (e.g., "3.16e-1234").
+
+    Parameters
+    ----------
+    log10_value: float
+        Decadic logarithm of the number.
+    precision: int, optional
+        Number of digits after the decimal point.
+    Returns
+    -------
+    str
+        Formatted number.
+    """
+    if np.isnan(log10_value):
+        return "nan"
+    if log10_value == -np.inf:
+        return "%.*fe+00" % (precision, 0.)
+    if log10_value == np.inf:
+        return "inf"
+    exponent = int(np.floor(log10_value))
+    mantissa = 10**(log10_value - exponent)
+    # Rounding of the mantissa may carry over to the exponent
+    if float("%.*f" % (precision, mantissa)) >= 10.:
+        mantissa /= 10.
+        exponent += 1
+    return "%.*fe%+03d" % (precision, mantissa, exponent)
 
 
 def print_pvalues_to_screen(res):
     """
-    Print p-values for various statistical tests to screen.
+    Print p-values for various statistical tests to screen. P-values and their ratios with respect to the chi2 test are
+    calculated from the logarithms of the p-values, so that p-values below the smallest floating point number are
+    shown and ranked.
 
     Parameters
     ----------
@@ -47,13 +276,17 @@ def print_pvalues_to_screen(res):
     print("                test      p-value          w.r.t chi2-test  ")
     print("------------------------------------------------------------------")
 
+    log10_p_chi2 = _log10_p(res, 'chi2') if 'chi2' in res else np.nan
     for test in list(res):
-        print("%20s      %3.2e            %2.1e" % (res[test]['label'], res[test]['p'], res[test]['p'] / res['chi2']['p']))
+        log10_p = _log10_p(res, test)
+        with np.errstate(invalid='ignore'):
+            log10_ratio = log10_p - log10_p_chi2
+        print("%20s      %s            %s" % (res[test]['label'], format_log10(log10_p), format_log10(log10_ratio, 1)))
 
 
 def save_to_csv(res, filename):
     """
-    Save Shannon information and  p-values for various statistical tests to csv (comma-separated values) file.  Outfile can be read with pandas (import pandas, df = pandas.read_csv(filename))
+    Save Shannon information, p-values, and their decadic logarithms for various statistical tests to csv (comma-separated values) file.  Outfile can be read with pandas (import pandas, df = pandas.read_csv(filename))
 
     Parameters
     ----------
@@ -63,15 +296,15 @@ def save_to_csv(res, filename):
         Name of output file.
     """
     with open(filename, 'w') as fp:
-        fp.write("test,I,p-value\n")
+        fp.write("test,I,p-value,log10(p-value)\n")
         for test in list(res):
-            fp.write("%s,%.10le,%.10le\n" % (test, res[test]["I"], res[test]['p']))
+            fp.write("%s,%.10le,%.10le,%.10le\n" % (test, res[test]["I"], res[test]['p'], _log10_p(res, test)))
         fp.close()
 
 
 def save_to_txt(res, filename):
     """
-    Save Shannon information and p-values for various statistical tests to text file with three columns (name of the test, Shannon information I, p-value) separated by whitespaces.
+    Save Shannon information and p-values for various statistical tests to text file with four columns (name of the test, Shannon information I, p-value, decadic logarithm of the p-value) separated by whitespaces.
 
     Parameters
     ----------
@@ -81,12 +314,47 @@ def save_to_txt(res, filename):
         Name of output file.
     """
     with open(filename, 'w') as fp:
-        fp.write("# " + "%8s %8s %18s\n" % ("test", "I", "p-value"))
+        fp.write("# " + "%8s %8s %18s %18s\n" % ("test", "I", "p-value", "log10(p-value)"))
         for test in list(res):
-            fp.write("%10s %.10le %.10le\n" % (test, res[test]["I"], res[test]['p']))
+            fp.write("%10s %.10le %.10le %.10le\n" % (test, res[test]["I"], res[test]['p'], _log10_p(res, test)))
         fp.close()
 
 
+def save_batch_to_csv(results, fp):
+    """
+    Write the results of many files and columns to a single csv (comma-separated values) table with one row per file
+    and column, as they arrive. Rows are flushed immediately, so that the table can be read while the evaluation is
+    running.
+
+    Parameters
+    ----------
+    results: iterable
+        Tuples of file name, column, results, and error message (see evaluate.evaluate_files()). Failed evaluations,
+        with results None, are skipped.
+    fp: file object
+        Open text file or sys.stdout.
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    writer = csv.writer(fp, lineterminator="\n")
+    n_rows = 0
+    for file_name, column, res, error in results:
+        if res is None:
+            continue
+        if n_rows == 0:
+            writer.writerow(["file", "column"] + ["%s_%s" % (test, field) for test in res
+                                                  for field in ("I", "p", "log10_p")])
+        fields = [file_name, "%d" % column]
+        for test in res:
+            fields += ["%.10le" % res[test]["I"], "%.10le" % res[test]['p'], "%.10le" % _log10_p(res, test)]
+        writer.writerow(fields)
+        fp.flush()
+        n_rows += 1
+    return n_rows
+
+
 def save_to_file(res, filename):
     """
     Save Shannon information and p-values for various statistical tests either to ".txt" or ".csv" file, depending on filename ending.
@@ -110,3 +378,71 @@ def save_to_file(res, filename):
         print("No output written. Format \"%s\" not recognized." % fmt)
         print("Use either \".txt\" or \".csv\".")
     print()
+
+
+def save_packed_arrays(arrays, filename):
+    """
+    Save several numpy arrays to a single binary file that can be memory-mapped with load_packed_arrays().
+    The file starts with the magic bytes PACKED_MAGIC, followed by the length of a JSON index (8-byte unsigned
+    integer, little endian), the JSON index with dtype, shape, and offset of each array, and the aligned raw array data.
+
+    Parameters
+    ----------
+    arrays: dict
+        Dictionary of numpy arrays. Keys must be strings.
+    filename: str
+        Name of output file.
+    """
+    arrays = {key: np.ascontiguousarray(arrays[key]) for key in arrays}
+    index = {}
+    offset = 0
+    for key in arrays:
+        offset = -(-offset // PACKED_ALIGNMENT) * PACKED_ALIGNMENT
+        index[key] = {"dtype": arrays[key].dtype.str, "shape": list(arrays[key].shape), "offset": offset}
+        offset += arrays[key].nbytes
+    header = json.dumps(index).encode("utf-8")
+    data_start = -(-(len(PACKED_MAGIC) + 8 + len(header)) // PACKED_ALIGNMENT) * PACKED_ALIGNMENT
+    header = header.ljust(data_start - len(PACKED_MAGIC) - 8)
+    with open(filename, "wb") as fp:
+        fp.write(PACKED_MAGIC)
+        fp.write(struct.pack("<Q", len(header)))
+        fp.write(header)
+        for key in arrays:
+            fp.seek(data_start + index[key]["offset"])
+            fp.write(arrays[key].tobytes())
+
+
+def load_packed_arrays(filename, mmap=True):
+    """
+    Load arrays from a file written by save_packed_arrays().
+
+    Parameters
+    ----------
+    filename: str
+        Name of input file.
+    mmap: bool, optional
+        If true (default), the file is memory-mapped with a single open and the returned arrays are read-only views
+        into the mapping. If false, the file is read into memory.
+    Returns
+    -------
+    arrays: dict
+        Dictionary of numpy arrays.
+    """
+    if mmap:
+        buf = np.memmap(filename, dtype=np.uint8, mode="r")
+    else:
+        buf = np.fromfile(filename, dtype=np.uint8)
+    if buf[:len(PACKED_MAGIC)].tobytes() != PACKED_MAGIC:
+        raise RuntimeError("\"%s\" is not a packed array file" % filename)
+    header_start = len(PACKED_MAGIC) + 8
+    header_len = struct.unpack("<Q", buf[len(PACKED_MAGIC):header_start].tobytes())[0]
+    index = json.loads(buf[header_start:header_start + header_len].tobytes().decode("utf-8"))
+    data_start = header_start + header_len
+    arrays = {}
+    for key in index:
+        dtype = np.dtype(index[key]["dtype"])
+        shape = tuple(index[key]["shape"])
+        start = data_start + index[key]["offset"]
+        nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        arrays[key] = buf[start:start + nbytes].view(dtype).reshape(shape)
+    return arrays
@@ -0,0 +1,271 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import numpy as np
+from scipy.stats import gamma as gamma_dist
+from . import io
+from . import sid
+
+
+# Tests covered by lookup tables by default
+TABLE_TESTS = ("chi2", "h", "hpm", "chi2_h", "chi2_hpm")
+# Default maximum estimated interpolation error of the natural logarithm of the p-values, i.e., of the relative error
+# of the p-values
+TOLERANCE = 1e-4
+# Smallest natural logarithm of the p-values covered by the tables. Smaller p-values are calculated without table.
+LOG_P_MIN = -50.
+# Factor applied to the largest interpolation error sampled off the grid, for the error between the sampled points
+ERROR_SAFETY_FACTOR = 2.
+# Ratio of the numbers of grid points in log10 N of the shift parameters and of the log p-values
+PARAMETER_REFINEMENT = 16
+# Maximum number of table entries per test
+MAX_TABLE_SIZE = 2**24
+
+
+def _table_grid(number_data_points, test, n_SI, spline_func, log_p_min):
+    """
+    Shift parameter I0 and step of the grid in :math:`\\sqrt{SI - I_0}`, which is uniform from I0, where the p-value
+    is one, to the Shannon information with p-value exp(log_p_min), for given (possibly non-integer) numbers of data
+    points. In this variable, the log p-values are smooth at I0 also for shape parameters down to 1/2 (chi2 test),
+    and approach a parabola in the tail.
+    """
+    alpha, beta, I0 = sid.gamma_parameters_for_tests(number_data_points, test, spline_func)
+    sqrt_step = np.sqrt(gamma_dist.isf(np.exp(log_p_min), alpha, scale=1. / beta)) / (n_SI - 1)
+    return alpha, beta, I0, sqrt_step
+
+
+def _table_row(number_data_points, test, n_SI, spline_func, log_p_min):
+    """
+    Log p-values on the grid of _table_grid() for given numbers of data points.
+    """
+    alpha, beta, I0, sqrt_step = _table_grid(number_data_points, test, n_SI, spline_func, log_p_min)
+    x = (sqrt_step[:, None] * np.arange(n_SI))**2
+    log_p = sid.log_cumulative_SID_gamma(x, alpha[:, None], beta[:, None], 0.)
+    return I0, sqrt_step, log_p
+
+
+def _interpolate(table, test, log_Ns, SI):
+    """
+    Bilinear interpolation of log p-values in log10 N and the grid variable. Returns the interpolated values and a
+    mask of the values inside the table.
+    """
+    log_N_start = float(table[test + "_log10_N_start"])
+    log_N_step = float(table[test + "_log10_N_step"])
+    log_p = table[test + "_log_p"]
+    n_N, n_SI = log_p.shape
+    u = (log_Ns - log_N_start) / log_N_step
+    inside = (u >= 0.) & (u <= n_N - 1)
+    u = np.clip(u, 0., n_N - 1)
+    # The log p-values are singular at I0 for shape parameters below one. Interpolating at a fixed value of the grid
+    # variable sqrt(SI - I0) / sqrt_step rather than at fixed SI keeps the singularity on the first column of the
+    # table, and I0 is interpolated on a finer grid to keep its error small.
+    I0 = table[test + "_I0"]
+    sqrt_step = table[test + "_sqrt_step"]
+    refinement = (I0.shape[0] - 1) // (n_N - 1)
+    k = np.minimum(np.floor(u * refinement), I0.shape[0] - 2).astype(np.int64)
+    fk = u * refinement - k
+    v = np.sqrt(np.maximum(SI - ((1. - fk) * I0[k] + fk * I0[k + 1]), 0.))
+    v /= (1. - fk) * sqrt_step[k] + fk * sqrt_step[k + 1]
+    # Below the shift parameter, the p-value is one and log_p[:, 0] is zero
+    inside &= v <= n_SI - 1
+    v = np.minimum(v, n_SI - 1)
+    i = np.minimum(np.floor(u), n_N - 2).astype(np.int64)
+    fu = u - i
+    j = np.minimum(np.floor(v), n_SI - 2).astype(np.int64)
+    fv = v - j
+    result = (1. - fu) * ((1. - fv) * log_p[i, j] + fv * log_p[i, j + 1])
+    result += fu * ((1. - fv) * log_p[i + 1, j] + fv * log_p[i + 1, j + 1])
+    return result, inside
+
+
+def _build_test_table(test, log_N_range, n_N, n_SI, spline_func, log_p_min):
+    """
+    Table of log p-values of a single test with n_N x n_SI grid points.
+    """
+    log_N_step = (log_N_range[1] - log_N_range[0]) / (n_N - 1)
+    log_Ns = log_N_range[0] + log_N_step * np.arange(n_N)
+    log_Ns_fine = log_N_range[0] + log_N_step / PARAMETER_REFINEMENT * np.arange(PARAMETER_REFINEMENT * (n_N - 1) + 1)
+    alpha, beta, I0, sqrt_step = _table_grid(10**log_Ns_fine, test, n_SI, spline_func, log_p_min)
+    log_p = _table_row(10**log_Ns, test, n_SI, spline_func, log_p_min)[2]
+    return {test + "_log10_N_start": np.array(log_N_range[0]), test + "_log10_N_step": np.array(log_N_step),
+            test + "_I0": I0, test + "_sqrt_step": sqrt_step, test + "_log_p": log_p}
+
+
+def _max_error(table, test, spline_func, log_p_min):
+    """
+    Estimate of the largest absolute error of the interpolated log p-values. The error is sampled off the grid, on the
+    rows and at the quarter points of all grid cells in both variables, and multiplied by ERROR_SAFETY_FACTOR for the
+    error between the sampled points. Between rows, the sampled points lie halfway between the grid points of I0,
+    where the interpolation error of I0 is largest. For shape parameters below one, the log p-values vary as
+    :math:`\\sqrt{SI - I_0}` close to I0, such that small errors of the interpolated I0 cause large errors there, which
+    are resolved by additional geometrically spaced points.
+    """
+    log_N_start = float(table[test + "_log10_N_start"])
+    log_N_step = float(table[test + "_log10_N_step"])
+    n_N, n_SI = table[test + "_log_p"].shape
+    log_Ns = log_N_start + log_N_step * np.arange(n_N)
+    offsets = np.array([0., 0.25, 0.5, 0.75]) + 0.5 / PARAMETER_REFINEMENT
+    log_Ns = np.concatenate([log_Ns] + [log_Ns[:-1] + f * log_N_step for f in offsets])
+    # Grid variable sqrt(SI - I0) / sqrt_step of the table
+    v = np.concatenate([2.**(-0.5 * np.arange(60, 0, -1)), 0.25 * np.arange(4 * n_SI - 3)])
+    # Rows are evaluated in blocks to bound the memory
+    block_size = max(1, 2**20 // v.shape[0])
+    max_error = 0.
+    for start in range(0, log_Ns.shape[0], block_size):
+        block = log_Ns[start:start + block_size]
+        alpha, beta, I0, sqrt_step = _table_grid(10**block, test, n_SI, spline_func, log_p_min)
+        x = (sqrt_step[:, None] * v)**2
+        reference = sid.log_cumulative_SID_gamma(x, alpha[:, None], beta[:, None], 0.)
+        log_p, inside = _interpolate(table, test, np.broadcast_to(block[:, None], x.shape), I0[:, None] + x)
+        max_error = max(max_error, np.max(np.abs(log_p - reference)[inside], initial=0.))
+    return ERROR_SAFETY_FACTOR * max_error
+
+
+def build_lookup_table(spline_func=None, tests=TABLE_TESTS, N_range=None, tolerance=TOLERANCE, log_p_min=LOG_P_MIN,
+                       n_N=17, n_SI=257):
+    """
+    Precomputes tables of log p-values on a grid in :math:`\\log_{10} N` and the Shannon information for fast
+    vectorized p-value queries (see p_values()). The grids are refined until the estimated interpolation error of the
+    log p-values (see _max_error()) is below tolerance. The estimate is based on a sample of points off the grid and
+    is not a strict bound.
+
+    Parameters
+    ----------
+    spline_func: dict (optional)
+        Dictionary of spline functions. Output of sid.get_spline() or sid.init(). Default uses sid.get_spline_cache().
+    tests: List of str (optional)
+        Names of statistical tests, see sid.p_values().
+    N_range: tuple (optional)
+        Smallest and largest number of data points covered by the tables. Default is the range of the spline knots.
+    tolerance: float, optional
+        Maximum estimated absolute interpolation error of the natural logarithm of the p-values.
+    log_p_min: float, optional
+        Smallest natural logarithm of the p-values covered by the tables.
+    n_N: int, optional
+        Initial number of grid points in :math:`\\log_{10} N`.
+    n_SI: int, optional
+        Initial number of grid points in the Shannon information.
+    Returns
+    -------
+    table: dict
+        Dictionary of arrays, which can be saved with save_lookup_table(). '<test>_max_error' contains the estimated
+        maximum interpolation error of the log p-values for each test.
+    """
+    if spline_func is None:
+        spline_func = sid.get_spline_cache()
+    if N_range is None:
+        knots = [spline_func[k][na].t for k in spline_func for na in spline_func[k]]
+        log_N_range = (max(t[0] for t in knots), min(t[-1] for t in knots))
+    else:
+        log_N_range = (np.log10(N_range[0]), np.log10(N_range[1]))
+    table = {"log_p_min": np.array(log_p_min)}
+    for test in tests:
+        n_N_test, n_SI_test = n_N, n_SI
+        while True:
+            table_test = _build_test_table(test, log_N_range, n_N_test, n_SI_test, spline_func, log_p_min)
+            error = _max_error(table_test, test, spline_func, log_p_min)
+            if error <= tolerance:
+                break
+            # Refine in SI if the interpolation error on the rows, estimated from second differences, dominates,
+            # otherwise in log10 N
+            error_on_rows = np.max(np.abs(np.diff(table_test[test + "_log_p"], 2, axis=1))) / 8.
+            if error_on_rows > 0.5 * tolerance:
+                n_SI_test = 2 * n_SI_test - 1
+            else:
+                n_N_test = 2 * n_N_test - 1
+            if n_N_test * n_SI_test > MAX_TABLE_SIZE:
+                raise RuntimeError("Lookup table for test \"%s\" exceeds %d entries for tolerance %g"
+                                   % (test, MAX_TABLE_SIZE, tolerance))
+        table.update(table_test)
+        table[test + "_max_error"] = np.array(error)
+    return table
+
+
+def save_lookup_table(table, filename):
+    """
+    Save lookup tables to a packed array file (see io.save_packed_arrays()).
+
+    Parameters
+    ----------
+    table: dict
+        Output of build_lookup_table().
+    filename: str
+        Name of output file.
+    """
+    io.save_packed_arrays(table, filename)
+
+
+def load_lookup_table(filename, mmap=True):
+    """
+    Load lookup tables saved with save_lookup_table().
+
+    Parameters
+    ----------
+    filename: str
+        Name of input file.
+    mmap: bool, optional
+        If true (default), the tables are memory-mapped.
+    Returns
+    -------
+    table: dict
+        Dictionary of arrays, same as output of build_lookup_table().
+    """
+    return io.load_packed_arrays(filename, mmap=mmap)
+
+
+def log_p_values(SI, number_data_points, test, table, spline_func=None):
+    """
+    Vectorized natural logarithm of the p-values of a test by bilinear interpolation in lookup tables. Values outside
+    the tables (numbers of data points outside the range of the tables or p-values below exp(log_p_min)) are
+    calculated directly from the gamma distribution approximation, see sid.p_values().
+
+    Parameters
+    ----------
+    SI: float or array
+        Shannon information values.
+    number_data_points: int or array
+        Number of data points, broadcast against SI.
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    table: dict
+        Lookup tables. Output of build_lookup_table() or load_lookup_table().
+    spline_func: dict (optional)
+        Dictionary of spline functions used for values outside the tables. Default uses sid.get_spline_cache().
+    Returns
+    -------
+    log_p_value: array
+        Natural logarithm of the p-values for given test. Inside the tables, the absolute error is estimated to be at
+        most table['<test>_max_error'].
+    """
+    if test + "_log_p" not in table:
+        raise ValueError("No lookup table for test \"%s\"" % test)
+    SI, number_data_points = np.broadcast_arrays(np.asarray(SI, dtype=np.float64), np.asarray(number_data_points))
+    log_p_value, inside = _interpolate(table, test, np.log10(number_data_points), SI)
+    outside = ~inside
+    if np.any(outside):
+        log_p_value[outside] = sid.log_p_values(SI[outside], number_data_points[outside], test, spline_func)
+    return log_p_value
+
+
+def p_values(SI, number_data_points, test, table, spline_func=None):
+    """
+    Vectorized p-values of a test by interpolation in lookup tables. See log_p_values().
+
+    Parameters
+    ----------
+    SI: float or array
+        Shannon information values.
+    number_data_points: int or array
+        Number of data points, broadcast against SI.
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    table: dict
+        Lookup tables. Output of build_lookup_table() or load_lookup_table().
+    spline_func: dict (optional)
+        Dictionary of spline functions used for values outside the tables. Default uses sid.get_spline_cache().
+    Returns
+    -------
+    p_value: array
+        P-values for given test.
+    """
+    return np.exp(log_p_values(SI, number_data_points, test, table, spline_func))
@@ -0,0 +1,104 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import evaluate
+
+
+def _simulate_block(model_for_residuals, n_sample, seed_sequence, spline_func):
+    """
+    Adds normally distributed noise to the model for the residuals n_sample times and evaluates all tests.
+
+    Parameters
+    ----------
+    model_for_residuals: array
+        1d array containing the model for the normalized residuals (without noise).
+    n_sample: int
+        Number of samples in this block.
+    seed_sequence: numpy.random.SeedSequence
+        Seed of the random number stream of this block.
+    spline_func: dict
+        Dictionary of spline functions, output of sid.init(). If None, sid.get_spline_cache() is used.
+    Returns
+    -------
+    res: structured array
+        Output of evaluate.all_statistical_tests_batch().
+    """
+    rng = np.random.default_rng(seed_sequence)
+    normalized_residuals = rng.standard_normal((n_sample, model_for_residuals.shape[0]))
+    normalized_residuals += model_for_residuals
+    return evaluate.all_statistical_tests_batch(normalized_residuals, spline_func)
+
+
+def statistical_power(model_for_residuals, n_sample, seed=None, n_jobs=1, block_size=None, bins=100,
+                      significance_levels=None, spline_func=None):
+    """
+    Monte Carlo estimate of the statistical power of the chi2, h, hpm, (chi2, h), and (chi2, hpm) tests for a given
+    model for the normalized residuals. Normally distributed noise is added to the model, and the p-values of all
+    tests are collected. Samples are generated and evaluated in blocks, which are distributed across a process pool.
+    Every block has its own random number stream spawned from seed, so results do not depend on n_jobs.
+
+    Parameters
+    ----------
+    model_for_residuals: array
+        1d array containing the model for the normalized residuals (without noise). Use zeros for the true model.
+    n_sample: int
+        Number of samples.
+    seed: int or numpy.random.SeedSequence (optional)
+        Seed for reproducible results.
+    n_jobs: int, optional
+        Number of worker processes. Default is 1, i.e., evaluation in the calling process.
+    block_size: int, optional
+        Number of samples per block. Default keeps blocks at about 2**22 residuals.
+    bins: int, optional
+        Number of bins of the p-value histograms on [0, 1].
+    significance_levels: array, optional
+        Significance levels at which the power is evaluated. Default is 41 logarithmically spaced values from 1e-4 to 1.
+    spline_func: dict (optional)
+        Dictionary of spline functions, output of sid.init(). Default uses sid.get_spline_cache().
+
+    Returns
+    -------
+    power: dict
+        'I' and 'p': dictionaries with the Shannon information and p-values of all samples for each test.
+        'histogram': dictionary with the p-value histograms (probability densities) for each test.
+        'edges': edges of the histogram bins.
+        'significance_levels': significance levels.
+        'power': dictionary with the fraction of samples with p-value at or below each significance level for each
+        test (cumulative histogram of p-values, i.e., the statistical power).
+    """
+    model_for_residuals = np.asarray(model_for_residuals, dtype=np.float64)
+    number_data_points = model_for_residuals.shape[0]
+    if block_size is None:
+        block_size = max(1, 2**22 // max(number_data_points, 1))
+    if significance_levels is None:
+        significance_levels = np.logspace(-4, 0, 41)
+    sizes = [block_size] * (n_sample // block_size)
+    if n_sample % block_size > 0:
+        sizes.append(n_sample % block_size)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+
+    args = ([model_for_residuals] * len(sizes), sizes, seeds, [spline_func] * len(sizes))
+    if n_jobs == 1:
+        blocks = list(map(_simulate_block, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            blocks = list(pool.map(_simulate_block, *args))
+    if len(blocks) > 0:
+        samples = np.concatenate(blocks)
+    else:
+        samples = np.zeros(0, dtype=evaluate._batch_dtype())
+
+    power = {"I": OrderedDict(), "p": OrderedDict(), "histogram": OrderedDict(), "power": OrderedDict(),
+             "significance_levels": significance_levels}
+    for test in evaluate.test_labels:
+        p = np.sort(samples[test]['p'])
+        power["I"][test] = samples[test]['I']
+        power["p"][test] = samples[test]['p']
+        power["histogram"][test], power["edges"] = np.histogram(p, bins=bins, range=(0., 1.), density=True)
+        power["power"][test] = np.searchsorted(p, significance_levels, side='right') / float(max(p.shape[0], 1))
+    return power
@@ -0,0 +1,301 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+
+# Active profiles and callbacks. Stages are only timed while at least one of them is registered.
+_profiles = []
+_callbacks = []
+_enabled = False
+_lock = threading.Lock()
+# Stages currently running, per thread, for the attribution of peak memory to nested stages
+_local = threading.local()
+# Memory traced before tracing was restarted to reset the peak, see _reset_peak()
+_memory_offset = 0
+
+
+def _update_enabled():
+    global _enabled
+    _enabled = len(_profiles) > 0 or len(_callbacks) > 0
+
+
+def _trace_memory():
+    return any(profile.memory for profile in _profiles)
+
+
+def _traced_memory():
+    """
+    Returns the current and peak traced memory in bytes, including the memory traced before tracing was restarted.
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    return current + _memory_offset, peak + _memory_offset
+
+
+def _reset_peak():
+    """
+    Resets the peak traced memory to the current traced memory. Python < 3.9 lacks tracemalloc.reset_peak(), so
+    tracing is restarted and the memory traced so far is kept as offset. Memory allocated before a restart and freed
+    after it is then not subtracted from the traced memory.
+    """
+    global _memory_offset
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+        return
+    current = tracemalloc.get_traced_memory()[0]
+    n_frames = tracemalloc.get_traceback_limit()
+    tracemalloc.stop()
+    tracemalloc.start(n_frames)
+    _memory_offset += current
+
+
+def add_callback(callback):
+    """
+    Registers a function that is called at the end of every profiled stage as callback(stage, elapsed, peak_bytes),
+    with the name of the stage, the wall time in seconds, and the peak memory in bytes allocated during the stage (None
+    unless a Profile with memory=True is active).
+
+    Parameters
+    ----------
+    callback: function
+        Function of the stage name, the wall time, and the peak memory.
+    """
+    with _lock:
+        _callbacks.append(callback)
+        _update_enabled()
+
+
+def remove_callback(callback):
+    """
+    Removes a function registered with add_callback().
+
+    Parameters
+    ----------
+    callback: function
+        Function registered with add_callback().
+    """
+    with _lock:
+        _callbacks.remove(callback)
+        _update_enabled()
+
+
+class _Frame:
+    """
+    Running stage: start time, and traced memory at the start and peak traced memory so far.
+    """
+    __slots__ = ("t0", "start_bytes", "peak_bytes")
+
+
+def _push(frame):
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    frame.start_bytes = frame.peak_bytes = None
+    if tracemalloc.is_tracing():
+        current, peak = _traced_memory()
+        # The peak since the last reset counts for all running stages
+        for parent in stack:
+            if parent.peak_bytes is not None:
+                parent.peak_bytes = max(parent.peak_bytes, peak)
+        _reset_peak()
+        frame.start_bytes = frame.peak_bytes = current
+    stack.append(frame)
+    frame.t0 = time.perf_counter()
+
+
+def _pop(name):
+    elapsed = time.perf_counter() - _local.stack[-1].t0
+    frame = _local.stack.pop()
+    peak_bytes = None
+    if frame.start_bytes is not None and tracemalloc.is_tracing():
+        frame.peak_bytes = max(frame.peak_bytes, _traced_memory()[1])
+        peak_bytes = frame.peak_bytes - frame.start_bytes
+        if len(_local.stack) > 0 and _local.stack[-1].peak_bytes is not None:
+            _local.stack[-1].peak_bytes = max(_local.stack[-1].peak_bytes, frame.peak_bytes)
+        _reset_peak()
+    for profile in list(_profiles):
+        profile.record(name, elapsed, peak_bytes)
+    for callback in list(_callbacks):
+        callback(name, elapsed, peak_bytes)
+
+
+class stage:
+    """
+    Context manager timing a block of code as a named stage, e.g., `with profiling.stage("spline loading"): ...`.
+    Without active profiles or callbacks, only a flag is checked.
+
+    Parameters
+    ----------
+    name: str
+        Name of the stage.
+    """
+    __slots__ = ("name", "active")
+
+    def __init__(self, name):
+        self.name = name
+        self.active = False
+
+    def __enter__(self):
+        if _enabled:
+            self.active = True
+            _push(_Frame())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            self.active = False
+            _pop(self.name)
+        return False
+
+
+def profiled(func):
+    """
+    Decorator recording every call of func as a stage named "<module>.<function>", e.g., "sid.init", or
+    "<module>.<class>.<method>" for methods. Without active profiles or callbacks, the overhead is a single flag check
+    per call.
+    """
+    name = "%s.%s" % (func.__module__.rsplit(".", 1)[-1], func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        _push(_Frame())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _pop(name)
+    return wrapper
+
+
+class Profile:
+    """
+    Records the number of calls, the total wall time, and optionally the peak allocated memory of the stages of the
+    evaluation, i.e., the functions decorated with profiled() and the blocks in stage(), while active. Times of nested
+    stages are included in the time of the enclosing stage. Stages of all threads are recorded, but not those of
+    worker processes.
+
+    Parameters
+    ----------
+    memory: bool, optional
+        If true, the peak memory allocated during each stage is traced with tracemalloc, which also traces NumPy
+        arrays but slows down the evaluation considerably. Default is false.
+
+    Example
+    -------
+    >>> with profiling.Profile() as profile:
+    ...     evaluate.all_statistical_tests(normalized_residuals)
+    >>> profile.to_dict()
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = OrderedDict()
+        self._started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        """
+        Starts recording.
+        """
+        global _memory_offset
+        with _lock:
+            if self.memory and not tracemalloc.is_tracing():
+                _memory_offset = 0
+                tracemalloc.start()
+                self._started_tracing = True
+            _profiles.append(self)
+            _update_enabled()
+
+    def stop(self):
+        """
+        Stops recording.
+        """
+        with _lock:
+            _profiles.remove(self)
+            _update_enabled()
+            if self._started_tracing and not _trace_memory():
+                tracemalloc.stop()
+            self._started_tracing = False
+
+    def record(self, name, elapsed, peak_bytes=None):
+        """
+        Adds a call of a stage.
+
+        Parameters
+        ----------
+        name: str
+            Name of the stage.
+        elapsed: float
+            Wall time in seconds.
+        peak_bytes: int (optional)
+            Peak memory in bytes allocated during the stage.
+        """
+        with _lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = OrderedDict([("calls", 0), ("time", 0.), ("peak_bytes", None)])
+            entry["calls"] += 1
+            entry["time"] += elapsed
+            if peak_bytes is not None:
+                entry["peak_bytes"] = max(entry["peak_bytes"] or 0, peak_bytes)
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        stages: dict
+            Number of calls ('calls'), total wall time in seconds ('time'), and largest peak memory in bytes allocated
+            during a call ('peak_bytes', None if not traced) of each stage, in the order of the first completed call.
+        """
+        with _lock:
+            return OrderedDict((name, OrderedDict(entry)) for name, entry in self.stages.items())
+
+    def write_json_lines(self, fp):
+        """
+        Writes one JSON object per stage with the keys 'stage', 'calls', 'time', and 'peak_bytes'.
+
+        Parameters
+        ----------
+        fp: file object
+            Open text file.
+        """
+        for name, entry in self.to_dict().items():
+            fp.write(json.dumps(OrderedDict([("stage", name)] + list(entry.items()))) + "\n")
+
+    def save(self, filename):
+        """
+        Saves the stages to a JSON lines file, see write_json_lines().
+
+        Parameters
+        ----------
+        filename: str
+            Name of output file.
+        """
+        with open(filename, "w") as fp:
+            self.write_json_lines(fp)
+
+    def format_table(self):
+        """
+        Returns
+        -------
+        str
+            Table of the stages, sorted by decreasing total time.
+        """
+        lines = ["%-40s %8s %12s %12s" % ("stage", "calls", "time [ms]", "peak [MiB]")]
+        for name, entry in sorted(self.to_dict().items(), key=lambda item: -item[1]["time"]):
+            peak = "-" if entry["peak_bytes"] is None else "%.3f" % (entry["peak_bytes"] / 2.**20)
+            lines.append("%-40s %8d %12.3f %12s" % (name, entry["calls"], 1e3 * entry["time"], peak))
+        return "\n".join(lines)
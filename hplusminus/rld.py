@@ -1,23 +1,113 @@
 # Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
 # Released under the MIT Licence, see the file LICENSE.txt.
 
+from collections import namedtuple
+from functools import lru_cache
+import importlib.util
+import math
+import threading
 import numpy as np
-import scipy
-import mpmath
-# Numba-acceleration turns out slightly beneficial, however it is completely optional:
-try:
-    from numba import jit
-except:
-    def jit(**kwargs):
-        def wrap(func):
-            return func
-        return wrap
+import scipy.special
+from . import profiling
+# Numba-acceleration turns out slightly beneficial, however it is completely optional. Importing numba and compiling
+# the kernels is deferred to their first use (see _require_numba()), so that importing this module stays fast:
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
+# Names and options of the functions compiled with numba by _require_numba()
+_numba_functions = []
+_numba_lock = threading.Lock()
+_numba_compiled = False
 
 
-mpmath.mp.prec = 100
+def jit(**kwargs):
+    """
+    Registers a function for compilation with numba.jit(**kwargs) on first use of the numba kernels. Until then, and
+    if numba is not available, the function runs as plain Python.
+    """
+    def wrap(func):
+        _numba_functions.append((func.__name__, kwargs))
+        return func
+    return wrap
+
+
+def _require_numba():
+    """
+    Imports numba and replaces the functions registered with jit() by their compiled versions, once per process.
+    Calls between registered functions are resolved by numba when the callers are compiled, i.e., after all functions
+    have been replaced.
+
+    Returns
+    -------
+    bool
+        True if numba is available.
+    """
+    global HAVE_NUMBA, _numba_compiled
+    if _numba_compiled or not HAVE_NUMBA:
+        return HAVE_NUMBA
+    with _numba_lock:
+        if not _numba_compiled:
+            try:
+                import numba
+            except ImportError:
+                HAVE_NUMBA = False
+                return False
+            for name, kwargs in _numba_functions:
+                globals()[name] = numba.jit(**kwargs)(globals()[name])
+            _numba_compiled = True
+    return True
+
+
+# Precision in bits of the mpmath evaluation of the hypergeometric normalization in SI_number_of_positive_signs().
+# Only set within a local mpmath.workprec() context.
+MPMATH_PRECISION = 100
 
 
-def get_run_length_distributions(sc):
+class SparseHistogram(namedtuple("SparseHistogram", ["lengths", "counts"])):
+    """
+    Sparse run-length histogram containing only the run lengths that occur and their counts.
+    Accepted by SI_h(), SI_hpm(), and SI_RLD_conditional() in place of dense histograms.
+
+    Attributes
+    ----------
+    lengths: array
+        Sorted distinct run lengths.
+    counts: array
+        Number of runs of each length.
+    """
+    __slots__ = ()
+
+    def sum(self):
+        """
+        Returns
+        -------
+        int
+            Total number of runs.
+        """
+        return self.counts.sum()
+
+    def to_dense(self, n_bins):
+        """
+        Returns
+        -------
+        array
+            Dense histogram with n_bins bins, where bin i counts the runs of length i.
+        """
+        histo = np.zeros(n_bins, dtype=np.int64)
+        histo[self.lengths] = self.counts
+        return histo
+
+
+def _histogram_counts(histo):
+    """
+    Returns the nonzero counts of a dense or sparse run-length histogram.
+    """
+    if isinstance(histo, SparseHistogram):
+        return histo.counts
+    histo = np.asarray(histo)
+    return histo[histo > 0]
+
+
+@profiling.profiled
+def get_run_length_distributions(sc, sparse=False, histograms=None):
     """
     Given a sequence of signs, we calculate run lengths and run length-histograms. Runs are continous sequences of all signs +1 or all signs -1.
 
@@ -25,6 +115,10 @@ def get_run_length_distributions(sc):
     ----------
     sc: array like
         List of signs (:math:`\pm 1`)
+    sparse: bool, optional
+        If true, histograms are returned as SparseHistogram objects, with memory and time scaling with the number of distinct run lengths instead of the number of signs, and edges is None. Default is false.
+    histograms: list of str (optional)
+        Names of the histograms to calculate, any of 'all', 'minus', and 'plus'. Default calculates all histograms.
     Returns
     -------
     num: array like
@@ -34,57 +128,573 @@ def get_run_length_distributions(sc):
     histo: dict
         Dictionary of histograms of run length for :math:`s_i=+1` ('plus'), :math:`s_i=-1` ('minus'), and both ('all').
     edges: numpy array
-        Edges of the histogram bins.
+        Edges of the histogram bins. None for sparse histograms.
     """
     run_lengths = {}
     histo = {}
     Ns = sc.shape[0]
-    keys = ['all', 'minus', 'plus']
+    keys = ['all', 'minus', 'plus'] if histograms is None else [k for k in ['all', 'minus', 'plus'] if k in histograms]
     b = np.where(sc[:-1] != sc[1:])[0]
-    a = np.zeros(b.shape[0] + 2, dtype=np.int)
+    a = np.zeros(b.shape[0] + 2, dtype=np.int64)
     a[0] = -1
     a[-1] = Ns - 1
 
     a[1:-1] = b
     run_lengths['all'] = a[1:] - a[:-1]
     nc = run_lengths['all'].shape[0]
-    dummy = 0
-    if sc[0] == 1:
-        run_lengths['plus'] = run_lengths['all'][dummy::2]
-        run_lengths['minus'] = run_lengths['all'][1 - dummy::2]
-    elif sc[0] == -1:
-        run_lengths['minus'] = run_lengths['all'][dummy::2]
-        run_lengths['plus'] = run_lengths['all'][1 - dummy::2]
+    # Each run takes the sign of its first element. As in get_run_length_statistics(), runs of zeros (and NaN) are
+    # separate runs that count as negative, so runs do not necessarily alternate in sign.
+    run_plus = sc[a[:-1] + 1] > 0 if Ns > 0 else np.zeros(nc, dtype=bool)
+    run_lengths['plus'] = run_lengths['all'][run_plus]
+    run_lengths['minus'] = run_lengths['all'][~run_plus]
 
     ncPlus = run_lengths['plus'].shape[0]
     nPlus = run_lengths['plus'].sum()
     nMinus = run_lengths['minus'].sum()
     num = [nc, nPlus, ncPlus]
 
-    for k in keys:
-        histo[k], edges = np.histogram(run_lengths[k], bins=Ns + 1, range=(0, Ns + 1))
+    edges = None
+    if sparse:
+        for k in keys:
+            histo[k] = SparseHistogram(*np.unique(run_lengths[k], return_counts=True))
+    else:
+        for k in keys:
+            histo[k], edges = np.histogram(run_lengths[k], bins=Ns + 1, range=(0, Ns + 1))
     return num, run_lengths, histo, edges
 
 
-def log_binomial(N, n):
+def _sum_log_factorial_of_counts(run_seq, run_lengths, n_seq):
     """
+    Sum of :math:`\\ln h_i!` over all bins of the run-length histograms of several sequences.
+
+    Parameters
+    ----------
+    run_seq: array
+        Index of the sequence each run belongs to.
+    run_lengths: array
+        Lengths of the runs.
+    n_seq: int
+        Number of sequences.
     Returns
     -------
-    float
-       The natural logarithm of the binomial coefficient :math:`{N \choose n}`.
+    array
+        For each sequence, :math:`\\sum_i \\ln h_i!` where :math:`h_i` is the number of runs of length i.
+    """
+    if run_lengths.shape[0] == 0:
+        return np.zeros(n_seq)
+    stride = np.int64(run_lengths.max()) + 1
+    keys, counts = np.unique(run_seq * stride + run_lengths, return_counts=True)
+    return np.bincount(keys // stride, weights=scipy.special.gammaln(counts + 1), minlength=n_seq)
+
+
+def get_run_length_statistics(signs, offsets=None):
+    """
+    Vectorized run-length statistics for one or several sign sequences. The sequences are either given as rows of a
+    2d array or stored back to back in a 1d array with their boundaries given by offsets.
+
+    Parameters
+    ----------
+    signs: array
+        1d or 2d array of signs (:math:`\\pm 1`). Rows of a 2d array are treated as separate sequences.
+    offsets: array, optional
+        For 1d signs, start index of each sequence followed by the total length, i.e., sequence i is
+        signs[offsets[i]:offsets[i + 1]]. Default is a single sequence.
+    Returns
+    -------
+    stats: dict
+        Dictionary of arrays with one entry per sequence: number of signs ('N'), number of runs ('nc'), number of
+        positive runs ('ncPlus'), number of positive signs ('nPlus'), and :math:`\\sum_i \\ln h_i!` of the run-length
+        histograms of all ('lfh_all'), positive ('lfh_plus'), and negative ('lfh_minus') runs.
+    """
+    signs = np.asarray(signs)
+    if signs.ndim == 2:
+        offsets = np.arange(signs.shape[0] + 1, dtype=np.int64) * signs.shape[1]
+        signs = signs.ravel()
+    elif offsets is None:
+        offsets = np.array([0, signs.shape[0]], dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_seq = offsets.shape[0] - 1
+    Ns = np.diff(offsets)
+
+    is_start = np.ones(signs.shape[0], dtype=bool)
+    np.not_equal(signs[1:], signs[:-1], out=is_start[1:])
+    is_start[offsets[:-1][Ns > 0]] = True
+    starts = np.flatnonzero(is_start)
+    run_lengths = np.diff(np.append(starts, signs.shape[0]))
+    run_seq = np.searchsorted(offsets, starts, side='right') - 1
+    run_plus = signs[starts] > 0
+
+    stats = {}
+    stats['N'] = Ns
+    stats['nc'] = np.bincount(run_seq, minlength=n_seq)
+    stats['ncPlus'] = np.bincount(run_seq[run_plus], minlength=n_seq)
+    stats['nPlus'] = np.bincount(run_seq[run_plus], weights=run_lengths[run_plus], minlength=n_seq).astype(np.int64)
+    stats['lfh_all'] = _sum_log_factorial_of_counts(run_seq, run_lengths, n_seq)
+    stats['lfh_plus'] = _sum_log_factorial_of_counts(run_seq[run_plus], run_lengths[run_plus], n_seq)
+    stats['lfh_minus'] = _sum_log_factorial_of_counts(run_seq[~run_plus], run_lengths[~run_plus], n_seq)
+    return stats
+
+
+# Kernels available for get_residual_statistics()
+KERNELS = ("numba", "numpy")
+# Kernel used by get_residual_statistics() by default, see set_kernel()
+_default_kernel = "numba" if HAVE_NUMBA else "numpy"
+
+
+def set_kernel(kernel):
     """
-    lb = (np.log(np.arange(N - n + 1, N + 1))).sum()
-    lb -= (np.log(np.arange(1, n + 1))).sum()
-    return lb
+    Sets the kernel used by get_residual_statistics() by default.
+
+    Parameters
+    ----------
+    kernel: str
+        "numba" for the compiled single-pass kernel (requires numba) or "numpy" for the vectorized NumPy implementation.
+    """
+    global _default_kernel
+    if kernel not in KERNELS:
+        raise ValueError("Kernel \"%s\" not available, use one of %s" % (kernel, ", ".join(KERNELS)))
+    if kernel == "numba" and not HAVE_NUMBA:
+        raise ValueError("Kernel \"numba\" requires the numba package")
+    _default_kernel = kernel
+
+
+def get_kernel():
+    """
+    Returns
+    -------
+    str
+        The kernel used by get_residual_statistics() by default.
+    """
+    return _default_kernel
+
+
+# Run lengths up to this value are counted in dense arrays by the kernels, longer runs are collected in a list
+_DENSE_RUN_LENGTH = 4096
+
+
+@jit(nopython=True)
+def _grow_columns(a, capacity):
+    """
+    Returns a copy of the 2d array a with the number of columns increased to capacity.
+    """
+    grown = np.zeros((a.shape[0], capacity), dtype=a.dtype)
+    grown[:, :a.shape[1]] = a
+    return grown
+
+
+@jit(nopython=True)
+def _residual_statistics_kernel(normalized_residuals, offsets, nc, ncPlus, nPlus, chi_square, lfh):
+    """
+    Single pass over the normalized residuals of each sequence, accumulating chi2 and the runs of equal signs (as
+    given by np.sign()). Run lengths up to _DENSE_RUN_LENGTH are counted in dense arrays, which are reset for the
+    occurring run lengths after each sequence, and longer runs are collected in a list.
+    """
+    counts = np.zeros((2, _DENSE_RUN_LENGTH + 1), dtype=np.int64)  # plus, minus
+    touched = np.zeros(_DENSE_RUN_LENGTH + 1, dtype=np.int64)
+    long_runs = np.zeros((2, 16), dtype=np.int64)  # length, k
+    for q in range(offsets.shape[0] - 1):
+        n_touched = 0
+        n_long = 0
+        length = 0
+        sign = 0.
+        for i in range(offsets[q], offsets[q + 1] + 1):
+            s = 0.
+            if i < offsets[q + 1]:
+                r = normalized_residuals[i]
+                chi_square[q] += r * r
+                if r > 0.:
+                    s = 1.
+                elif r < 0.:
+                    s = -1.
+                elif r == 0.:
+                    s = 0.
+                else:
+                    s = r
+                # As np.sign() followed by a comparison of neighbors, NaN always starts a new run
+                if length > 0 and s == sign:
+                    length += 1
+                    continue
+            if length > 0:
+                k = 0 if sign > 0. else 1
+                if length <= _DENSE_RUN_LENGTH:
+                    if counts[0, length] == 0 and counts[1, length] == 0:
+                        touched[n_touched] = length
+                        n_touched += 1
+                    counts[k, length] += 1
+                else:
+                    if n_long == long_runs.shape[1]:
+                        long_runs = _grow_columns(long_runs, 2 * n_long)
+                    long_runs[0, n_long] = length
+                    long_runs[1, n_long] = k
+                    n_long += 1
+                nc[q] += 1
+                if k == 0:
+                    ncPlus[q] += 1
+                    nPlus[q] += length
+            sign = s
+            length = 1
+        for t in range(n_touched):
+            length = touched[t]
+            lfh[0, q] += math.lgamma(counts[0, length] + counts[1, length] + 1)
+            lfh[1, q] += math.lgamma(counts[0, length] + 1)
+            lfh[2, q] += math.lgamma(counts[1, length] + 1)
+            counts[0, length] = 0
+            counts[1, length] = 0
+        if n_long > 0:
+            order = np.argsort(long_runs[0, :n_long])
+            t = 0
+            while t < n_long:
+                length = long_runs[0, order[t]]
+                c = np.zeros(2, dtype=np.int64)
+                while t < n_long and long_runs[0, order[t]] == length:
+                    c[long_runs[1, order[t]]] += 1
+                    t += 1
+                lfh[0, q] += math.lgamma(c[0] + c[1] + 1)
+                lfh[1, q] += math.lgamma(c[0] + 1)
+                lfh[2, q] += math.lgamma(c[1] + 1)
+
+
+def _segment_sums_of_squares(normalized_residuals, offsets):
+    """
+    Returns the sum of squares of each segment normalized_residuals[offsets[i]:offsets[i + 1]], zero for empty segments.
+    """
+    chi_square = np.zeros(offsets.shape[0] - 1)
+    nonempty = np.diff(offsets) > 0
+    if np.any(nonempty):
+        chi_square[nonempty] = np.add.reduceat(normalized_residuals**2, offsets[:-1][nonempty])
+    return chi_square
+
+
+@profiling.profiled
+def get_residual_statistics(normalized_residuals, offsets=None, kernel=None):
+    """
+    Vectorized run-length statistics of the signs and sums of squares for one or several sequences of normalized
+    residuals, see get_run_length_statistics(). With the numba kernel, all statistics are obtained in a single pass
+    over the residuals, without intermediate arrays of signs or run boundaries.
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        1d or 2d array of normalized residuals. Rows of a 2d array are treated as separate sequences.
+    offsets: array, optional
+        For 1d residuals, start index of each sequence followed by the total length. Default is a single sequence.
+    kernel: str (optional)
+        "numba" or "numpy". Default is set by set_kernel(), numba if available.
+    Returns
+    -------
+    stats: dict
+        Run-length statistics in the format of get_run_length_statistics(), and the sums of the squared normalized
+        residuals ('chi_square').
+    """
+    if kernel is None:
+        kernel = _default_kernel
+    if kernel not in KERNELS:
+        raise ValueError("Kernel \"%s\" not available, use one of %s" % (kernel, ", ".join(KERNELS)))
+    normalized_residuals = np.asarray(normalized_residuals, dtype=np.float64)
+    if normalized_residuals.ndim == 2:
+        offsets = np.arange(normalized_residuals.shape[0] + 1, dtype=np.int64) * normalized_residuals.shape[1]
+        normalized_residuals = normalized_residuals.ravel()
+    elif offsets is None:
+        offsets = np.array([0, normalized_residuals.shape[0]], dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    if kernel == "numpy":
+        stats = get_run_length_statistics(np.sign(normalized_residuals), offsets)
+        stats['chi_square'] = _segment_sums_of_squares(normalized_residuals, offsets)
+        return stats
+
+    if not _require_numba():
+        raise ValueError("Kernel \"numba\" requires the numba package")
+    n_seq = offsets.shape[0] - 1
+    Ns = np.diff(offsets)
+    stats = {}
+    stats['N'] = Ns
+    stats['nc'] = np.zeros(n_seq, dtype=np.int64)
+    stats['ncPlus'] = np.zeros(n_seq, dtype=np.int64)
+    stats['nPlus'] = np.zeros(n_seq, dtype=np.int64)
+    stats['chi_square'] = np.zeros(n_seq)
+    lfh = np.zeros((3, n_seq))
+    _residual_statistics_kernel(np.ascontiguousarray(normalized_residuals), offsets, stats['nc'], stats['ncPlus'],
+                                stats['nPlus'], stats['chi_square'], lfh)
+    stats['lfh_all'], stats['lfh_plus'], stats['lfh_minus'] = lfh
+    return stats
+
+
+# Policies for exact zeros of the normalized residuals in get_segment_statistics()
+ZERO_POLICIES = ("drop", "break", "random", "previous")
+
+
+@jit(nopython=True)
+def _random_sign(seed, index):
+    """
+    Pseudo-random sign for a position of the residuals from the SplitMix64 hash of seed and index, so that it does not
+    depend on the order of evaluation. Same as _random_signs().
+    """
+    z = seed + np.uint64(index + 1) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return 1. if (z >> np.uint64(63)) == np.uint64(1) else -1.
+
+
+def _random_signs(seed, index):
+    """
+    Vectorized version of _random_sign().
+    """
+    with np.errstate(over='ignore'):
+        z = np.uint64(seed) + (index.astype(np.uint64) + np.uint64(1)) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return np.where((z >> np.uint64(63)) == 1, 1., -1.)
 
 
 @jit(nopython=True)
-def log_multinomial_kernel(log_N_vec, nvec, len_nvec):
-    lm = 0.
-    for i in range(len_nvec):
-        for j in range(nvec[i]):
-            lm -= log_N_vec[j]
-    return lm
+def _segment_statistics_kernel(normalized_residuals, policy, seed):
+    """
+    Single pass over the normalized residuals, splitting them into segments at NaN (and at zeros for the "break"
+    policy) and accumulating chi2 and the run-length statistics of each segment. Zeros are skipped ("drop"), given a
+    random sign ("random"), or given the sign of the preceding residual ("previous"; leading zeros of a segment are
+    added to its first run). Run lengths up to _DENSE_RUN_LENGTH are counted in dense arrays, which are reset for the
+    occurring run lengths at the end of each segment, and longer runs are collected in a list.
+    """
+    n = normalized_residuals.shape[0]
+    out_int = np.zeros((6, 16), dtype=np.int64)  # start, stop, N, nc, ncPlus, nPlus
+    out_float = np.zeros((4, 16))  # chi_square, lfh_all, lfh_plus, lfh_minus
+    counts = np.zeros((2, _DENSE_RUN_LENGTH + 1), dtype=np.int64)  # plus, minus
+    touched = np.zeros(_DENSE_RUN_LENGTH + 1, dtype=np.int64)
+    long_runs = np.zeros((2, 16), dtype=np.int64)  # length, k
+    n_seg = 0
+    in_segment = False
+    start = last = N = nc = ncPlus = nPlus = n_touched = n_long = length = pending = 0
+    chi_square = 0.
+    sign = 0.
+    for i in range(n + 1):
+        end_segment = False
+        zero_pending = False
+        r = 0.
+        s = 0.
+        if i == n:
+            end_segment = True
+        else:
+            r = normalized_residuals[i]
+            if r > 0.:
+                s = 1.
+            elif r < 0.:
+                s = -1.
+            elif r == 0.:
+                if policy == 0:
+                    continue
+                elif policy == 1:
+                    end_segment = True
+                elif policy == 2:
+                    s = _random_sign(seed, i)
+                else:
+                    zero_pending = True
+            else:
+                end_segment = True
+        if end_segment:
+            if not in_segment:
+                continue
+            in_segment = False
+            if length > 0:
+                k = 0 if sign > 0. else 1
+                if length <= _DENSE_RUN_LENGTH:
+                    if counts[0, length] == 0 and counts[1, length] == 0:
+                        touched[n_touched] = length
+                        n_touched += 1
+                    counts[k, length] += 1
+                else:
+                    if n_long == long_runs.shape[1]:
+                        long_runs = _grow_columns(long_runs, 2 * n_long)
+                    long_runs[0, n_long] = length
+                    long_runs[1, n_long] = k
+                    n_long += 1
+                nc += 1
+                if k == 0:
+                    ncPlus += 1
+                    nPlus += length
+            lfh_all = 0.
+            lfh_plus = 0.
+            lfh_minus = 0.
+            for t in range(n_touched):
+                length = touched[t]
+                lfh_all += math.lgamma(counts[0, length] + counts[1, length] + 1)
+                lfh_plus += math.lgamma(counts[0, length] + 1)
+                lfh_minus += math.lgamma(counts[1, length] + 1)
+                counts[0, length] = 0
+                counts[1, length] = 0
+            if n_long > 0:
+                order = np.argsort(long_runs[0, :n_long])
+                t = 0
+                while t < n_long:
+                    length = long_runs[0, order[t]]
+                    c = np.zeros(2, dtype=np.int64)
+                    while t < n_long and long_runs[0, order[t]] == length:
+                        c[long_runs[1, order[t]]] += 1
+                        t += 1
+                    lfh_all += math.lgamma(c[0] + c[1] + 1)
+                    lfh_plus += math.lgamma(c[0] + 1)
+                    lfh_minus += math.lgamma(c[1] + 1)
+            # Segments of zeros only carry no sign information with the "previous" policy and are skipped
+            if N > 0:
+                if n_seg == out_int.shape[1]:
+                    out_int = _grow_columns(out_int, 2 * n_seg)
+                    out_float = _grow_columns(out_float, 2 * n_seg)
+                out_int[0, n_seg] = start
+                out_int[1, n_seg] = last + 1
+                out_int[2, n_seg] = N
+                out_int[3, n_seg] = nc
+                out_int[4, n_seg] = ncPlus
+                out_int[5, n_seg] = nPlus
+                out_float[0, n_seg] = chi_square
+                out_float[1, n_seg] = lfh_all
+                out_float[2, n_seg] = lfh_plus
+                out_float[3, n_seg] = lfh_minus
+                n_seg += 1
+            continue
+        if not in_segment:
+            in_segment = True
+            start = i
+            N = nc = ncPlus = nPlus = n_touched = n_long = length = pending = 0
+            chi_square = 0.
+        last = i
+        if zero_pending:
+            if length == 0:
+                pending += 1
+                continue
+            s = sign
+        chi_square += r * r
+        N += 1
+        if length > 0 and s == sign:
+            length += 1
+            continue
+        if length > 0:
+            k = 0 if sign > 0. else 1
+            if length <= _DENSE_RUN_LENGTH:
+                if counts[0, length] == 0 and counts[1, length] == 0:
+                    touched[n_touched] = length
+                    n_touched += 1
+                counts[k, length] += 1
+            else:
+                if n_long == long_runs.shape[1]:
+                    long_runs = _grow_columns(long_runs, 2 * n_long)
+                long_runs[0, n_long] = length
+                long_runs[1, n_long] = k
+                n_long += 1
+            nc += 1
+            if k == 0:
+                ncPlus += 1
+                nPlus += length
+        sign = s
+        length = 1 + pending
+        N += pending
+        pending = 0
+    return out_int[:, :n_seg], out_float[:, :n_seg]
+
+
+def _segment_statistics_numpy(normalized_residuals, policy, seed):
+    """
+    NumPy implementation of _segment_statistics_kernel(), with the same output.
+    """
+    n = normalized_residuals.shape[0]
+    index = np.arange(n)
+    signs = np.sign(normalized_residuals)
+    zero = signs == 0.
+    boundary = np.isnan(normalized_residuals)
+    if policy == "break":
+        boundary |= zero
+    segment_start = ~boundary & np.concatenate([[True], boundary[:-1]])
+    counted = ~boundary
+    if policy == "drop":
+        counted &= ~zero
+    elif policy == "random":
+        signs[zero] = _random_signs(seed, index[zero])
+    elif policy == "previous":
+        # First and one past the last index of the segment of each residual
+        first = np.maximum.accumulate(np.where(segment_start, index, 0))
+        segment_end = ~boundary & np.concatenate([boundary[1:], [True]])
+        end = np.minimum.accumulate(np.where(segment_end, index + 1, n)[::-1])[::-1]
+        signed = ~boundary & ~zero
+        previous = np.maximum.accumulate(np.where(signed, index, -1))
+        following = np.minimum.accumulate(np.where(signed, index, n)[::-1])[::-1]
+        fill = np.where(previous >= first, previous, following)
+        counted &= fill < end
+        signs[zero & counted] = signs[fill[zero & counted]]
+    segment = np.cumsum(segment_start) - 1
+    selected = np.flatnonzero(counted)
+    first_of_segment = np.flatnonzero(np.diff(np.concatenate([[-1], segment[selected]])) != 0)
+    offsets = np.append(first_of_segment, selected.shape[0])
+    stats = get_run_length_statistics(signs[selected], offsets)
+    stats['chi_square'] = _segment_sums_of_squares(np.where(zero, 0., normalized_residuals)[selected], offsets)
+    stats['start'] = selected[offsets[:-1]]
+    stats['stop'] = selected[offsets[1:] - 1] + 1
+    # With the "previous" policy, leading zeros of a segment are part of it
+    if policy == "previous" and stats['start'].shape[0] > 0:
+        stats['start'] = first[stats['start']]
+    return stats
+
+
+@profiling.profiled
+def get_segment_statistics(normalized_residuals, zeros="break", seed=0, kernel=None):
+    """
+    Run-length statistics and sums of squares of the gap-free segments of a series of normalized residuals with an
+    explicit policy for exact zeros, whose sign is undefined. NaN values mark gaps and split the series into segments,
+    which are treated as independent data sets.
+
+    Parameters
+    ----------
+    normalized_residuals: array
+        1d array of normalized residuals, possibly containing zeros and NaN.
+    zeros: str, optional
+        Policy for exact zeros: "drop" removes them, "break" (default) splits the series at zeros like at NaN,
+        "random" assigns a random sign, and "previous" assigns the sign of the preceding residual (the following one
+        for leading zeros of a segment).
+    seed: int, optional
+        Seed of the random signs. The sign of a zero depends only on seed and its position.
+    kernel: str (optional)
+        "numba" or "numpy". Default is set by set_kernel(), numba if available.
+    Returns
+    -------
+    stats: dict
+        Statistics of each segment in the format of get_residual_statistics(), and the first ('start') and one past
+        the last index ('stop') of each segment. Segments without counted residuals are omitted.
+    """
+    if zeros not in ZERO_POLICIES:
+        raise ValueError("Policy \"%s\" for zeros not available, use one of %s" % (zeros, ", ".join(ZERO_POLICIES)))
+    if kernel is None:
+        kernel = _default_kernel
+    if kernel not in KERNELS:
+        raise ValueError("Kernel \"%s\" not available, use one of %s" % (kernel, ", ".join(KERNELS)))
+    normalized_residuals = np.asarray(normalized_residuals, dtype=np.float64)
+    if normalized_residuals.ndim != 1:
+        raise ValueError("normalized_residuals must be a 1d array, got %d dimension(s)" % normalized_residuals.ndim)
+    if kernel == "numpy":
+        return _segment_statistics_numpy(normalized_residuals, zeros, seed)
+    if not _require_numba():
+        raise ValueError("Kernel \"numba\" requires the numba package")
+    out_int, out_float = _segment_statistics_kernel(np.ascontiguousarray(normalized_residuals),
+                                                    ZERO_POLICIES.index(zeros), np.uint64(seed))
+    stats = {}
+    for i, key in enumerate(['start', 'stop', 'N', 'nc', 'ncPlus', 'nPlus']):
+        stats[key] = out_int[i].copy()
+    for i, key in enumerate(['chi_square', 'lfh_all', 'lfh_plus', 'lfh_minus']):
+        stats[key] = out_float[i].copy()
+    return stats
+
+
+def log_binomial(N, n):
+    """
+    Parameters
+    ----------
+    N: int or array
+    n: int or array
+    Returns
+    -------
+    float or array
+       The natural logarithm of the binomial coefficient :math:`{N \\choose n}`, evaluated in O(1) via :math:`\\ln\\Gamma`.
+    """
+    return scipy.special.gammaln(N + 1) - scipy.special.gammaln(n + 1) - scipy.special.gammaln(N - n + 1)
 
 
 def log_multinomial(N, nvec):
@@ -92,12 +702,9 @@ def log_multinomial(N, nvec):
     Returns
     -------
     float
-        The natural logarithm of the multinomial coefficient :math:`{N \choose \prod_i nvec_i}`.
+        The natural logarithm of the multinomial coefficient :math:`{N \\choose \\prod_i nvec_i}`.
     """
-    x = np.log(np.arange(1, N + 1))
-    lm = x.sum()
-    lm += log_multinomial_kernel(x, nvec, nvec.shape[0])
-    return lm
+    return scipy.special.gammaln(N + 1) - scipy.special.gammaln(np.asarray(nvec) + 1).sum()
 
 
 def SI_number_of_runs(N, nc):
@@ -144,39 +751,58 @@ def SI_number_of_positive_runs(ncPlus, nc, N):
         return 0.  # DANGER -log(0)
 
 
-def SI_number_of_positive_signs(N, nPlus, nc, ncPlus):
+@lru_cache(maxsize=4096)
+def _log_norm_positive_signs_mpmath(N, ncPlus, ncMinus):
+    """
+    Natural logarithm of the normalization :math:`\\sum_{n^+} {n^+-1 \\choose n_c^+-1}{N-n^+-1 \\choose n_c^--1}` of the
+    distribution of the number of positive signs, evaluated with mpmath via :math:`{}_2F_1(\\ldots;1)`. Memoized.
+    """
+    if ncMinus > 1:
+        import mpmath
+        with profiling.stage("rld.hyp2f1"), mpmath.workprec(MPMATH_PRECISION):
+            h2f1 = mpmath.log(mpmath.hyp2f1(ncPlus, ncPlus + ncMinus - N, 1 + ncPlus - N, 1))
+            return float(log_binomial(N - 1 - ncPlus, ncMinus - 1) + h2f1)
+    else:
+        return float(log_binomial(N - 1, ncPlus - 1) + np.log((N - ncPlus) / float(ncPlus)))
+
+
+def SI_number_of_positive_signs(N, nPlus, nc, ncPlus, method="closed_form"):
     """
     Parameters
     ----------
-    N: int
+    N: int or array
         Total number of signs.
-    nPlus: int
+    nPlus: int or array
         Number of positive signs.
-    nc: int
+    nc: int or array
         Number of runs.
-    ncPlus: int
+    ncPlus: int or array
         Number of runs with positive signs.
+    method: str, optional
+        Evaluation of the normalization. "closed_form" (default) uses the Chu-Vandermonde identity
+        :math:`\\sum_{n^+} {n^+-1 \\choose n_c^+-1}{N-n^+-1 \\choose n_c^--1} = {N-1 \\choose n_c-1}` in double precision.
+        "mpmath" evaluates the equivalent hypergeometric function :math:`{}_2F_1(n_c^+, n_c-N; 1+n_c^+-N; 1)` with mpmath,
+        and is kept for validation.
     Returns
     -------
-    float
+    float or array
         Neg. log-probability observing nPlus signs with +1, given N signs, nc runs, and ncPlus runs with signs +1.
     """
-
+    N, nPlus, nc, ncPlus = np.broadcast_arrays(*[np.asarray(x, dtype=np.int64) for x in (N, nPlus, nc, ncPlus)])
     ncMinus = nc - ncPlus
     nMinus = N - nPlus
-    if nc > 1:
-        if ncMinus > 1:
-            h2f1 = -mpmath.log(mpmath.hyp2f1(ncPlus, ncPlus + ncMinus - N, 1 + ncPlus - N, 1))
-            norm = -log_binomial(N - 1 - ncPlus, ncMinus - 1) + h2f1
-        else:
-            norm = -log_binomial(N - 1, ncPlus - 1) - np.log((N - ncPlus) / float(ncPlus))
-
-        res = -log_binomial(nPlus - 1, ncPlus - 1) - log_binomial(nMinus - 1, ncMinus - 1) - norm
-        return res
-    elif nc == 1:
-        return 0.
+    if method == "closed_form":
+        norm = log_binomial(N - 1, nc - 1)
+    elif method == "mpmath":
+        norm = np.array([_log_norm_positive_signs_mpmath(*map(int, x)) if x[1] + x[2] > 1 else 0.
+                         for x in zip(N.flat, ncPlus.flat, ncMinus.flat)]).reshape(N.shape)
     else:
-        return 0.
+        raise ValueError("unknown method \"%s\"" % method)
+    with np.errstate(invalid='ignore'):
+        res = np.where(nc > 1, -log_binomial(nPlus - 1, ncPlus - 1) - log_binomial(nMinus - 1, ncMinus - 1) + norm, 0.)
+    if res.ndim == 0:
+        return float(res)
+    return res
 
 
 def SI_RLD_conditional(histo, Ns):
@@ -185,7 +811,7 @@ def SI_RLD_conditional(histo, Ns):
 
     Parameters
     ----------
-    histo: array
+    histo: array or SparseHistogram
         Run-length histogram.
     Ns:
         Number of data points.
@@ -194,9 +820,10 @@ def SI_RLD_conditional(histo, Ns):
     float
         Neg. log-probability to observe a histogram given a number of runs nc and the number of signs Ns within these runs.
     """
-    nc = histo.sum()
+    counts = _histogram_counts(histo)
+    nc = counts.sum()
     if nc > 0:
-        SI = -log_multinomial(nc, histo)
+        SI = -log_multinomial(nc, counts)
         SI += log_binomial(Ns - 1, nc - 1)
     elif nc == 0:
         SI = 0.
@@ -205,6 +832,7 @@ def SI_RLD_conditional(histo, Ns):
     return SI
 
 
+@profiling.profiled
 def SI_hpm(N, nPlus, histoPlus, histoMinus, qHisto=True):
     """
     The total Shannon information (neg. log-probability) of observing run-length histograms :math:`h^\pm=(h^+,`h^-)`. :math:`h^+` and  :math:`h^-` are the run-length histograms for posive and negative runs, repectively
@@ -215,9 +843,9 @@ def SI_hpm(N, nPlus, histoPlus, histoMinus, qHisto=True):
         Number of signs.
     nPlus: int
         Number of positive runs.
-    histoPlus: array
+    histoPlus: array or SparseHistogram
         Run-length histogram for posivitve runs.
-    histoMinus: array
+    histoMinus: array or SparseHistogram
         Run-length histogram for negative runs.
     qHisto: bool, optional
         If true (default), total Shannon information :math:`-\ln p(h)` is evaluated. If false, Shannon information for numbers of positive/negative/total numbers of signs and numbers of positive/negative runs is evaluated. Used for validation and consistency checks.
@@ -226,8 +854,8 @@ def SI_hpm(N, nPlus, histoPlus, histoMinus, qHisto=True):
     -------
     SI: float
         The total Shannon information (neg. log-probability) of observing run-length histograms :math:`h^\pm=(h^+,`h^-)`.    """
-    ncPlus = histoPlus.sum()
-    ncMinus = histoMinus.sum()
+    ncPlus = _histogram_counts(histoPlus).sum()
+    ncMinus = _histogram_counts(histoMinus).sum()
     nc = ncPlus + ncMinus
     q_debug = False
     if q_debug:
@@ -249,6 +877,7 @@ def SI_hpm(N, nPlus, histoPlus, histoMinus, qHisto=True):
     return float(SI)
 
 
+@profiling.profiled
 def SI_h(N, histo, qHisto=True):
     """
     The Shannon information (neg. log-probability) of observing histograms histo.
@@ -257,7 +886,7 @@ def SI_h(N, histo, qHisto=True):
     ----------
     N: int
         Number of data points (signs)
-    histo: array
+    histo: array or SparseHistogram
         Counts of the run lengths
     qHisto: bool, optional
         If true (default), total Shannon information :math:`-\ln p(h)` is evaluated. If false, Shannon information for numbers of positive/negative/total numbers of signs and numbers of positive/negative runs is evaluated. Used for validation and consistency checks.
@@ -266,18 +895,411 @@ def SI_h(N, histo, qHisto=True):
     float
         The Shannon information (neg. log-probability) of observing histograms histo.
     """
-    nc = histo.sum()
+    counts = _histogram_counts(histo)
+    nc = counts.sum()
     if qHisto == True:
         SI = (N - 1) * np.log(2)
-        SI -= (np.log(np.arange(1, nc + 1))).sum()
-        indices = np.where(histo > 0)[0]
-        for i in indices:
-            SI += (np.log(np.arange(1, histo[i] + 1))).sum()
+        SI -= scipy.special.gammaln(nc + 1)
+        SI += scipy.special.gammaln(counts + 1).sum()
     else:
         SI = -1
     return SI
 
 
+def SI_h_from_statistics(N, nc, lfh_all):
+    """
+    Vectorized Shannon information (neg. log-probability) of observing run-length histograms h, calculated from
+    run-length statistics.
+
+    Parameters
+    ----------
+    N: array
+        Number of data points (signs).
+    nc: array
+        Number of runs.
+    lfh_all: array
+        :math:`\\sum_i \\ln h_i!` of the run-length histograms. See get_run_length_statistics().
+    Returns
+    -------
+    array
+        The Shannon information (neg. log-probability) of observing histograms h.
+    """
+    return (np.asarray(N) - 1) * np.log(2) - scipy.special.gammaln(np.asarray(nc) + 1) + lfh_all
+
+
+def SI_hpm_from_statistics(N, nc, ncPlus, nPlus, lfh_plus, lfh_minus):
+    """
+    Vectorized total Shannon information (neg. log-probability) of observing run-length histograms
+    :math:`h^\\pm=(h^+,h^-)`, calculated from run-length statistics. See SI_hpm().
+
+    Parameters
+    ----------
+    N: array
+        Number of signs.
+    nc: array
+        Number of runs.
+    ncPlus: array
+        Number of positive runs.
+    nPlus: array
+        Number of positive signs.
+    lfh_plus: array
+        :math:`\\sum_i \\ln h^+_i!` of the run-length histograms of positive runs.
+    lfh_minus: array
+        :math:`\\sum_i \\ln h^-_i!` of the run-length histograms of negative runs.
+    Returns
+    -------
+    array
+        The total Shannon information (neg. log-probability) of observing run-length histograms :math:`h^\\pm`.
+    """
+    N, nc, ncPlus, nPlus = np.broadcast_arrays(*[np.asarray(x, dtype=np.int64) for x in (N, nc, ncPlus, nPlus)])
+    ncMinus = nc - ncPlus
+    nMinus = N - nPlus
+    with np.errstate(invalid='ignore'):
+        SI = np.where((nc > 0) & (nc <= N), -log_binomial(N - 1, nc - 1) + (N - 1) * np.log(2), 0.)
+        SI += SI_number_of_positive_signs(N, nPlus, nc, ncPlus)
+        SI += np.where(ncPlus > 0, -scipy.special.gammaln(ncPlus + 1) + lfh_plus + log_binomial(nPlus - 1, ncPlus - 1), 0.)
+        SI += np.where(ncMinus > 0, -scipy.special.gammaln(ncMinus + 1) + lfh_minus + log_binomial(nMinus - 1, ncMinus - 1), 0.)
+    SI += np.where((nc % 2 == 1) & (np.abs(ncPlus - ncMinus) == 1), np.log(2), 0.)
+    return SI
+
+
+@profiling.profiled
 def SI_chi2(chi_square, number_data_points):
-    SI = -np.log(scipy.stats.chi2.pdf(chi_square, number_data_points))
+    """
+    Vectorized Shannon information (neg. log-probability density) of :math:`\\chi^2`. Evaluated via the log-pdf,
+    which stays finite for large numbers of data points and extreme values of :math:`\\chi^2`.
+
+    Parameters
+    ----------
+    chi_square: float or array
+        Sum of the squared normalized residuals.
+    number_data_points: int or array
+        Number of data points (degrees of freedom).
+    Returns
+    -------
+    float or array
+        The Shannon information of :math:`\\chi^2`.
+    """
+    # Log-pdf of the chi-square distribution, as in scipy.stats.chi2.logpdf(), without importing scipy.stats
+    k = 0.5 * np.asarray(number_data_points, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        SI = -(scipy.special.xlogy(k - 1., chi_square) - 0.5 * np.asarray(chi_square) - scipy.special.gammaln(k)
+               - k * np.log(2.))
     return SI
+
+
+class RunLengthAccumulator:
+    """
+    Incremental run-length statistics for residuals that arrive in chunks. The run that is open at the end of a chunk
+    is continued by the next chunk. Only sparse run-length counts are stored, so memory scales with the number of
+    distinct run lengths, and the Shannon information can be evaluated at any point.
+
+    Parameters
+    ----------
+    components: list of str, optional
+        Shannon information components to accumulate, any of 'chi2', 'h', and 'hpm'. The runs of the signs are only
+        processed for 'h' and 'hpm', and chi2 only for 'chi2'. Default accumulates all.
+
+    Attributes
+    ----------
+    N: int
+        Number of data points seen so far.
+    nPlus: int
+        Number of positive signs.
+    chi_square: float
+        Sum of the squared normalized residuals.
+    """
+
+    def __init__(self, components=("chi2", "h", "hpm")):
+        for component in components:
+            if component not in ("chi2", "h", "hpm"):
+                raise ValueError("Component \"%s\" not available, use any of chi2, h, hpm" % component)
+        self.components = tuple(components)
+        self._runs = "h" in self.components or "hpm" in self.components
+        self.N = 0
+        self.nPlus = 0
+        self.chi_square = 0.
+        self._counts = {'plus': {}, 'minus': {}}
+        self._open_sign = None
+        self._open_length = 0
+
+    @staticmethod
+    def _add_runs(counts, run_lengths):
+        lengths, n = np.unique(run_lengths, return_counts=True)
+        for length, k in zip(lengths.tolist(), n.tolist()):
+            counts[length] = counts.get(length, 0) + k
+
+    @profiling.profiled
+    def update(self, normalized_residuals):
+        """
+        Adds a chunk of normalized residuals.
+
+        Parameters
+        ----------
+        normalized_residuals: array
+            1d array containing the next normalized residuals of the series.
+        """
+        normalized_residuals = np.asarray(normalized_residuals, dtype=np.float64)
+        n = normalized_residuals.shape[0]
+        if n == 0:
+            return
+        self.N += n
+        if "chi2" in self.components:
+            self.chi_square += float(np.dot(normalized_residuals, normalized_residuals))
+        if not self._runs:
+            return
+        signs = np.sign(normalized_residuals)
+        self.nPlus += int(np.count_nonzero(signs > 0))
+
+        # Runs of equal signs as in get_run_length_statistics(): zeros form separate runs that count as negative, and
+        # NaN always starts a new run
+        starts = np.concatenate([[0], np.flatnonzero(signs[1:] != signs[:-1]) + 1])
+        run_lengths = np.diff(np.append(starts, n))
+        run_plus = signs[starts] > 0
+        if self._open_sign is not None and self._open_sign == signs[0]:
+            run_lengths[0] += self._open_length
+        elif self._open_sign is not None:
+            self._add_runs(self._counts['plus' if self._open_sign > 0 else 'minus'], [self._open_length])
+        # All but the last run of the chunk are closed
+        closed = run_lengths[:-1]
+        self._add_runs(self._counts['plus'], closed[run_plus[:-1]])
+        self._add_runs(self._counts['minus'], closed[~run_plus[:-1]])
+        self._open_sign = float(signs[-1])
+        self._open_length = int(run_lengths[-1])
+
+    def histograms(self):
+        """
+        Returns
+        -------
+        histo: dict
+            Sparse run-length histograms (SparseHistogram) for positive ('plus'), negative ('minus'), and all runs
+            ('all'), including the open run.
+        """
+        if not self._runs:
+            raise ValueError("Run lengths not accumulated, which requires the component h or hpm")
+        counts = {k: dict(self._counts[k]) for k in self._counts}
+        if self._open_sign is not None:
+            c = counts['plus' if self._open_sign > 0 else 'minus']
+            c[self._open_length] = c.get(self._open_length, 0) + 1
+        counts['all'] = dict(counts['plus'])
+        for length, k in counts['minus'].items():
+            counts['all'][length] = counts['all'].get(length, 0) + k
+        histo = {}
+        for k in ['all', 'minus', 'plus']:
+            lengths = np.array(sorted(counts[k]), dtype=np.int64)
+            histo[k] = SparseHistogram(lengths, np.array([counts[k][length] for length in lengths.tolist()], dtype=np.int64))
+        return histo
+
+    def statistics(self):
+        """
+        Returns
+        -------
+        stats: dict
+            Run-length statistics in the format of get_run_length_statistics(), with scalar entries.
+        """
+        histo = self.histograms()
+        stats = {}
+        stats['N'] = self.N
+        stats['nc'] = int(histo['all'].sum())
+        stats['ncPlus'] = int(histo['plus'].sum())
+        stats['nPlus'] = self.nPlus
+        for k in ['all', 'plus', 'minus']:
+            stats['lfh_' + k] = float(scipy.special.gammaln(histo[k].counts + 1).sum())
+        return stats
+
+    @profiling.profiled
+    def finalize(self, components=None):
+        """
+        Evaluates the Shannon information of the residuals seen so far, with a single evaluation of the run-length
+        statistics for h and hpm. Further chunks may be added afterwards.
+
+        Parameters
+        ----------
+        components: list of str (optional)
+            Any of the accumulated components. Default evaluates all accumulated components.
+        Returns
+        -------
+        SI: dict
+            The Shannon information of chi2 ('chi2'), of the run-length histogram h ('h'), and of the run-length
+            histograms :math:`h^\\pm` ('hpm'). Components not requested are None.
+        """
+        if components is None:
+            components = self.components
+        self._check_components(components)
+        SI = {"chi2": None, "h": None, "hpm": None}
+        if "chi2" in components:
+            SI['chi2'] = float(SI_chi2(self.chi_square, self.N))
+        if "h" in components or "hpm" in components:
+            stats = self.statistics()
+            if "h" in components:
+                SI['h'] = float(SI_h_from_statistics(stats['N'], stats['nc'], stats['lfh_all']))
+            if "hpm" in components:
+                SI['hpm'] = float(SI_hpm_from_statistics(stats['N'], stats['nc'], stats['ncPlus'], stats['nPlus'],
+                                                         stats['lfh_plus'], stats['lfh_minus']))
+        return SI
+
+    def _check_components(self, components):
+        for component in components:
+            if component not in self.components:
+                raise ValueError("Component \"%s\" not accumulated" % component)
+
+    def SI_h(self):
+        """
+        Returns
+        -------
+        float
+            The Shannon information of the run-length histogram h of the residuals seen so far.
+        """
+        return self.finalize(("h",))['h']
+
+    def SI_hpm(self):
+        """
+        Returns
+        -------
+        float
+            The Shannon information of the run-length histograms :math:`h^\\pm` of the residuals seen so far.
+        """
+        return self.finalize(("hpm",))['hpm']
+
+    def SI_chi2(self):
+        """
+        Returns
+        -------
+        float
+            The Shannon information of :math:`\\chi^2` of the residuals seen so far.
+        """
+        return self.finalize(("chi2",))['chi2']
+
+
+@jit(nopython=True)
+def _sliding_window_kernel(run_starts, run_lengths, run_plus, width, window_starts, nc, lfh):
+    """
+    Incremental run-length statistics of sliding windows. The runs fully inside the window are kept in dense
+    run-length counts, which are updated as the window moves, together with the running sums of :math:`\\ln h_i!`.
+    The two runs clipped by the window edges are added temporarily for each window.
+    """
+    counts = np.zeros((3, width + 1), dtype=np.int64)  # all, plus, minus
+    S = np.zeros(3)
+    n_runs = run_starts.shape[0]
+    cur_a = 0
+    cur_b = 0
+    i0 = 0
+    i1 = 0
+    for w in range(window_starts.shape[0]):
+        s = window_starts[w]
+        e = s + width
+        while i0 + 1 < n_runs and run_starts[i0 + 1] <= s:
+            i0 += 1
+        if i1 < i0:
+            i1 = i0
+        while i1 + 1 < n_runs and run_starts[i1 + 1] <= e - 1:
+            i1 += 1
+        if i0 == i1:
+            nc[w] = 1
+            lfh[0, w] = 0.
+            lfh[1, w] = 0.
+            lfh[2, w] = 0.
+            continue
+        # Interior runs are [i0 + 1, i1)
+        a = i0 + 1
+        b = i1
+        while cur_a < a and cur_a < cur_b:
+            j = 2 - int(run_plus[cur_a])
+            length = run_lengths[cur_a]
+            S[0] -= np.log(counts[0, length])
+            counts[0, length] -= 1
+            S[j] -= np.log(counts[j, length])
+            counts[j, length] -= 1
+            cur_a += 1
+        if cur_a < a:
+            cur_a = a
+        if cur_b < cur_a:
+            cur_b = cur_a
+        while cur_b < b:
+            j = 2 - int(run_plus[cur_b])
+            length = run_lengths[cur_b]
+            counts[0, length] += 1
+            S[0] += np.log(counts[0, length])
+            counts[j, length] += 1
+            S[j] += np.log(counts[j, length])
+            cur_b += 1
+        # Temporarily add the runs clipped by the window edges
+        left = run_starts[i0] + run_lengths[i0] - s
+        right = e - run_starts[i1]
+        j_left = 2 - int(run_plus[i0])
+        j_right = 2 - int(run_plus[i1])
+        T = S.copy()
+        counts[0, left] += 1
+        T[0] += np.log(counts[0, left])
+        counts[j_left, left] += 1
+        T[j_left] += np.log(counts[j_left, left])
+        T[0] += np.log(counts[0, right] + 1)
+        T[j_right] += np.log(counts[j_right, right] + 1)
+        counts[0, left] -= 1
+        counts[j_left, left] -= 1
+        nc[w] = b - a + 2
+        lfh[0, w] = T[0]
+        lfh[1, w] = T[1]
+        lfh[2, w] = T[2]
+    return nc, lfh
+
+
+def sliding_window_run_length_statistics(signs, width, stride=1):
+    """
+    Run-length statistics of sliding windows over a sequence of signs, updated incrementally as the window moves,
+    so that a full scan costs O(N + number of windows) instead of O(N x width).
+
+    Parameters
+    ----------
+    signs: array
+        1d array of signs (:math:`\\pm 1`).
+    width: int
+        Number of signs per window.
+    stride: int, optional
+        Shift between consecutive windows.
+    Returns
+    -------
+    stats: dict
+        Run-length statistics of the windows in the format of get_run_length_statistics(), and the start index of each
+        window ('start').
+    """
+    signs = np.asarray(signs)
+    Ns = signs.shape[0]
+    if width < 1 or width > Ns:
+        raise ValueError("window width %d not in [1, %d]" % (width, Ns))
+    if stride < 1:
+        raise ValueError("stride must be positive, got %d" % stride)
+    window_starts = np.arange(0, Ns - width + 1, stride, dtype=np.int64)
+    n_windows = window_starts.shape[0]
+
+    run_starts = np.flatnonzero(np.concatenate([[True], signs[1:] != signs[:-1]]))
+    run_lengths = np.diff(np.append(run_starts, Ns))
+    run_plus = signs[run_starts] > 0
+
+    nc = np.zeros(n_windows, dtype=np.int64)
+    lfh = np.zeros((3, n_windows))
+    _require_numba()
+    _sliding_window_kernel(run_starts, run_lengths, run_plus, width, window_starts, nc, lfh)
+
+    # Numbers of positive signs and positive runs from prefix sums
+    plus = signs > 0
+    cum_plus = np.zeros(Ns + 1, dtype=np.int64)
+    np.cumsum(plus, out=cum_plus[1:])
+    plus_run_start = np.zeros(Ns, dtype=bool)
+    plus_run_start[run_starts[run_plus]] = True
+    cum_plus_run_starts = np.zeros(Ns + 1, dtype=np.int64)
+    np.cumsum(plus_run_start, out=cum_plus_run_starts[1:])
+    stops = window_starts + width
+    # Positive runs starting after the first sign of the window, plus the run containing the first sign
+    ncPlus = cum_plus_run_starts[stops] - cum_plus_run_starts[window_starts + 1] + plus[window_starts]
+
+    stats = {}
+    stats['start'] = window_starts
+    stats['N'] = np.full(n_windows, width, dtype=np.int64)
+    stats['nc'] = nc
+    stats['ncPlus'] = ncPlus
+    stats['nPlus'] = cum_plus[stops] - cum_plus[window_starts]
+    stats['lfh_all'] = lfh[0]
+    stats['lfh_plus'] = lfh[1]
+    stats['lfh_minus'] = lfh[2]
+    return stats
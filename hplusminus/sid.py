@@ -2,9 +2,17 @@
 # Released under the MIT Licence, see the file LICENSE.txt.
 
 import os
+import threading
 import numpy as np
-from scipy.stats import gamma as gamma_dist
-import scipy
+import scipy.special
+from . import exact
+from . import io
+from . import profiling
+from . import rld
+
+
+# Name of the packed spline parameter file within a gamma spline parameter directory
+PACKED_SPLINE_PARAMETERS = "spline_parameters.pack"
 
 
 def _get_package_gsp():
@@ -26,11 +34,12 @@ def _get_package_gsp():
 def load_spline_parameters(ipath, tests=['h', 'both', 'h_simple', 'both_simple']):
     """
     Load knots and coefficients for B-splines representing :math:`\alpha`, :math:`\beta`, :math:`\matcal{I}_o` paramters of the shifted gamma disributions as functions of :math:`\log_{10} N`, where :math:`N` is the number of data points.
+    If ipath is a packed file or a directory containing a packed file (see pack_spline_parameters()), the parameters are memory-mapped from it, otherwise they are read from the individual .npy files.
 
     Parameters
     ----------
     ipath: str
-        Input path.
+        Input path, either a directory or a packed file.
     tests: List of str (optional)
         Names of tests, for which paramaters are read in. Names identify the corresponding files.
     Returns
@@ -38,6 +47,14 @@ def load_spline_parameters(ipath, tests=['h', 'both', 'h_simple', 'both_simple']
     spline_par: dict
         Dictionary containing knots and coefficients of B-splines for all tests and parameters of the shifted gamma disributions.
     """
+    if os.path.isfile(ipath):
+        packed_file = ipath
+    else:
+        packed_file = os.path.join(ipath, PACKED_SPLINE_PARAMETERS)
+    if os.path.isfile(packed_file):
+        arrays = io.load_packed_arrays(packed_file)
+    else:
+        arrays = None
     spline_par = {}
     for k in tests:
         spline_par[k] = {}
@@ -45,13 +62,48 @@ def load_spline_parameters(ipath, tests=['h', 'both', 'h_simple', 'both_simple']
             spline_par[k][na] = {}
             for tmp in ["knots", "coeffs"]:
                 iname = "%s_%s_%s.npy" % (tmp, k, na)
-                spline_par[k][na][tmp] = np.load(os.path.join(ipath, iname))
+                if arrays is None:
+                    spline_par[k][na][tmp] = np.load(os.path.join(ipath, iname))
+                else:
+                    spline_par[k][na][tmp] = arrays[iname]
     return spline_par
 
 
+def pack_spline_parameters(ipath, ofile=None, tests=['h', 'both', 'h_simple', 'both_simple']):
+    """
+    Convert a directory of spline parameter files ("knots_h_alpha.npy", etc.) into a single packed file that
+    load_spline_parameters() memory-maps with one open.
+
+    Parameters
+    ----------
+    ipath: str
+        Input path containing the .npy files.
+    ofile: str (optional)
+        Name of output file. Default is PACKED_SPLINE_PARAMETERS within ipath.
+    tests: List of str (optional)
+        Names of tests, for which paramaters are packed.
+    Returns
+    -------
+    ofile: str
+        Name of output file.
+    """
+    if ofile is None:
+        ofile = os.path.join(ipath, PACKED_SPLINE_PARAMETERS)
+    arrays = {}
+    for k in tests:
+        for na in ["alpha", "beta", "I0"]:
+            for tmp in ["knots", "coeffs"]:
+                iname = "%s_%s_%s.npy" % (tmp, k, na)
+                arrays[iname] = np.load(os.path.join(ipath, iname))
+    io.save_packed_arrays(arrays, ofile)
+    return ofile
+
+
+@profiling.profiled
 def cumulative_SID_gamma(SI, alpha, beta, I0):
     """
     Returns cumulative distribution function of the Shannon information given by gamma distribution.
+    Evaluated via the survival function, which is accurate also in the tail.
 
     Parameters
     ----------
@@ -68,10 +120,71 @@ def cumulative_SID_gamma(SI, alpha, beta, I0):
     cdf: float
         Value of Shannon information
     """
-    cdf = 1. - gamma_dist.cdf(SI, alpha, scale=1. / beta, loc=I0)
+    cdf = scipy.special.gammaincc(alpha, np.maximum(beta * (np.asarray(SI) - I0), 0.))
     return cdf
 
 
+def _log_gamma_sf_continued_fraction(x, alpha, max_iter=200):
+    """
+    Logarithm of the regularized upper incomplete gamma function :math:`Q(\\alpha, x)` from its continued fraction
+    (modified Lentz algorithm), which converges quickly for :math:`x > \\alpha + 1`.
+    """
+    tiny = 1e-300
+    b = x + 1. - alpha
+    c = np.full(x.shape, 1. / tiny)
+    d = 1. / b
+    h = d.copy()
+    for i in range(1, max_iter + 1):
+        an = -i * (i - alpha)
+        b = b + 2.
+        d = an * d + b
+        d = np.where(np.abs(d) < tiny, tiny, d)
+        c = b + an / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        d = 1. / d
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1.) < 1e-15):
+            break
+    return -x + alpha * np.log(x) - scipy.special.gammaln(alpha) + np.log(h)
+
+
+@profiling.profiled
+def log_cumulative_SID_gamma(SI, alpha, beta, I0):
+    """
+    Returns the logarithm of the cumulative distribution function of the Shannon information given by the gamma
+    distribution, see cumulative_SID_gamma(). Far in the tail, where the survival function underflows, the logarithm
+    is evaluated directly from the continued fraction of the incomplete gamma function, so that tiny p-values remain
+    finite and ordered.
+
+    Parameters
+    ----------
+    SI: float or array-like
+        Shannon information
+    alpha: float or array-like
+        Shape parameter of the gamma disribution.
+    beta: float or array-like
+        Inverser scale parameter of the gamma disribution.
+    I0: float or array-like
+        Shift (location) parameter of the gamma distribution.
+    Returns
+    -------
+    log_cdf: array
+        Natural logarithm of the p-values.
+    """
+    x, alpha = np.broadcast_arrays(np.asarray(beta * (np.asarray(SI) - I0), dtype=np.float64),
+                                   np.asarray(alpha, dtype=np.float64))
+    x = np.maximum(x, 0.)
+    sf = scipy.special.gammaincc(alpha, x)
+    with np.errstate(divide='ignore'):
+        # Close to one, the logarithm is taken of the complementary lower incomplete gamma function for accuracy
+        log_cdf = np.where(sf > 0.5, np.log1p(-scipy.special.gammainc(alpha, x)), np.log(sf))
+    tail = (sf < 1e-280) & (x > alpha + 1.)
+    if np.any(tail):
+        log_cdf[tail] = _log_gamma_sf_continued_fraction(x[tail], alpha[tail])
+    return log_cdf
+
+
 def get_spline(spline_par, tests=['h', 'both', 'h_simple', 'both_simple']):
     """
     Returns spline function objects for the data size dependence of the parameters of the gamma distributions representing cumulative Shannon information distribution functions.
@@ -87,6 +200,7 @@ def get_spline(spline_par, tests=['h', 'both', 'h_simple', 'both_simple']):
     spline_func: dict
         Dictionary of spline functions.
     """
+    import scipy.interpolate
     nam = ["alpha", "beta", "I0"]
     spline_func = {}
     for k in tests:
@@ -123,28 +237,396 @@ def get_gamma_parameters(Ns, test, spline_func):
     return alpha, beta, I0
 
 
-def init(gamma_params_ipath=_get_package_gsp()):
+@profiling.profiled
+def init(gamma_params_ipath=None):
     """
     Initialises spline function object.
 
     Parameters
     ----------
-    gamma_params_ipath: str
-        Input path.
+    gamma_params_ipath: str (optional)
+        Input path. Default is the directory of the parameters bundled with the package.
     Returns
     -------
     spline_func: dict
         Dictionary of spline functions. Output of get_spline() or init().
 
     """
+    if gamma_params_ipath is None:
+        gamma_params_ipath = _get_package_gsp()
     spline_par = load_spline_parameters(gamma_params_ipath)
     spline_func = get_spline(spline_par)
     return spline_func
 
 
+# Process-wide cache of spline function objects, keyed by the absolute input path
+_spline_cache = {}
+_spline_cache_lock = threading.Lock()
+_spline_cache_default_ipath = None
+
+
+def get_spline_cache(gamma_params_ipath=None):
+    """
+    Returns spline function objects, loading the spline parameters only once per process and input path.
+    The cache is thread safe and filled lazily.
+
+    Parameters
+    ----------
+    gamma_params_ipath: str (optional)
+        Input path. Default is the path set by reset_spline_cache(), or the bundled parameters.
+    Returns
+    -------
+    spline_func: dict
+        Dictionary of spline functions. Same as output of init(). Must not be modified by the caller.
+    """
+    if gamma_params_ipath is None:
+        gamma_params_ipath = _spline_cache_default_ipath
+        if gamma_params_ipath is None:
+            gamma_params_ipath = _get_package_gsp()
+    key = os.path.abspath(gamma_params_ipath)
+    spline_func = _spline_cache.get(key)
+    if spline_func is None:
+        with _spline_cache_lock:
+            spline_func = _spline_cache.get(key)
+            if spline_func is None:
+                spline_func = init(gamma_params_ipath)
+                _spline_cache[key] = spline_func
+    return spline_func
+
+
+def reset_spline_cache(gamma_params_ipath=None):
+    """
+    Clears the spline cache and sets the input path used by get_spline_cache() by default.
+
+    Parameters
+    ----------
+    gamma_params_ipath: str (optional)
+        Input path of custom spline parameters to be used by default. If None (default), the parameters bundled with
+        the package are used.
+    """
+    global _spline_cache_default_ipath
+    with _spline_cache_lock:
+        _spline_cache.clear()
+        _spline_cache_default_ipath = gamma_params_ipath
+
+
+# Names of the spline parameter sets used for the p-values of the tests
+spline_test_names = {
+    "h": "h_simple",
+    "hpm": "h",
+    "chi2_h": "both_simple",
+    "chi2_hpm": "both",
+}
+
+
+def gamma_parameters_for_tests(number_data_points, test, spline_func=None):
+    """
+    Vectorized parameters of the shifted gamma distributions approximating the Shannon information distribution of a test.
+
+    Parameters
+    ----------
+    number_data_points: int or array
+        Number of data points.
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    spline_func: dict (optional)
+        Dictionary of spline functions. Output of get_spline() or init(). Default uses get_spline_cache().
+    Returns
+    -------
+    alpha: array
+        Shape parameter of the gamma disribution, NaN for empty data sets.
+    beta: array
+        Inverser scale parameter of the gamma disribution, NaN for empty data sets.
+    I0: array
+        Shift (location) parameter of the gamma distribution, NaN for empty data sets.
+    """
+    number_data_points = np.asarray(number_data_points)
+    # Evaluate the gamma parameters only once per distinct data size
+    Ns, inverse = np.unique(number_data_points, return_inverse=True)
+    alpha, beta, I0 = (np.full(Ns.shape, np.nan) for i in range(3))
+    nonempty = Ns > 0
+    if test == "chi2":
+        alpha[nonempty] = 0.5
+        beta[nonempty] = 1.
+        I0[nonempty] = rld.SI_chi2(Ns[nonempty] - 2, Ns[nonempty])
+    elif test in spline_test_names:
+        if spline_func is None:
+            spline_func = get_spline_cache()
+        alpha[nonempty], beta[nonempty], I0[nonempty] = get_gamma_parameters(Ns[nonempty], spline_test_names[test],
+                                                                             spline_func)
+    else:
+        raise ValueError("Test \"%s\" not available" % test)
+    shape = number_data_points.shape
+    return alpha[inverse].reshape(shape), beta[inverse].reshape(shape), I0[inverse].reshape(shape)
+
+
+def calibrated_range(test, spline_func=None):
+    """
+    Range of numbers of data points covered by the calibration of the gamma distribution parameters of a test. Outside
+    this range, the spline functions are extrapolated.
+
+    Parameters
+    ----------
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    spline_func: dict (optional)
+        Dictionary of spline functions. Output of get_spline() or init(). Default uses get_spline_cache().
+    Returns
+    -------
+    N_min: int
+        Smallest number of data points covered.
+    N_max: float
+        Largest number of data points covered, inf for the chi2 test.
+    """
+    if test != "chi2" and test not in spline_test_names:
+        raise ValueError("Test \"%s\" not available" % test)
+    if spline_func is None:
+        spline_func = get_spline_cache()
+    # The gamma distribution of the chi2 test is the limit for large N, taken to hold in the range of the hpm test
+    splines = spline_func[spline_test_names["hpm" if test == "chi2" else test]].values()
+    log_N_min = max(spline.t[spline.k] for spline in splines)
+    log_N_max = min(spline.t[-spline.k - 1] for spline in splines)
+    if test == "chi2":
+        return int(np.ceil(10.**log_N_min * (1. - 1e-9))), np.inf
+    return int(np.ceil(10.**log_N_min * (1. - 1e-9))), float(np.floor(10.**log_N_max * (1. + 1e-9)))
+
+
+def exact_gamma_parameters(number_data_points, test):
+    """
+    Vectorized parameters of shifted gamma distributions with the smallest value, the mean, and the variance of the
+    exact Shannon information distribution of the chi2, h, or hpm test, for numbers of data points below the
+    calibrated range. The moments of the h and hpm tests are obtained from the exact distributions (see
+    exact.survival_function()), those of the chi2 test analytically, with the gamma distribution of the chi2 test as
+    limit for large N. Deterministic Shannon information, e.g., of the h test for N <= 2, is represented by a zero
+    shape parameter, i.e., a point mass at I0.
+
+    Parameters
+    ----------
+    number_data_points: int or array
+        Number of data points, at least 2 for the chi2 test and at most exact.MAX_EXACT_N for the h and hpm tests.
+    test: str
+        Name of statistical test, 'chi2', 'h', or 'hpm'.
+    Returns
+    -------
+    alpha: array
+        Shape parameter of the gamma disribution.
+    beta: array
+        Inverser scale parameter of the gamma disribution.
+    I0: array
+        Shift (location) parameter of the gamma distribution.
+    """
+    number_data_points = np.asarray(number_data_points)
+    Ns, inverse = np.unique(number_data_points, return_inverse=True)
+    if test == "chi2":
+        if np.any(Ns < 2):
+            raise ValueError("The chi2 Shannon information distribution requires N >= 2")
+        # Moments of -(k - 1) ln(chi2) + chi2 / 2 - I0 for k = N / 2, with I0 at the mode chi2 = N - 2
+        k = 0.5 * Ns
+        mean = 1. - (k - 1.) * (scipy.special.digamma(k) + np.log(2.)) + scipy.special.xlogy(k - 1., Ns - 2.)
+        var = (k - 1.)**2 * scipy.special.polygamma(1, k) + k - 2. * (k - 1.)
+        alpha = mean**2 / var
+        beta = mean / var
+        I0 = rld.SI_chi2(Ns - 2, Ns)
+    elif test in ("h", "hpm"):
+        alpha = np.zeros(Ns.shape)
+        beta = np.ones(Ns.shape)
+        I0 = np.zeros(Ns.shape)
+        for i, N in enumerate(Ns):
+            if N < 1 or N > exact.MAX_EXACT_N:
+                raise ValueError("Exact distributions are only available for 1 <= N <= %d, got N=%d" %
+                                 (exact.MAX_EXACT_N, N))
+            SI, survival = exact.survival_function(int(N), test)
+            prob = survival - np.append(survival[1:], 0.)
+            I0[i] = SI[0]
+            mean = (prob * (SI - I0[i])).sum()
+            var = (prob * (SI - I0[i] - mean)**2).sum()
+            if var > exact.SI_RESOLUTION:
+                alpha[i] = mean**2 / var
+                beta[i] = mean / var
+            else:
+                I0[i] += mean
+    else:
+        raise ValueError("Exact distribution not available for test \"%s\"" % test)
+    shape = number_data_points.shape
+    return alpha[inverse].reshape(shape), beta[inverse].reshape(shape), I0[inverse].reshape(shape)
+
+
+@profiling.profiled
+def p_values(SI, number_data_points, test, spline_func=None, method="gamma"):
+    """
+    Vectorized calculation of p-values for given test using the gamma distribution approximation of the Shannon information distribution,
+    or the exact Shannon information distribution for small numbers of data points.
+
+    Parameters
+    ----------
+    SI: float or array
+        Shannon information values.
+    number_data_points: int or array
+        Number of data points, broadcast against SI.
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    spline_func: dict (optional)
+        Dictionary of spline functions. Output of get_spline() or init(). Default uses get_spline_cache().
+    method: str, optional
+        "gamma" (default) for the gamma distribution approximation. "exact" for the exact distribution of the 'h' and
+        'hpm' tests, available up to exact.MAX_EXACT_N=100 data points (see exact.p_values()). The exact
+        distribution for a new number of data points takes up to tens of seconds near this limit, and is cached in
+        memory and, with the environment variable HPLUSMINUS_CACHE_DIR, on disk.
+    Returns
+    -------
+    p_value: array
+        P-values for given test.
+    """
+    if method == "exact":
+        return exact.p_values(SI, number_data_points, test)
+    elif method != "gamma":
+        raise ValueError("unknown method \"%s\"" % method)
+    SI, number_data_points = np.broadcast_arrays(np.asarray(SI, dtype=np.float64), np.asarray(number_data_points))
+    alpha, beta, I0 = gamma_parameters_for_tests(number_data_points, test, spline_func)
+    return cumulative_SID_gamma(SI, alpha, beta, I0)
+
+
+@profiling.profiled
+def log_p_values(SI, number_data_points, test, spline_func=None, method="gamma"):
+    """
+    Vectorized natural logarithm of the p-values for given test, see p_values(). With the gamma distribution
+    approximation, p-values far below the smallest floating point number are returned as finite logarithms instead of
+    zero.
+
+    Parameters
+    ----------
+    SI: float or array
+        Shannon information values.
+    number_data_points: int or array
+        Number of data points, broadcast against SI.
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    spline_func: dict (optional)
+        Dictionary of spline functions. Output of get_spline() or init(). Default uses get_spline_cache().
+    method: str, optional
+        "gamma" (default) or "exact", see p_values().
+    Returns
+    -------
+    log_p_value: array
+        Natural logarithm of the p-values for given test.
+    """
+    if method == "exact":
+        with np.errstate(divide='ignore'):
+            return np.log(exact.p_values(SI, number_data_points, test))
+    elif method != "gamma":
+        raise ValueError("unknown method \"%s\"" % method)
+    SI, number_data_points = np.broadcast_arrays(np.asarray(SI, dtype=np.float64), np.asarray(number_data_points))
+    alpha, beta, I0 = gamma_parameters_for_tests(number_data_points, test, spline_func)
+    return log_cumulative_SID_gamma(SI, alpha, beta, I0)
+
+
+def log10_p_values(SI, number_data_points, test, spline_func=None, method="gamma"):
+    """
+    Vectorized decadic logarithm of the p-values for given test. See log_p_values().
+
+    Parameters
+    ----------
+    SI: float or array
+        Shannon information values.
+    number_data_points: int or array
+        Number of data points, broadcast against SI.
+    test: str
+        Name of statistical test, one of 'chi2', 'h', 'hpm', 'chi2_h', 'chi2_hpm'.
+    spline_func: dict (optional)
+        Dictionary of spline functions. Output of get_spline() or init(). Default uses get_spline_cache().
+    method: str, optional
+        "gamma" (default) or "exact", see p_values().
+    Returns
+    -------
+    log10_p_value: array
+        Decadic logarithm of the p-values for given test.
+    """
+    return log_p_values(SI, number_data_points, test, spline_func, method) / np.log(10.)
+
+
+@profiling.profiled
+def combined_p_value(SI, alpha, beta, I0, n_grid=4096, log10=False):
+    """
+    P-value of the sum of the Shannon information of independent data sets, each following a shifted gamma
+    distribution. If all scale parameters agree, the sum follows a shifted gamma distribution with summed shape and
+    shift parameters. Otherwise, the distribution of the sum is obtained by direct numerical convolution of the
+    discretized gamma distributions, which involves only sums of positive terms and thus keeps the relative accuracy
+    in the tail.
+
+    Parameters
+    ----------
+    SI: float
+        Sum of the Shannon information of all data sets.
+    alpha: array
+        Shape parameters of the gamma disributions of the data sets.
+    beta: array
+        Inverse scale parameters of the gamma disributions of the data sets.
+    I0: array
+        Shift (location) parameters of the gamma distributions of the data sets. Distributions with zero shape
+        parameter are point masses at I0.
+    n_grid: int, optional
+        Number of grid points of the numerical convolution.
+    log10: bool, optional
+        If true, the decadic logarithm of the p-value is returned. Where the numerical convolution underflows, it is
+        approximated by a gamma distribution with the mean and variance of the sum.
+    Returns
+    -------
+    p_value: float
+        P-value (or its decadic logarithm) of the summed Shannon information.
+    """
+    alpha = np.atleast_1d(np.asarray(alpha, dtype=np.float64))
+    beta = np.atleast_1d(np.asarray(beta, dtype=np.float64))
+    I0 = np.atleast_1d(np.asarray(I0, dtype=np.float64))
+    x = SI - I0.sum()
+    # Distributions with zero shape parameter are point masses at I0 and only shift the sum
+    random = alpha > 0.
+    # Gamma distributions with equal scale parameters sum to a gamma distribution with summed shape parameters
+    beta, group = np.unique(beta[random], return_inverse=True)
+    alpha = np.bincount(group, weights=alpha[random], minlength=beta.shape[0])
+    if alpha.shape[0] == 0:
+        p_value = 1. if x <= 1e-9 * max(abs(SI), 1.) else 0.
+        return (0. if p_value > 0. else -np.inf) if log10 else p_value
+    if np.allclose(beta, beta[0], rtol=1e-12, atol=0.):
+        if log10:
+            return float(log_cumulative_SID_gamma(x, alpha.sum(), beta[0], 0.) / np.log(10.))
+        return float(scipy.special.gammaincc(alpha.sum(), max(x, 0.) * beta[0]))
+    if x <= 0:
+        return 0. if log10 else 1.
+    # Grid covering the bulk of the distribution of the sum and the observed value
+    mean = (alpha / beta).sum()
+    std = np.sqrt((alpha / beta**2).sum())
+    x_max = max(mean + 40. * std, 1.5 * x)
+    dx = x_max / n_grid
+    edges = np.arange(n_grid + 1) * dx
+    masses = None
+    for a, b in zip(alpha, beta):
+        m = np.diff(scipy.special.gammainc(a, edges * b))
+        masses = m if masses is None else np.convolve(masses, m)[:n_grid]
+    # The sum of the bin midpoints of M distributions lies at (k + M/2) dx for bin k of the convolution. Spreading each
+    # mass uniformly over a bin of width dx around this point, the survival function at x is obtained by linear
+    # interpolation of the cumulative masses at k = x / dx - M/2 + 1/2.
+    k = x / dx - 0.5 * alpha.shape[0] + 0.5
+    k_floor = int(np.floor(k))
+    survival = np.concatenate([np.cumsum(masses[::-1])[::-1], [0.]])
+    if k_floor < 0:
+        p_value = 1.
+    elif k_floor >= n_grid:
+        p_value = 0.
+    else:
+        frac = k - k_floor
+        # The summed masses may exceed one by rounding errors
+        p_value = min(float((1. - frac) * survival[k_floor] + frac * survival[k_floor + 1]), 1.)
+    if not log10:
+        return p_value
+    if p_value > 0.:
+        return float(np.log10(p_value))
+    return float(log_cumulative_SID_gamma(x, mean**2 / std**2, mean / std**2, 0.) / np.log(10.))
+
+
 def cumulative(SI, number_data_points, test, spline_func):
     """
     Calculate p-values for given test using gamma disribuiton approximation of Shannon information distribution.
+    See p_values().
 
     Parameters
     ----------
@@ -161,28 +643,9 @@ def cumulative(SI, number_data_points, test, spline_func):
     p-value: float
         P-value for given test.
     """
-    #tests = ['chi2', 'h', 'hpm', 'chi2_h', 'chi2_hp']
-    if test == "chi2":
-        alpha = 0.5
-        beta = 1.
-        I0 = -np.log(scipy.stats.chi2.pdf(number_data_points - 2, number_data_points))
-        p_value = cumulative_SID_gamma(SI, alpha, beta, I0)
-    elif test == "h":
-        alpha, beta, I0 = get_gamma_parameters(number_data_points, "h_simple", spline_func)
-        p_value = cumulative_SID_gamma(SI, alpha, beta, I0)
-    elif test == "hpm":
-        alpha, beta, I0 = get_gamma_parameters(number_data_points, "h", spline_func)
-        p_value = cumulative_SID_gamma(SI, alpha, beta, I0)
-    elif test == "chi2_h":
-        alpha, beta, I0 = get_gamma_parameters(number_data_points, "both_simple", spline_func)
-        p_value = cumulative_SID_gamma(SI, alpha, beta, I0)
-    elif test == "chi2_hpm":
-        alpha, beta, I0 = get_gamma_parameters(number_data_points, "both", spline_func)
-        p_value = cumulative_SID_gamma(SI, alpha, beta, I0)
-    else:
-        print("Error: Test \"%s\" not available!")
-        print("Exiting. Returning -1.")
-        return -1.
+    p_value = p_values(SI, number_data_points, test, spline_func)
+    if p_value.ndim == 0:
+        return float(p_value)
     return p_value
 
 
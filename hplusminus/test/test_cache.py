@@ -0,0 +1,62 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import numpy as np
+import scipy.interpolate
+from .. import cache, evaluate, sid
+
+
+def test_result_cache(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / "cache"))
+    rng = np.random.default_rng(0)
+    normalized_residuals = rng.normal(size=500)
+    res = evaluate.all_statistical_tests(normalized_residuals, cache=result_cache)
+    assert len(result_cache) == 1
+    cached = evaluate.all_statistical_tests(normalized_residuals, cache=result_cache)
+    assert list(cached) == list(res)
+    for test in res:
+        assert list(cached[test]) == list(res[test])
+        assert cached[test]['label'] == res[test]['label']
+        assert np.isclose(cached[test]['p'], res[test]['p'], rtol=1e-15, atol=0.)
+    # Keys depend on the residuals, the options, and the spline parameters
+    tests = list(evaluate.test_labels)
+    key = cache.array_key(normalized_residuals, zeros=None, seed=0, tests=tests)
+    assert key in result_cache
+    assert cache.array_key(normalized_residuals[:-1], zeros=None, seed=0, tests=tests) != key
+    assert cache.array_key(normalized_residuals, zeros="break", seed=0, tests=tests) != key
+    assert cache.array_key(normalized_residuals, zeros=None, seed=0, tests=["h"]) != key
+    spline_func = sid.init()
+    assert cache.array_key(normalized_residuals, spline_func, zeros=None, seed=0, tests=tests) == key
+    spline = spline_func["both"]["alpha"]
+    spline_func["both"]["alpha"] = scipy.interpolate.BSpline(spline.t, spline.c + 1e-12, spline.k)
+    assert cache.array_key(normalized_residuals, spline_func, zeros=None, seed=0, tests=tests) != key
+
+
+def test_result_cache_file_key(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / "cache"))
+    file_name = str(tmp_path / "residuals.txt")
+    np.savetxt(file_name, np.random.default_rng(1).normal(size=(300, 2)))
+    res = evaluate.all_statistical_tests_from_file(file_name, cache=result_cache)
+    tests = list(evaluate.test_labels)
+    assert cache.file_key(file_name, 1, fmt=None, tests=tests) in result_cache
+    assert cache.file_key(file_name, 2, fmt=None, tests=tests) not in result_cache
+    assert evaluate.all_statistical_tests_from_file(file_name, cache=result_cache)['hpm']['p'] == res['hpm']['p']
+    np.savetxt(file_name, np.random.default_rng(2).normal(size=(300, 2)))
+    assert cache.file_key(file_name, 1, fmt=None, tests=tests) not in result_cache
+
+
+def test_result_cache_eviction(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / "cache"))
+    res = evaluate.all_statistical_tests(np.random.default_rng(0).normal(size=100))
+    result_cache.put("a", res)
+    size = result_cache.size()
+    result_cache = cache.ResultCache(str(tmp_path / "cache"), max_size=2 * size)
+    result_cache.put("b", res)
+    # Accessing "a" makes "b" the least recently used entry
+    assert result_cache.get("a") is not None
+    result_cache.put("c", res)
+    assert len(result_cache) == 2
+    assert "a" in result_cache and "b" not in result_cache and "c" in result_cache
+    assert result_cache.get("b") is None
+    result_cache.clear()
+    assert len(result_cache) == 0 and result_cache.size() == 0
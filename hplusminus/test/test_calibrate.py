@@ -0,0 +1,40 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import os
+import numpy as np
+from .. import calibrate, sid
+
+
+def test_calibrate(tmp_path):
+    work_dir = str(tmp_path / "work")
+    opath = str(tmp_path / "gsp")
+    Ns = [32, 100, 316, 1000, 3162]
+    spline_par, gamma_par = calibrate.calibrate(work_dir, Ns, 600, opath=opath, chunk_size=200, n_jobs=2)
+    chunks = sorted(os.listdir(work_dir))
+    assert len(chunks) == 15
+    assert all("_size200_" in f for f in chunks)
+    assert calibrate.default_chunk_size(10**6) == 4
+
+    # resuming does not resimulate existing chunks
+    mtimes = [os.path.getmtime(os.path.join(work_dir, f)) for f in chunks]
+    spline_par_resumed, gamma_par_resumed = calibrate.calibrate(work_dir, Ns, 600, chunk_size=200)
+    assert mtimes == [os.path.getmtime(os.path.join(work_dir, f)) for f in chunks]
+    assert np.array_equal(gamma_par_resumed['h']['I0'], gamma_par['h']['I0'])
+    # chunks of another chunk size are not mixed in
+    calibrate.simulate(work_dir, [1000], 300, chunk_size=300)
+    assert calibrate.load_SI(work_dir, 1000, 200)['h'].shape[0] == 600
+    assert calibrate.load_SI(work_dir, 1000, 300)['h'].shape[0] == 300
+
+    # output is read by sid and roughly agrees with the bundled parameters
+    spline_func = sid.init(opath)
+    bundled = sid.get_spline_cache()
+    for k in calibrate.calibration_tests:
+        SI = calibrate.load_SI(work_dir, 1000, 200)[k]
+        median = np.median(SI)
+        p_calibrated = sid.cumulative_SID_gamma(median, *sid.get_gamma_parameters(1000, k, spline_func))
+        p_bundled = sid.cumulative_SID_gamma(median, *sid.get_gamma_parameters(1000, k, bundled))
+        assert abs(p_calibrated - 0.5) < 0.1
+        assert abs(p_bundled - 0.5) < 0.1
+        ratio = calibrate.tail_accuracy(SI, *calibrate.fit_gamma_parameters(SI), p_levels=[0.1])
+        assert 0.7 < ratio[0] < 1.3
@@ -0,0 +1,58 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import itertools
+import os
+import numpy as np
+import pytest
+from .. import exact, rld, sid
+
+
+@pytest.mark.parametrize("N", [1, 2, 7, 12])
+def test_exact_enumeration(N, tmp_path):
+    SI = {"h": [], "hpm": []}
+    for signs in itertools.product([1., -1.], repeat=N):
+        num, run_lengths, histo, edges = rld.get_run_length_distributions(np.array(signs), sparse=True)
+        SI["h"].append(rld.SI_h(N, histo['all']))
+        SI["hpm"].append(rld.SI_hpm(N, num[1], histo['plus'], histo['minus']))
+    for test in SI:
+        values = np.array(SI[test])
+        reference = np.array([(values >= x - 1e-7).mean() for x in values])
+        p = exact.p_values(values, N, test, cache_dir=str(tmp_path))
+        assert np.allclose(p, reference, rtol=1e-10, atol=0.)
+        assert os.path.exists(str(tmp_path / ("SI_%s_N%d.pack" % (test, N))))
+
+
+def test_exact_cache(tmp_path, monkeypatch):
+    # Without HPLUSMINUS_CACHE_DIR or cache_dir, nothing is written to disk
+    monkeypatch.delenv("HPLUSMINUS_CACHE_DIR", raising=False)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    exact.survival_function.cache_clear()
+    SI, survival = exact.survival_function(9, "hpm")
+    assert os.listdir(str(tmp_path)) == []
+    assert survival[0] == pytest.approx(1.)
+    exact.survival_function.cache_clear()
+    # The partition table of the largest N is reused for smaller N
+    table = exact._partition_table(9)
+    assert exact._partition_table(5) is table
+    assert np.allclose(exact._build_partition_table(5)[(5, 2)][1], table[(5, 2)][1])
+
+
+def test_exact_distribution_normalized():
+    for distribution in (exact.SI_h_distribution, exact.SI_hpm_distribution):
+        SI, prob = distribution(40)
+        assert prob.sum() == pytest.approx(1., rel=1e-12)
+        assert np.all(np.diff(SI) > 0)
+
+
+def test_p_values_exact(tmp_path, monkeypatch):
+    monkeypatch.setenv("HPLUSMINUS_CACHE_DIR", str(tmp_path))
+    exact.survival_function.cache_clear()
+    p_exact = sid.p_values([20., 30.], 40, "h", method="exact")
+    p_gamma = sid.p_values([20., 30.], 40, "h")
+    assert np.allclose(p_exact, p_gamma, atol=0.05)
+    with pytest.raises(ValueError):
+        sid.p_values(20., 40, "chi2", method="exact")
+    with pytest.raises(ValueError):
+        sid.p_values(20., exact.MAX_EXACT_N + 1, "h", method="exact")
+    exact.survival_function.cache_clear()
@@ -2,8 +2,12 @@
 # Released under the MIT Licence, see the file LICENSE.txt.
 
 import os
+import subprocess
+import sys
+import warnings
+import numpy as np
 import pytest
-from .. import io, evaluate
+from .. import io, evaluate, sid
 
 package_dir = os.path.abspath(os.path.join(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."), "..")))
 examples_dir = os.path.join(package_dir, "examples")
@@ -49,3 +53,389 @@ def test_save_to_csv(case):
     normalized_residuals = io.read_residuals_from_file(file_name=input_file, column=1)
     results = evaluate.all_statistical_tests(normalized_residuals)
     io.save_to_file(results, "out.csv")
+
+
+def test_evaluate_batch():
+    normalized_residuals = [io.read_residuals_from_file(file_name=os.path.join(examples_dir, case), column=1) for case in test_cases]
+    batch = evaluate.all_statistical_tests_batch(np.vstack(normalized_residuals))
+    for i, residuals in enumerate(normalized_residuals):
+        results = evaluate.all_statistical_tests(residuals)
+        for test in results:
+            assert batch[test]['I'][i] == pytest.approx(results[test]['I'], rel=1e-10)
+            assert batch[test]['p'][i] == pytest.approx(results[test]['p'], rel=1e-8)
+
+
+def test_evaluate_ragged():
+    rng = np.random.default_rng(42)
+    normalized_residuals = [rng.normal(size=n) for n in (10, 333, 2000)]
+    ragged = evaluate.all_statistical_tests_ragged(normalized_residuals)
+    for i, residuals in enumerate(normalized_residuals):
+        results = evaluate.all_statistical_tests(residuals)
+        assert ragged['N'][i] == len(residuals)
+        for test in results:
+            assert ragged[test]['I'][i] == pytest.approx(results[test]['I'], rel=1e-10)
+            assert ragged[test]['p'][i] == pytest.approx(results[test]['p'], rel=1e-8)
+
+
+def test_spline_cache():
+    from concurrent.futures import ThreadPoolExecutor
+    sid.reset_spline_cache()
+    with ThreadPoolExecutor(4) as pool:
+        spline_funcs = list(pool.map(lambda i: sid.get_spline_cache(), range(8)))
+    assert all(spline_func is spline_funcs[0] for spline_func in spline_funcs)
+    sid.reset_spline_cache(sid._get_package_gsp())
+    assert sid.get_spline_cache() is not spline_funcs[0]
+    sid.reset_spline_cache()
+
+
+def test_evaluate_spline_func():
+    input_file = os.path.join(examples_dir, test_cases[0])
+    normalized_residuals = io.read_residuals_from_file(file_name=input_file, column=1)
+    results = evaluate.all_statistical_tests(normalized_residuals, spline_func=sid.init())
+    reference = evaluate.all_statistical_tests(normalized_residuals)
+    for test in results:
+        assert results[test]['p'] == reference[test]['p']
+
+
+def test_packed_spline_parameters(tmp_path):
+    gsp_dir = sid._get_package_gsp()
+    packed_file = sid.pack_spline_parameters(gsp_dir, str(tmp_path / sid.PACKED_SPLINE_PARAMETERS))
+    packed = sid.load_spline_parameters(packed_file)
+    for test in packed:
+        for na in packed[test]:
+            for tmp in packed[test][na]:
+                iname = os.path.join(gsp_dir, "%s_%s_%s.npy" % (tmp, test, na))
+                assert np.array_equal(packed[test][na][tmp], np.load(iname))
+
+
+def test_sparse_histograms():
+    from .. import rld
+    rng = np.random.default_rng(7)
+    for signs in (np.sign(rng.normal(size=1000)), np.repeat([1., -1., 1., -1.], [3, 1, 5, 2]), np.ones(10)):
+        N = signs.shape[0]
+        num, run_lengths, dense, edges = rld.get_run_length_distributions(signs)
+        num_sparse, run_lengths_sparse, sparse, edges_sparse = rld.get_run_length_distributions(signs, sparse=True)
+        assert num_sparse == num
+        assert edges_sparse is None
+        for k in dense:
+            assert np.array_equal(sparse[k].to_dense(N + 1), dense[k])
+        assert rld.SI_h(N, sparse['all']) == pytest.approx(rld.SI_h(N, dense['all']), rel=1e-12)
+        assert rld.SI_hpm(N, num[1], sparse['plus'], sparse['minus']) == \
+            pytest.approx(rld.SI_hpm(N, num[1], dense['plus'], dense['minus']), rel=1e-12)
+        assert rld.SI_RLD_conditional(sparse['plus'], num[1]) == \
+            pytest.approx(rld.SI_RLD_conditional(dense['plus'], num[1]), rel=1e-12)
+
+
+@pytest.mark.parametrize("test", list(evaluate.test_labels))
+def test_p_values_vectorized(test):
+    spline_func = sid.get_spline_cache()
+    SI = np.array([[5., 20., 40.], [60., 80., 300.]])
+    number_data_points = np.array([100, 1000, 5000])
+    p = sid.p_values(SI, number_data_points, test)
+    assert p.shape == SI.shape
+    for i in range(SI.shape[0]):
+        for j in range(SI.shape[1]):
+            assert p[i, j] == pytest.approx(sid.get_p_value(SI[i, j], number_data_points[j], test, spline_func), rel=1e-12)
+
+
+def test_p_values_unknown_test():
+    with pytest.raises(ValueError):
+        sid.p_values(1., 100, "chi3")
+
+
+@pytest.mark.parametrize("fmt", ["txt", "csv", "npy", "raw"])
+def test_evaluate_from_file(fmt, tmp_path):
+    input_file = os.path.join(examples_dir, test_cases[1])
+    normalized_residuals = io.read_residuals_from_file(file_name=input_file, column=1)
+    data = np.c_[np.zeros_like(normalized_residuals), normalized_residuals]
+    file_name = str(tmp_path / ("residuals." + {"raw": "bin"}.get(fmt, fmt)))
+    if fmt == "npy":
+        np.save(file_name, data)
+    elif fmt == "raw":
+        normalized_residuals.tofile(file_name)
+    else:
+        np.savetxt(file_name, data, delimiter="," if fmt == "csv" else " ")
+    column = 1 if fmt == "raw" else 2
+    assert io.detect_format(file_name) == fmt
+    assert np.array_equal(io.read_residuals_from_file(file_name, column), normalized_residuals)
+    results = evaluate.all_statistical_tests_from_file(file_name, column, chunk_size=64)
+    reference = evaluate.all_statistical_tests(normalized_residuals)
+    for test in reference:
+        assert results[test]['I'] == pytest.approx(reference[test]['I'], rel=1e-12)
+        assert results[test]['p'] == pytest.approx(reference[test]['p'], rel=1e-12)
+
+
+def test_evaluate_paths_with_zeros(tmp_path):
+    normalized_residuals = np.round(np.random.default_rng(9).normal(size=3000) * 2.) / 2.
+    file_name = str(tmp_path / "residuals.npy")
+    np.save(file_name, normalized_residuals)
+    reference = evaluate.all_statistical_tests(normalized_residuals)
+    batch = evaluate.all_statistical_tests_batch(normalized_residuals[np.newaxis])
+    from_file = evaluate.all_statistical_tests_from_file(file_name, chunk_size=100)
+    for test in reference:
+        assert batch[test]['I'][0] == pytest.approx(reference[test]['I'], rel=1e-12)
+        assert from_file[test]['I'] == pytest.approx(reference[test]['I'], rel=1e-12)
+
+
+def test_io_missing_column(tmp_path):
+    file_name = str(tmp_path / "residuals.txt")
+    np.savetxt(file_name, np.zeros((10, 2)))
+    with pytest.raises(RuntimeError):
+        io.read_residuals_from_file(file_name, column=3)
+    # Raw binary files and single-column text files only have column 1
+    for ending in [".bin", ".txt"]:
+        file_name = str(tmp_path / ("single" + ending))
+        if ending == ".bin":
+            np.zeros(10).tofile(file_name)
+        else:
+            np.savetxt(file_name, np.zeros(10))
+        assert io.read_residuals_from_file(file_name, column=1).shape == (10,)
+        with pytest.raises(RuntimeError):
+            io.read_residuals_from_file(file_name, column=3)
+        with pytest.raises(ValueError):
+            evaluate.all_statistical_tests_from_file(file_name, column=2)
+        with pytest.raises(ValueError):
+            io.read_columns_from_file(file_name, [1, 2])
+
+
+@pytest.mark.parametrize("options", [["--col", "2"], ["--col", "2", "--zeros", "break"], []])
+def test_command_line_errors(tmp_path, options):
+    file_name = str(tmp_path / "residuals.txt")
+    with open(file_name, "w") as fp:
+        fp.write("1.0\n-2.0\n" + ("0.5\n" if len(options) > 0 else "abc\n"))
+    process = subprocess.run([sys.executable, "hplusminus_tests.py", file_name] + options, cwd=package_dir,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    # Errors are reported in a single line, as in batch mode
+    assert process.returncode == 1
+    assert process.stderr.startswith("Error evaluating \"%s\": " % file_name)
+    assert len(process.stderr.splitlines()) == 1
+
+
+@pytest.mark.parametrize("width,stride", [(50, 1), (120, 7), (500, 1)])
+def test_scan_sliding_window(width, stride):
+    input_file = os.path.join(examples_dir, test_cases[1])
+    normalized_residuals = io.read_residuals_from_file(file_name=input_file, column=1)
+    scan = evaluate.scan_statistical_tests(normalized_residuals, width=width, stride=stride)
+    assert np.array_equal(scan['start'], np.arange(0, normalized_residuals.shape[0] - width + 1, stride))
+    reference = evaluate.all_statistical_tests_batch(np.vstack([normalized_residuals[s:s + width] for s in scan['start']]))
+    for test in evaluate.test_labels:
+        assert np.allclose(scan[test]['I'], reference[test]['I'], rtol=1e-9)
+        assert np.allclose(scan[test]['p'], reference[test]['p'], rtol=1e-7)
+
+
+def test_scan_segments():
+    rng = np.random.default_rng(3)
+    normalized_residuals = rng.normal(size=1000)
+    boundaries = [10, 100, 100, 400, 1000]
+    # Empty segments give NaN without warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        scan = evaluate.scan_statistical_tests(normalized_residuals, boundaries=boundaries)
+        reference = evaluate.all_statistical_tests_ragged([normalized_residuals[a:b] for a, b in zip(boundaries[:-1], boundaries[1:])])
+    assert np.array_equal(scan['stop'] - scan['start'], reference['N'])
+    for test in evaluate.test_labels:
+        assert np.array_equal(scan[test]['I'], reference[test]['I'], equal_nan=True)
+        assert np.isnan(scan[test]['I'][1]) and np.isnan(scan[test]['p'][1])
+        assert np.all(np.isfinite(scan[test]['p'][[0, 2, 3]]))
+    for invalid in ([], [10], [[0, 10]], [100, 10], [0, 1001]):
+        with pytest.raises(ValueError):
+            evaluate.scan_statistical_tests(normalized_residuals, boundaries=invalid)
+
+
+def test_global_statistical_tests():
+    rng = np.random.default_rng(5)
+    normalized_residuals_list = [rng.normal(size=n) for n in (100, 500, 2000)]
+    res_global, res = evaluate.global_statistical_tests(normalized_residuals_list)
+    res_global_parallel, res_parallel = evaluate.global_statistical_tests(normalized_residuals_list, n_jobs=2)
+    assert np.array_equal(res, res_parallel)
+    for test in evaluate.test_labels:
+        assert res_global[test]['I'] == pytest.approx(res[test]['I'].sum())
+        assert res_global[test]['p'] == res_global_parallel[test]['p']
+        assert 0. < res_global[test]['p'] <= 1.
+    # a single data set reproduces the per-data-set p-value
+    res_global, res = evaluate.global_statistical_tests(normalized_residuals_list[1:2])
+    for test in evaluate.test_labels:
+        assert res_global[test]['p'] == pytest.approx(res[test]['p'][0], rel=1e-3)
+
+
+def test_combined_p_value():
+    from scipy.stats import gamma as gamma_dist
+    # equal scale parameters: exact result
+    assert sid.combined_p_value(30., [2., 3.], [0.5, 0.5], [4., 6.]) == pytest.approx(gamma_dist.sf(20., 5., scale=2.))
+    # unequal scale parameters: numerical convolution agrees with nearly equal scale parameters
+    assert sid.combined_p_value(30., [2., 3.], [0.5, 0.5 + 1e-6], [4., 6.]) == \
+        pytest.approx(gamma_dist.sf(20., 5., scale=2.), rel=1e-3)
+
+
+def test_log_p_values_large_N():
+    import mpmath
+    from .. import rld
+    number_data_points = 10**7
+    SI = rld.SI_chi2(np.array([1e7, 2e7]), number_data_points)
+    assert np.all(np.isfinite(SI))
+    log_p = sid.log_p_values(SI, number_data_points, "chi2")
+    assert np.all(np.isfinite(log_p))
+    assert log_p[0] == pytest.approx(np.log(sid.p_values(SI[0], number_data_points, "chi2")))
+    assert sid.p_values(SI[1], number_data_points, "chi2") == 0.
+    alpha, beta, I0 = sid.gamma_parameters_for_tests(number_data_points, "chi2")
+    reference = float(mpmath.log(mpmath.gammainc(alpha, beta * (SI[1] - I0), regularized=True)))
+    assert log_p[1] == pytest.approx(reference, rel=1e-12)
+
+
+def test_log10_p_values_strong_rejection(capsys):
+    rng = np.random.default_rng(6)
+    normalized_residuals = rng.normal(size=(2, 10000)) + np.array([[3.], [4.]])
+    results = evaluate.all_statistical_tests(normalized_residuals[0])
+    assert results['chi2']['p'] == 0.
+    assert np.isfinite(results['chi2']['log10_p'])
+    io.print_pvalues_to_screen(results)
+    assert "nan" not in capsys.readouterr().out
+    batch = evaluate.all_statistical_tests_batch(normalized_residuals)
+    for test in evaluate.test_labels:
+        assert batch[test]['log10_p'][0] == pytest.approx(results[test]['log10_p'], rel=1e-8)
+    # the worse model has the smaller p-value although both underflow
+    assert batch['chi2']['log10_p'][1] < batch['chi2']['log10_p'][0]
+    assert io.format_log10(-1234.5) == "3.16e-1235"
+
+
+def test_combined_p_value_log10():
+    alpha, beta, I0 = [2., 3.], [0.5, 0.6], [4., 6.]
+    assert sid.combined_p_value(30., alpha, beta, I0, log10=True) == \
+        pytest.approx(np.log10(sid.combined_p_value(30., alpha, beta, I0)))
+    assert np.isfinite(sid.combined_p_value(1e4, alpha, beta, I0, log10=True))
+    assert sid.combined_p_value(1e4, [2., 3.], [0.5, 0.5], I0, log10=True) < -1000.
+
+
+def test_all_statistical_tests_segmented():
+    rng = np.random.default_rng(8)
+    normalized_residuals = rng.normal(size=3000)
+    reference = evaluate.all_statistical_tests(normalized_residuals)
+    results = evaluate.all_statistical_tests(normalized_residuals, zeros="break")
+    for test in reference:
+        assert results[test]['I'] == pytest.approx(reference[test]['I'], rel=1e-10)
+        assert results[test]['p'] == pytest.approx(reference[test]['p'], rel=1e-6)
+    gapped = normalized_residuals.copy()
+    gapped[1000:1010] = np.nan
+    gapped[2000] = 0.
+    res_global, res = evaluate.all_statistical_tests_segmented(gapped)
+    assert np.array_equal(res['start'], [0, 1010, 2001])
+    assert np.array_equal(res['stop'], [1000, 2000, 3000])
+    for test in evaluate.test_labels:
+        assert res_global[test]['I'] == pytest.approx(res[test]['I'].sum())
+    res_global, res = evaluate.all_statistical_tests_segmented(gapped, zeros="random", seed=1)
+    assert np.array_equal(res['N'], [1000, 1990])
+
+
+def test_all_statistical_tests_segmented_quantized():
+    # Quantized residuals with about 20% zeros split into many short segments, including single data points
+    normalized_residuals = np.round(np.random.default_rng(10).normal(size=600) * 2.) / 2.
+    res_global, res = evaluate.all_statistical_tests_segmented(normalized_residuals)
+    assert np.any(res['N'] == 1) and np.all(res['N'] < sid.calibrated_range("hpm")[0])
+    for test in evaluate.test_labels:
+        assert res_global[test]['I'] == pytest.approx(res[test]['I'][res['N'] >= 2].sum())
+        assert 0. < res_global[test]['p'] <= 1.
+        assert res_global[test]['log10_p'] == pytest.approx(np.log10(res_global[test]['p']), abs=1e-8)
+    # h and hpm are deterministic for N = 1 and N = 2, respectively
+    alpha, beta, I0 = sid.exact_gamma_parameters([1, 2, 2, 3], "h")
+    assert np.array_equal(alpha[:3], [0., 0., 0.]) and alpha[3] > 0.
+    assert sid.combined_p_value(I0[:3].sum(), alpha[:3], beta[:3], I0[:3]) == 1.
+    assert sid.combined_p_value(I0[:3].sum() + 0.1, alpha[:3], beta[:3], I0[:3]) == 0.
+
+
+def test_evaluate_files(tmp_path):
+    from .. import cache
+    rng = np.random.default_rng(0)
+    file_names = []
+    for i in range(3):
+        file_names.append(str(tmp_path / ("residuals_%d.txt" % i)))
+        np.savetxt(file_names[-1], rng.normal(size=(200, 3)))
+    file_names.append(str(tmp_path / "missing.txt"))
+    result_cache = cache.ResultCache(str(tmp_path / "cache"))
+    for n_jobs in [1, 2]:
+        results = list(evaluate.evaluate_files(file_names, [1, 3], n_jobs=n_jobs, cache=result_cache))
+        assert len(results) == 8
+        for file_name, column, res, error in results:
+            if file_name.endswith("missing.txt"):
+                assert res is None and error.startswith("FileNotFoundError")
+                continue
+            assert error is None
+            reference = evaluate.all_statistical_tests(np.loadtxt(file_name)[:, column - 1])
+            for test in reference:
+                assert np.isclose(res[test]['p'], reference[test]['p'], rtol=1e-12, atol=0.)
+    assert len(result_cache) == 6
+    results = results_all = list(evaluate.evaluate_files(file_names[:1]))
+    assert [column for file_name, column, res, error in results] == [1, 2, 3]
+    with open(str(tmp_path / "out.csv"), "w") as fp:
+        assert io.save_batch_to_csv(results, fp) == 3
+    table = np.genfromtxt(str(tmp_path / "out.csv"), delimiter=",", names=True, dtype=None, encoding="utf-8")
+    assert np.allclose(table['hpm_p'], [res['hpm']['p'] for file_name, column, res, error in results])
+    # An invalid column only fails itself
+    results = list(evaluate.evaluate_files(file_names[:1], [1, 4, 3], cache=result_cache))
+    assert [column for file_name, column, res, error in results] == [1, 4, 3]
+    assert results[1][2] is None and results[1][3].startswith("ValueError")
+    for i in [0, 2]:
+        assert results[i][3] is None
+        assert results[i][2]['h']['p'] == results_all[results[i][1] - 1][2]['h']['p']
+
+
+@pytest.mark.parametrize("zeros", [None, "break"])
+def test_selected_tests(zeros):
+    from .. import profiling, rld
+    normalized_residuals = np.random.default_rng(0).normal(size=1000)
+    reference = evaluate.all_statistical_tests(normalized_residuals, zeros=zeros)
+    for tests in [["chi2"], ["h"], ["chi2_h"], ["chi2_hpm", "h"], "hpm"]:
+        with profiling.Profile() as profile:
+            res = evaluate.all_statistical_tests(normalized_residuals, zeros=zeros, tests=tests)
+        assert list(res) == [test for test in evaluate.test_labels if test in np.atleast_1d(tests)]
+        for test in res:
+            assert res[test]['I'] == reference[test]['I']
+            assert res[test]['p'] == reference[test]['p']
+        if zeros is None:
+            stages = profile.to_dict()
+            assert ("rld.SI_chi2" in stages) == any(test.startswith("chi2") for test in res)
+            assert ("rld.SI_hpm" in stages) == any(test.endswith("hpm") for test in res)
+            assert ("rld.get_run_length_distributions" in stages) == (list(res) != ["chi2"])
+    with pytest.raises(ValueError):
+        evaluate.all_statistical_tests(normalized_residuals, tests=["chi3"])
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.sign(normalized_residuals), sparse=True,
+                                                                     histograms=["all"])
+    assert list(histo) == ["all"]
+
+
+def test_selected_tests_batch():
+    from .. import profiling, rld
+    normalized_residuals = np.random.default_rng(1).normal(size=(4, 300))
+    gapped = normalized_residuals.ravel().copy()
+    gapped[[100, 700]] = np.nan
+    reference = evaluate.all_statistical_tests_batch(normalized_residuals)
+    reference_scan = evaluate.scan_statistical_tests(normalized_residuals[0], width=50, stride=10)
+    reference_global = evaluate.global_statistical_tests(list(normalized_residuals))[0]
+    reference_segmented = evaluate.all_statistical_tests_segmented(gapped)[0]
+    for tests in [["chi2"], ["h"], ["chi2_hpm", "h"]]:
+        selected = [test for test in evaluate.test_labels if test in tests]
+        res = evaluate.all_statistical_tests_batch(normalized_residuals, tests=tests)
+        scan = evaluate.scan_statistical_tests(normalized_residuals[0], width=50, stride=10, tests=tests)
+        assert list(res.dtype.names) == ["N"] + selected
+        assert list(scan.dtype.names) == ["start", "stop", "N"] + selected
+        with profiling.Profile() as profile:
+            res_global = evaluate.global_statistical_tests(list(normalized_residuals), tests=tests)[0]
+            res_segmented, res = evaluate.all_statistical_tests_segmented(gapped, tests=tests)
+        # Only the Shannon information components required by the selected tests are calculated
+        assert ("rld.SI_chi2" in profile.to_dict()) == any(test.startswith("chi2") for test in selected)
+        assert list(res_global) == selected and list(res_segmented) == selected
+        assert list(res.dtype.names) == ["start", "stop", "N"] + selected
+        for test in selected:
+            assert np.array_equal(evaluate.all_statistical_tests_batch(normalized_residuals, tests=tests)[test]['p'],
+                                  reference[test]['p'])
+            assert np.array_equal(scan[test]['log10_p'], reference_scan[test]['log10_p'])
+            assert res_global[test]['p'] == reference_global[test]['p']
+            assert res_segmented[test]['p'] == reference_segmented[test]['p']
+
+    accumulator = rld.RunLengthAccumulator(["chi2"])
+    accumulator.update(normalized_residuals[0])
+    assert accumulator.nPlus == 0
+    assert accumulator.SI_chi2() == pytest.approx(rld.SI_chi2((normalized_residuals[0]**2).sum(), 300))
+    with pytest.raises(ValueError):
+        accumulator.SI_h()
+    with pytest.raises(ValueError):
+        rld.RunLengthAccumulator(["chi3"])
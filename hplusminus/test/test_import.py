@@ -0,0 +1,33 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import os
+import subprocess
+import sys
+
+
+# Maximum time in seconds to import the modules needed for evaluating the tests, in addition to numpy
+IMPORT_TIME_BUDGET = 0.5
+# Modules that must only be imported when used
+DEFERRED_MODULES = ("scipy.stats", "scipy.interpolate", "mpmath", "numba")
+
+
+def _run_python(code):
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return subprocess.check_output([sys.executable, "-c", code], cwd=root_dir, universal_newlines=True)
+
+
+def test_deferred_imports():
+    code = ("import sys; import hplusminus, hplusminus.evaluate, hplusminus.io, hplusminus.cache; "
+            "print(' '.join(m for m in %r if m in sys.modules))" % (DEFERRED_MODULES,))
+    assert _run_python(code).split() == []
+    # Names of rld and sid are still available from the package
+    code = "import hplusminus; print(hplusminus.SI_chi2(3., 4) == hplusminus.rld.SI_chi2(3., 4), hplusminus.p_values)"
+    assert _run_python(code).startswith("True <function p_values")
+
+
+def test_import_time():
+    code = ("import time; import numpy; t = time.perf_counter(); import hplusminus.evaluate; "
+            "print(time.perf_counter() - t)")
+    elapsed = min(float(_run_python(code)) for i in range(3))
+    assert elapsed < IMPORT_TIME_BUDGET
@@ -0,0 +1,31 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import numpy as np
+import pytest
+from .. import lookup, sid
+
+
+def test_lookup_table_error_bound(tmp_path):
+    table = lookup.build_lookup_table(tests=["chi2", "hpm"], tolerance=1e-3)
+    file_name = str(tmp_path / "table.pack")
+    lookup.save_lookup_table(table, file_name)
+    table = lookup.load_lookup_table(file_name)
+    rng = np.random.default_rng(0)
+    number_data_points = rng.integers(40, 90000, 10000)
+    for test in ["chi2", "hpm"]:
+        assert float(table[test + "_max_error"]) <= 1e-3
+        alpha, beta, I0 = sid.gamma_parameters_for_tests(number_data_points, test)
+        SI = I0 + rng.uniform(-1., 40., number_data_points.shape) / beta
+        # Close to I0, the log p-values of the chi2 test are most sensitive to the interpolation of I0
+        SI[:5000] = I0[:5000] + 10**rng.uniform(-9., 0., 5000)
+        log_p = lookup.log_p_values(SI, number_data_points, test, table)
+        reference = np.log(sid.p_values(SI, number_data_points, test))
+        assert np.max(np.abs(log_p - reference)) <= float(table[test + "_max_error"])
+    # Outside the table, p-values are calculated without interpolation
+    SI = np.array([20., 200.])
+    number_data_points = np.array([10, 200000])
+    assert np.allclose(lookup.p_values(SI, number_data_points, "hpm", table),
+                       sid.p_values(SI, number_data_points, "hpm"), rtol=1e-10, atol=0.)
+    with pytest.raises(ValueError):
+        lookup.p_values(20., 100, "h", table)
@@ -0,0 +1,27 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import os
+import numpy as np
+from .. import evaluate, power
+
+package_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+examples_dir = os.path.join(package_dir, "examples")
+
+
+def test_statistical_power_reproducible():
+    model_for_residuals = np.loadtxt(os.path.join(examples_dir, "alternative_model.txt"))
+    serial = power.statistical_power(model_for_residuals, 50, seed=1, block_size=16)
+    parallel = power.statistical_power(model_for_residuals, 50, seed=1, block_size=16, n_jobs=2)
+    for test in evaluate.test_labels:
+        assert serial["p"][test].shape == (50,)
+        assert np.array_equal(serial["p"][test], parallel["p"][test])
+        assert np.all(np.diff(serial["power"][test]) >= 0)
+
+
+def test_statistical_power_true_model():
+    res = power.statistical_power(np.zeros(200), 400, seed=2, significance_levels=np.array([0.5, 1.]))
+    for test in evaluate.test_labels:
+        assert res["histogram"][test].shape == (100,)
+        assert abs(res["power"][test][0] - 0.5) < 0.15
+        assert res["power"][test][1] == 1.
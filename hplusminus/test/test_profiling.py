@@ -0,0 +1,78 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+from io import StringIO
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+import numpy as np
+import pytest
+from .. import evaluate, profiling, rld
+
+
+def test_profile_stages():
+    normalized_residuals = np.random.default_rng(0).normal(size=1000)
+    with profiling.Profile() as profile:
+        res = evaluate.all_statistical_tests(normalized_residuals)
+        with profiling.stage("custom"):
+            rld.SI_number_of_positive_signs(1000, 501, 400, 197, method="mpmath")
+    stages = profile.to_dict()
+    assert stages["evaluate.all_statistical_tests"]["calls"] == 1
+    assert stages["rld.get_run_length_distributions"]["calls"] == 1
+    # The gamma distribution parameters are evaluated once per test for both the p-value and its logarithm
+    assert stages["sid.log_cumulative_SID_gamma"]["calls"] == len(res)
+    assert "sid.p_values" not in stages and "sid.log_p_values" not in stages
+    assert stages["custom"]["time"] >= stages["rld.hyp2f1"]["time"]
+    # Nested stages are included in the time of the enclosing stage
+    assert stages["evaluate.all_statistical_tests"]["time"] >= stages["rld.SI_hpm"]["time"]
+    assert all(entry["peak_bytes"] is None for entry in stages.values())
+    fp = StringIO()
+    profile.write_json_lines(fp)
+    lines = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert [line["stage"] for line in lines] == list(stages)
+    # Nothing is recorded without active profiles
+    evaluate.all_statistical_tests(normalized_residuals)
+    assert profile.to_dict() == stages
+
+
+@pytest.mark.parametrize("reset_peak", [True, False])
+def test_profile_memory_and_callback(reset_peak, monkeypatch):
+    if not reset_peak:
+        # Python < 3.9
+        monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+    calls = []
+
+    def callback(stage, elapsed, peak_bytes):
+        calls.append((stage, elapsed, peak_bytes))
+
+    profiling.add_callback(callback)
+    try:
+        with profiling.Profile(memory=True) as profile:
+            with profiling.stage("outer"):
+                rld.get_run_length_distributions(np.sign(np.random.default_rng(0).normal(size=10**5)))
+    finally:
+        profiling.remove_callback(callback)
+    stages = profile.to_dict()
+    # Dense histograms of 10^5 + 1 int64 bins are allocated, and the peak of the inner stage counts for the outer one
+    assert stages["rld.get_run_length_distributions"]["peak_bytes"] > 8 * 10**5
+    assert stages["outer"]["peak_bytes"] >= stages["rld.get_run_length_distributions"]["peak_bytes"]
+    assert [c[0] for c in calls] == ["rld.get_run_length_distributions", "outer"]
+    assert calls[1][2] == stages["outer"]["peak_bytes"]
+    rld.get_run_length_distributions(np.ones(10))
+    assert len(calls) == 2
+
+
+def test_profile_command_line(tmp_path):
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    profile_file = str(tmp_path / "profile.jsonl")
+    subprocess.check_output([sys.executable, "hplusminus_tests.py",
+                             os.path.join("examples", "alternative_model_normalized_residuals.txt"),
+                             "--profile", profile_file], cwd=root_dir, stderr=subprocess.DEVNULL)
+    with open(profile_file) as fp:
+        stages = {line["stage"]: line for line in map(json.loads, fp)}
+    # The default single-file path reads the residuals in chunks into a run-length accumulator
+    for stage in ("evaluate.all_statistical_tests_from_file", "io.iter_residual_chunks",
+                  "rld.RunLengthAccumulator.update", "rld.RunLengthAccumulator.finalize"):
+        assert stages[stage]["calls"] >= 1
@@ -0,0 +1,201 @@
+# Copyright (c) 2020 Juergen Koefinger, Max Planck Institute of Biophysics, Frankfurt am Main, Germany
+# Released under the MIT Licence, see the file LICENSE.txt.
+
+import numpy as np
+import pytest
+from .. import rld
+
+
+# Reference implementations summing np.log(np.arange(...)), as used in hplusminus 1.0.1
+
+def reference_log_binomial(N, n):
+    lb = (np.log(np.arange(N - n + 1, N + 1))).sum()
+    lb -= (np.log(np.arange(1, n + 1))).sum()
+    return lb
+
+
+def reference_log_multinomial(N, nvec):
+    x = np.log(np.arange(1, N + 1))
+    lm = x.sum()
+    for i in range(nvec.shape[0]):
+        for j in range(nvec[i]):
+            lm -= x[j]
+    return lm
+
+
+def reference_SI_h(N, histo):
+    nc = histo.sum()
+    SI = (N - 1) * np.log(2)
+    SI -= (np.log(np.arange(1, nc + 1))).sum()
+    indices = np.where(histo > 0)[0]
+    for i in indices:
+        SI += (np.log(np.arange(1, histo[i] + 1))).sum()
+    return SI
+
+
+@pytest.mark.parametrize("N,n", [(0, 0), (1, 0), (1, 1), (10, 3), (100, 50), (12345, 17), (100000, 49999)])
+def test_log_binomial(N, n):
+    assert rld.log_binomial(N, n) == pytest.approx(reference_log_binomial(N, n), rel=1e-10, abs=1e-10)
+
+
+def test_log_multinomial():
+    rng = np.random.default_rng(0)
+    for size in (1, 5, 50):
+        nvec = rng.integers(0, 200, size=size)
+        N = nvec.sum()
+        assert rld.log_multinomial(N, nvec) == pytest.approx(reference_log_multinomial(N, nvec), rel=1e-10, abs=1e-10)
+
+
+@pytest.mark.parametrize("N", [10, 100, 1000, 100000])
+def test_SI_h(N):
+    rng = np.random.default_rng(N)
+    signs = np.sign(rng.normal(size=N))
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(signs)
+    assert rld.SI_h(N, histo['all']) == pytest.approx(reference_SI_h(N, histo['all']), rel=1e-10)
+    assert rld.SI_RLD_conditional(histo['plus'], num[1]) == pytest.approx(
+        -reference_log_multinomial(histo['plus'].sum(), histo['plus']) + reference_log_binomial(num[1] - 1, histo['plus'].sum() - 1),
+        rel=1e-10)
+
+
+@pytest.mark.parametrize("N,nPlus,nc,ncPlus", [(20, 10, 5, 3), (100, 40, 21, 10), (1000, 480, 501, 251), (5000, 2600, 2400, 1200),
+                                               (50, 20, 3, 2), (50, 20, 3, 1), (10, 5, 2, 1), (10, 10, 1, 1)])
+def test_SI_number_of_positive_signs(N, nPlus, nc, ncPlus):
+    import mpmath
+    prec = mpmath.mp.prec
+    closed_form = rld.SI_number_of_positive_signs(N, nPlus, nc, ncPlus)
+    assert closed_form == pytest.approx(rld.SI_number_of_positive_signs(N, nPlus, nc, ncPlus, method="mpmath"), rel=1e-10, abs=1e-10)
+    assert mpmath.mp.prec == prec
+
+
+def test_SI_number_of_positive_signs_vectorized():
+    N = np.array([20, 100, 1000])
+    nPlus = np.array([10, 40, 480])
+    nc = np.array([5, 21, 501])
+    ncPlus = np.array([3, 10, 251])
+    SI = rld.SI_number_of_positive_signs(N, nPlus, nc, ncPlus)
+    for i in range(N.shape[0]):
+        assert SI[i] == rld.SI_number_of_positive_signs(N[i], nPlus[i], nc[i], ncPlus[i])
+
+
+def test_run_length_accumulator():
+    rng = np.random.default_rng(11)
+    normalized_residuals = rng.normal(size=3000) + np.repeat([0.5, -0.5, 0.5], 1000)
+    N = normalized_residuals.shape[0]
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.sign(normalized_residuals), sparse=True)
+    accumulator = rld.RunLengthAccumulator()
+    for chunk in np.array_split(normalized_residuals, [1, 2, 5, 500, 501, 2999]):
+        accumulator.update(chunk)
+    accumulated = accumulator.histograms()
+    for k in histo:
+        assert np.array_equal(accumulated[k].lengths, histo[k].lengths)
+        assert np.array_equal(accumulated[k].counts, histo[k].counts)
+    assert accumulator.N == N
+    assert accumulator.nPlus == num[1]
+    assert accumulator.SI_h() == pytest.approx(rld.SI_h(N, histo['all']), rel=1e-12)
+    assert accumulator.SI_hpm() == pytest.approx(rld.SI_hpm(N, num[1], histo['plus'], histo['minus']), rel=1e-12)
+    assert accumulator.SI_chi2() == pytest.approx(rld.SI_chi2((normalized_residuals**2).sum(), N), rel=1e-12)
+
+
+def test_run_signs_with_zeros():
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.array([1., 0., -1., -1., 1.]), sparse=True)
+    assert num == [4, 2, 2]
+    assert np.array_equal(run_lengths['plus'], [1, 1])
+    assert np.array_equal(run_lengths['minus'], [1, 2])
+    # Quantized residuals with many zeros: distributions, vectorized statistics, and accumulator agree
+    rng = np.random.default_rng(12)
+    normalized_residuals = np.round(rng.normal(size=2000) * 2.) / 2.
+    N = normalized_residuals.shape[0]
+    num, run_lengths, histo, edges = rld.get_run_length_distributions(np.sign(normalized_residuals), sparse=True)
+    accumulator = rld.RunLengthAccumulator()
+    for chunk in np.array_split(normalized_residuals, [1, 2, 3, 700, 701, 1999]):
+        accumulator.update(chunk)
+    for kernel in rld.KERNELS if rld.HAVE_NUMBA else ("numpy",):
+        stats = rld.get_residual_statistics(normalized_residuals, kernel=kernel)
+        assert stats['nc'][0] == num[0]
+        assert stats['nPlus'][0] == num[1]
+        assert stats['ncPlus'][0] == num[2]
+        assert rld.SI_h_from_statistics(N, stats['nc'], stats['lfh_all'])[0] == \
+            pytest.approx(rld.SI_h(N, histo['all']), rel=1e-12)
+        assert rld.SI_hpm_from_statistics(N, stats['nc'], stats['ncPlus'], stats['nPlus'], stats['lfh_plus'],
+                                          stats['lfh_minus'])[0] == \
+            pytest.approx(rld.SI_hpm(N, num[1], histo['plus'], histo['minus']), rel=1e-12)
+    accumulated = accumulator.histograms()
+    for k in histo:
+        assert np.array_equal(accumulated[k].lengths, histo[k].lengths)
+        assert np.array_equal(accumulated[k].counts, histo[k].counts)
+    assert accumulator.nPlus == num[1]
+    assert accumulator.SI_hpm() == pytest.approx(rld.SI_hpm(N, num[1], histo['plus'], histo['minus']), rel=1e-12)
+
+
+@pytest.mark.parametrize("kernel", rld.KERNELS if rld.HAVE_NUMBA else ("numpy",))
+def test_residual_statistics_kernels(kernel):
+    rng = np.random.default_rng(3)
+    normalized_residuals = rng.normal(size=5000)
+    normalized_residuals[rng.integers(0, 5000, 50)] = 0.
+    normalized_residuals[:7] = np.array([np.nan, np.nan, 1., 0., 0., -1., np.nan])
+    offsets = np.array([0, 0, 3, 1000, 1000, 4321, 5000])
+    stats = rld.get_residual_statistics(normalized_residuals, offsets, kernel=kernel)
+    reference = rld.get_run_length_statistics(np.sign(normalized_residuals), offsets)
+    for key in reference:
+        assert np.allclose(stats[key], reference[key], rtol=1e-12, atol=1e-12)
+    for i in range(offsets.shape[0] - 1):
+        assert stats['chi_square'][i] == pytest.approx(
+            (normalized_residuals[offsets[i]:offsets[i + 1]]**2).sum(), rel=1e-12, nan_ok=True)
+
+
+@pytest.mark.parametrize("kernel", rld.KERNELS if rld.HAVE_NUMBA else ("numpy",))
+def test_residual_statistics_long_runs(kernel):
+    normalized_residuals = np.concatenate([np.ones(5000), -np.ones(5000), np.ones(5000), -np.ones(3),
+                                           np.ones(3), -np.ones(6000)])
+    offsets = np.array([0, 15003, 15006, 21006])
+    stats = rld.get_residual_statistics(normalized_residuals, offsets, kernel=kernel)
+    assert np.array_equal(stats['nc'], [4, 1, 1])
+    assert np.array_equal(stats['nPlus'], [10000, 3, 0])
+    assert stats['lfh_all'][0] == pytest.approx(np.log(6.))
+    assert stats['lfh_plus'][0] == pytest.approx(np.log(2.))
+    assert stats['lfh_minus'][0] == pytest.approx(0.)
+    assert np.allclose(stats['lfh_all'][1:], 0.)
+
+
+def test_set_kernel():
+    default = rld.get_kernel()
+    rld.set_kernel("numpy")
+    assert rld.get_kernel() == "numpy"
+    with pytest.raises(ValueError):
+        rld.set_kernel("fortran")
+    rld.set_kernel(default)
+
+
+@pytest.mark.parametrize("zeros", rld.ZERO_POLICIES)
+def test_segment_statistics(zeros):
+    rng = np.random.default_rng(4)
+    for trial in range(100):
+        normalized_residuals = np.round(rng.normal(size=rng.integers(0, 80)))
+        normalized_residuals[rng.random(normalized_residuals.shape[0]) < 0.1] = np.nan
+        stats = rld.get_segment_statistics(normalized_residuals, zeros, seed=7, kernel="numpy")
+        if rld.HAVE_NUMBA:
+            compiled = rld.get_segment_statistics(normalized_residuals, zeros, seed=7, kernel="numba")
+            for key in stats:
+                assert np.allclose(compiled[key], stats[key], rtol=1e-12, atol=1e-12)
+        for i in range(stats['N'].shape[0]):
+            segment = normalized_residuals[stats['start'][i]:stats['stop'][i]]
+            assert not np.any(np.isnan(segment))
+            if zeros == "break":
+                assert np.all(segment != 0.)
+                reference = rld.get_run_length_statistics(np.sign(segment))
+                for key in reference:
+                    assert stats[key][i] == pytest.approx(reference[key][0])
+            elif zeros == "drop":
+                assert stats['N'][i] == np.count_nonzero(segment)
+            else:
+                assert stats['N'][i] == segment.shape[0]
+
+
+def test_segment_statistics_long_runs():
+    signs = np.concatenate([np.ones(5000), -np.ones(5000), np.ones(5000), [np.nan], -np.ones(3)])
+    for kernel in rld.KERNELS if rld.HAVE_NUMBA else ("numpy",):
+        stats = rld.get_segment_statistics(signs, kernel=kernel)
+        assert np.array_equal(stats['start'], [0, 15001])
+        assert np.array_equal(stats['nc'], [3, 1])
+        assert stats['lfh_all'][0] == pytest.approx(np.log(6.))
+        assert stats['lfh_plus'][0] == pytest.approx(np.log(2.))
@@ -16,7 +16,7 @@ WARNING: chi2, (chi2,h), and (chi2,hpm) test are only meaningful for properly no
 
 INPUT
 -----
-A text file containing the N normalized residuals r_i/\sigma_i, i=1...N.
+A text file containing the N normalized residuals r_i/\sigma_i, i=1...N. Comma-separated values, numpy binary (.npy), and raw binary float64 (.bin, .raw, .f64) files are read as well.
 Normalized residuals r_i/\sigma_i are given by the difference r_i=f_i-d_i between the model f_i and the noisy data d_i, divided by the standard error of the mean \sigma_i.
 
 OUTPUT
@@ -38,19 +38,134 @@ Statistical tests
 
 """
 
-import numpy as np
-import scipy
+import glob
+import sys
 import argparse as argp
-from hplusminus import evaluate, io
+from hplusminus import cache, evaluate, io, profiling
+
+
+def parse_columns(value):
+    """
+    Parse a comma-separated list of column numbers, e.g., "2,3,5".
+    """
+    try:
+        columns = [int(c) for c in value.split(",")]
+    except ValueError:
+        raise argp.ArgumentTypeError("invalid list of columns: \"%s\"" % value)
+    if any(c < 1 for c in columns):
+        raise argp.ArgumentTypeError("columns are counted from 1: \"%s\"" % value)
+    return columns
+
+
+def parse_tests(value):
+    """
+    Parse a comma-separated list of test names, e.g., "h,chi2_h".
+    """
+    tests = value.split(",")
+    for test in tests:
+        if test not in evaluate.test_labels:
+            raise argp.ArgumentTypeError("invalid test \"%s\", use one of %s" % (test, ",".join(evaluate.test_labels)))
+    return tests
+
+
+def expand_file_names(patterns):
+    """
+    Expand glob patterns (also when quoted, i.e., not expanded by the shell) into a sorted list of file names.
+    """
+    file_names = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            file_names += sorted(glob.glob(pattern))
+        else:
+            file_names.append(pattern)
+    return file_names
+
 
 parser = argp.ArgumentParser(description=__doc__, formatter_class=argp.RawDescriptionHelpFormatter)
-parser.add_argument("file_name", type=str, help="Name of text file containing normalized residuals, reading 1st column per default.")
-parser.add_argument("--col", type=int, default=1, help="Column where to find normalized residuals.")
-parser.add_argument("-o", "--output", type=str, default=None, help="Output filename ending with \".txt\" for text file and \".csv\" for comma-separated value file.")
-args = parser.parse_args()
-
-normalized_residuals = io.read_residuals_from_file(file_name=args.file_name, column=args.col)
-results = evaluate.all_statistical_tests(normalized_residuals)
-io.print_pvalues_to_screen(results)
-if args.output:
-    io.save_to_file(results, args.output)
+parser.add_argument("file_names", type=str, nargs="+", metavar="file_name", help="Names of files or glob patterns of files containing normalized residuals, reading 1st column per default. Text, CSV, numpy binary (.npy), and raw binary float64 (.bin, .raw, .f64) files are supported.")
+parser.add_argument("--col", type=parse_columns, default=[1], help="Column where to find normalized residuals, or comma-separated list of columns, e.g., \"2,3,5\".")
+parser.add_argument("--all-columns", action="store_true", help="Evaluate all columns of each file.")
+parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes for several files.")
+parser.add_argument("--tests", type=parse_tests, default=None, help="Comma-separated list of the tests to evaluate, any of %s. Only the statistics required by these tests are calculated. Default evaluates all tests." % ",".join(evaluate.test_labels))
+parser.add_argument("--zeros", type=str, default=None, choices=["drop", "break", "random", "previous"], help="Policy for exact zeros of the normalized residuals. If given, NaN values mark gaps, and the tests are evaluated for the gap-free segments and combined.")
+parser.add_argument("--seed", type=int, default=0, help="Seed of the random signs of zeros for \"--zeros random\".")
+parser.add_argument("--cache-dir", type=str, default=None, help="Directory of a persistent cache of results, keyed by the content of the input file and the options. Cached results are reused without reading the file.")
+parser.add_argument("--cache-size", type=int, default=cache.MAX_CACHE_SIZE, help="Maximum size in bytes of the cache, least recently used results are evicted.")
+parser.add_argument("--profile", type=str, nargs="?", const="-", default=None, metavar="FILE", help="Print the number of calls and the wall time of the stages of the evaluation to standard error, and save them to FILE in JSON lines format if given. Worker processes of \"-j\" are not profiled.")
+parser.add_argument("--profile-memory", action="store_true", help="With \"--profile\", also trace the peak memory allocated during each stage, which slows down the evaluation.")
+parser.add_argument("-o", "--output", type=str, default=None, help="Output filename ending with \".txt\" for text file and \".csv\" for comma-separated value file. For several files or columns, a single csv table with one row per file and column is written, to standard output per default.")
+
+
+def main():
+    args = parser.parse_args()
+    if args.profile is None:
+        return run(args)
+    with profiling.Profile(memory=args.profile_memory) as profile:
+        status = run(args)
+    print(profile.format_table(), file=sys.stderr)
+    if args.profile != "-":
+        profile.save(args.profile)
+    return status
+
+
+def run(args):
+    file_names = expand_file_names(args.file_names)
+    if len(file_names) == 0:
+        parser.error("no files match %s" % " ".join(args.file_names))
+    result_cache = None
+    if args.cache_dir:
+        result_cache = cache.ResultCache(args.cache_dir, max_size=args.cache_size)
+
+    if len(file_names) > 1 or len(args.col) > 1 or args.all_columns:
+        # Batch mode: one row per file and column, streamed as the files are completed
+        results = evaluate.evaluate_files(file_names, None if args.all_columns else args.col, zeros=args.zeros,
+                                          seed=args.seed, n_jobs=args.jobs, cache=result_cache, tests=args.tests)
+        errors = []
+
+        def collect_errors(results):
+            for file_name, column, res, error in results:
+                if error is not None:
+                    errors.append(error)
+                    print("Error evaluating \"%s\": %s" % (file_name, error), file=sys.stderr)
+                yield file_name, column, res, error
+
+        if args.output:
+            with open(args.output, "w") as fp:
+                io.save_batch_to_csv(collect_errors(results), fp)
+        else:
+            io.save_batch_to_csv(collect_errors(results), sys.stdout)
+        return 1 if len(errors) > 0 else 0
+
+    try:
+        if args.zeros is None:
+            # The residuals are read in chunks, so that memory is bounded irrespective of the file size
+            print()
+            print("Reading normalized residuals from column %d of file \"%s\"." % (args.col[0], file_names[0]))
+            print()
+            results = evaluate.all_statistical_tests_from_file(file_names[0], args.col[0], cache=result_cache,
+                                                               tests=args.tests)
+        else:
+            # Gaps and zeros split the residuals into segments, which are evaluated from the whole series
+            results = None
+            if result_cache is not None:
+                key = cache.file_key(file_names[0], args.col[0], fmt=None, zeros=args.zeros, seed=args.seed,
+                                     tests=evaluate.plan_tests(args.tests)[0])
+                results = result_cache.get(key)
+            if results is None:
+                normalized_residuals = io.read_residuals_from_file(file_name=file_names[0], column=args.col[0])
+                results = evaluate.all_statistical_tests(normalized_residuals, zeros=args.zeros, seed=args.seed,
+                                                         tests=args.tests)
+                if result_cache is not None:
+                    result_cache.put(key, results)
+    except (OSError, ValueError, RuntimeError) as err:
+        # Same message as in batch mode, without a traceback
+        print("Error evaluating \"%s\": %s: %s" % (file_names[0], type(err).__name__, err), file=sys.stderr)
+        return 1
+    io.print_pvalues_to_screen(results)
+    if args.output:
+        io.save_to_file(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())